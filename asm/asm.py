@@ -13,9 +13,19 @@
 #  DB 0x0a   ; a hex byte
 #  DB 12   ; a decimal byte
 #  DB 0b0001 ; a binary byte
+#
+#  BANK 2       ; what follows goes into memory bank 2, at 0x80
+#  BANK 3,0xA0  ; ... or into bank 3 at 0xA0
+#  BANK 0       ; back to the program
 
 import sys
+import os
 import re
+import io
+import time
+import struct
+import hashlib
+from multiprocessing import Pool
 
 # Opcodes
 OPCODES = {
@@ -55,6 +65,29 @@ OPCODES = {
     "XOR":  {"type": 2, "code": "10101011"},
 }
 
+# Binary image (.ls8b) layout, read by CPU.load() in ls8/ls8.py:
+#
+#   header:  magic "LS8B", version, entry point, load address, flags,
+#            code length (u16), symbol count (u16)
+#   code:    `code length` raw bytes, copied to RAM at the load address
+#   symbols: per symbol an address byte, a name length byte and the name
+IMAGE_MAGIC = b"LS8B"
+IMAGE_VERSION = 1
+IMAGE_HEADER = struct.Struct("<4sBBBBHH")
+
+# With the IMAGE_BANKED flag set, the symbols are followed by a section
+# count (u16) and per section a bank, an address and a length (u16),
+# then the data
+IMAGE_BANKED = 0b00000001
+BANK_COUNT = struct.Struct("<H")
+BANK_SECTION = struct.Struct("<BBH")
+
+# Where a BANK section starts by default: the start of the window that
+# banks are switched into (ls8/mmu.py). Bank sections have to fit in the
+# window, nothing outside it can be read back from a bank
+BANK_WINDOW = 0x80
+BANK_WINDOW_END = 0xF0
+
 # Regex for matching lines
 # Capturing groups: label, opcode, operandA, operandB
 REGEX = r"(?:(\w+?):)?\s*(?:(\w+)\s*(?:(\w+)(?:\s*,\s*(\w+))?)?)?"
@@ -63,12 +96,33 @@ REGEX = r"(?:(\w+?):)?\s*(?:(\w+)\s*(?:(\w+)(?:\s*,\s*(\w+))?)?)?"
 REGEX_DS = r"(?:(\w+?):)?\s*DS\s*(.+)"  # insensitive
 REGEX_DB = r"(?:(\w+?):)?\s*DB\s*(.+)"  # insensitive
 
+# Compiled once at import instead of on every line
+LINE_PATTERN = re.compile(REGEX)
+DS_PATTERN = re.compile(REGEX_DS, re.IGNORECASE)
+DB_PATTERN = re.compile(REGEX_DB, re.IGNORECASE)
+
+# Bank section markers in pass 1 output, e.g. "# BANK 2 (address 128):"
+BANK_COMMENT = re.compile(r"# BANK (\d+) \(address (\d+)\):")
+
+# Register operand names, e.g. "R2" -> 2
+REGISTERS = {f"R{i}": i for i in range(8)}
+
+# Default location of the build cache used by build() and buildall
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         ".asmcache")
+
 
 def parse_commandline(argv):
     """
-    Usage: asm.py [inputfile] [outputfile]
+    Usage: asm.py [-b|--binary] [inputfile] [outputfile]
     """
 
+    binary = False
+    for flag in ("-b", "--binary"):
+        if flag in argv:
+            binary = True
+            argv = [a for a in argv if a != flag]
+
     if len(argv) == 1:
         inputfile = "-"
         outputfile = "-"
@@ -82,16 +136,18 @@ def parse_commandline(argv):
         outputfile = argv[2]
 
     else:
-        print("usage: asm.py [infile.asm] [outfile.ls8]", file=sys.stderr)
+        print("usage: asm.py [-b|--binary] [infile.asm] [outfile.ls8]",
+              file=sys.stderr)
         sys.exit(1)
 
-    return inputfile, outputfile
+    return inputfile, outputfile, binary
 
 
-def open_files(inputfile, outputfile):
+def open_files(inputfile, outputfile, binary=False):
     """
     Open files for reading and writing. If either of the files are named "-",
-    stdin or stdout is returned as appropriate.
+    stdin or stdout is returned as appropriate. Binary output files are
+    opened in binary mode.
     """
 
     if inputfile == "-":
@@ -100,9 +156,9 @@ def open_files(inputfile, outputfile):
         inputfile = open(inputfile)
 
     if outputfile == "-":
-        outputfile = sys.stdout
+        outputfile = sys.stdout.buffer if binary else sys.stdout
     else:
-        outputfile = open(outputfile, "w")
+        outputfile = open(outputfile, "wb" if binary else "w")
 
     return inputfile, outputfile
 
@@ -143,14 +199,18 @@ def pass1(inputfile, sym, code):
     # Current code address (for labels)
     addr = 0
 
+    # Current memory bank, and the next free address in each bank
+    bank = 0
+    bank_addr = {}
+
     def get_reg(op, fatal=True):
         """Get a register number from a string, e.g. "R2" -> 2"""
 
         nonlocal line_num
 
-        m = re.match(r"R([0-7])", op)
+        reg = REGISTERS.get(op[:2])
 
-        if m is None:
+        if reg is None:
             if fatal:
                 print(f"Line {line_num}: unknown register {op}",
                       file=sys.stderr)
@@ -158,7 +218,7 @@ def pass1(inputfile, sym, code):
             else:
                 return None
 
-        return int(m.group(1))
+        return reg
 
     def out0(opcode, op_a, op_b, machine_code):
         """Handle opcodes with zero operands"""
@@ -220,7 +280,7 @@ def pass1(inputfile, sym, code):
 
         nonlocal addr
 
-        m = re.match(REGEX_DS, line, re.IGNORECASE)
+        m = DS_PATTERN.match(line)
 
         if m is None or m.group(2) is None:
             print(f"line {line_num}: missing argument to DS", file=sys.stderr)
@@ -245,7 +305,7 @@ def pass1(inputfile, sym, code):
 
         nonlocal addr
 
-        m = re.match(REGEX_DB, line, re.IGNORECASE)
+        m = DB_PATTERN.match(line)
 
         if m is None or m.group(2) is None:
             print(f"line {line}: missing argument to DB", file=sys.stderr)
@@ -268,6 +328,56 @@ def pass1(inputfile, sym, code):
 
         addr += 1
 
+    def handle_bank(op_a, op_b):
+        """
+        Handle the BANK pseudo-opcode
+        """
+
+        nonlocal addr, bank
+
+        try:
+            new_bank = int(op_a, 0)
+            new_addr = None if op_b is None else int(op_b, 0)
+        except (TypeError, ValueError):
+            print(f"line {line_num}: BANK needs a bank number and an "
+                  "optional address", file=sys.stderr)
+            sys.exit(2)
+
+        if not 0 <= new_bank <= 255:
+            print(f"line {line_num}: invalid bank {new_bank}", file=sys.stderr)
+            sys.exit(2)
+
+        if new_bank == 0 and new_addr is not None:
+            print(f"line {line_num}: bank 0 is the program itself and "
+                  "can't be given an address", file=sys.stderr)
+            sys.exit(2)
+
+        if new_addr is not None \
+                and not BANK_WINDOW <= new_addr < BANK_WINDOW_END:
+            print(f"line {line_num}: BANK address {new_addr:#04x} is outside "
+                  f"the bank window {BANK_WINDOW:#04x}-"
+                  f"{BANK_WINDOW_END - 1:#04x}", file=sys.stderr)
+            sys.exit(2)
+
+        check_bank_end()
+        bank_addr[bank] = addr
+        bank = new_bank
+
+        if new_addr is not None:
+            addr = new_addr
+        else:
+            addr = bank_addr.get(bank, BANK_WINDOW if bank else 0)
+
+        code.append(f"# BANK {bank} (address {addr}):")
+
+    def check_bank_end():
+        """Make sure the current bank section ends inside the window"""
+
+        if bank and addr > BANK_WINDOW_END:
+            print(f"line {line_num}: bank {bank} runs past the end of the "
+                  f"bank window ({BANK_WINDOW_END - 1:#04x})", file=sys.stderr)
+            sys.exit(2)
+
     def check_ops(opcode, op_a, op_b):
         """Check operands for sanity with a particular opcode"""
 
@@ -330,7 +440,7 @@ def pass1(inputfile, sym, code):
 
         # print(line)  # debug
 
-        m = re.match(REGEX, line)
+        m = LINE_PATTERN.match(line)
 
         if m is not None:
             label, opcode, op_a, op_b = normalize_line(m.groups())
@@ -348,6 +458,8 @@ def pass1(inputfile, sym, code):
                     handle_ds(line)
                 elif opcode == 'DB':
                     handle_db(line)
+                elif opcode == 'BANK':
+                    handle_bank(op_a, op_b)
                 else:
                     # Check operand count
                     check_ops(opcode, op_a, op_b)
@@ -360,6 +472,8 @@ def pass1(inputfile, sym, code):
             print(f"No match: {input}", file=sys.stderr)
             sys.exit(3)
 
+    check_bank_end()
+
 
 def pass2(outputfile, sym, code):
     """
@@ -381,22 +495,187 @@ def pass2(outputfile, sym, code):
         outputfile.write(f"{c}\n")
 
 
-def main(argv):
-    # Parse command line
-    inputfile, outputfile = parse_commandline(argv)
+def write_image(outputfile, sym, code, entry=0, load_address=0):
+    """
+    Output the code as a binary .ls8b image, substituting in any symbols.
+    """
 
-    # Open files
-    inputfile, outputfile = open_files(inputfile, outputfile)
+    program = bytearray()
+    data = program
+    sections = []
 
-    # Set up the symbol table
-    sym = {}
+    for c in code:
+        # Bank markers start a new section; label comments only feed the
+        # symbol table
+        m = BANK_COMMENT.match(c)
+        if m is not None:
+            if m.group(1) == "0":
+                data = program
+            else:
+                data = bytearray()
+                sections.append((int(m.group(1)), int(m.group(2)), data))
+            continue
+
+        if c[0] == '#':
+            continue
+
+        if c[:4] == 'sym:':
+            s = c[4:].strip()
+
+            if s not in sym:
+                print(f"unknown symbol: {s}", file=sys.stderr)
+                sys.exit(2)
+
+            data.append(sym[s])
 
-    # Set up the machine code output
+        else:
+            data.append(int(c.split()[0], 2))
+
+    symbols = bytearray()
+
+    for name, addr in sym.items():
+        if not 0 <= addr <= 255:
+            print(f"symbol {name}: address {addr} doesn't fit in 256 bytes",
+                  file=sys.stderr)
+            sys.exit(2)
+        name = name.encode("ascii")
+        symbols += bytes([addr, len(name)]) + name
+
+    flags = IMAGE_BANKED if sections else 0
+    outputfile.write(IMAGE_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, entry,
+                                       load_address, flags, len(program),
+                                       len(sym)))
+    outputfile.write(program)
+    outputfile.write(symbols)
+
+    if sections:
+        outputfile.write(BANK_COUNT.pack(len(sections)))
+        for bank, addr, data in sections:
+            outputfile.write(BANK_SECTION.pack(bank, addr, len(data)))
+            outputfile.write(data)
+
+
+class Image:
+    """
+    An assembled program: the pass 1 output plus its symbol table.
+    """
+
+    def __init__(self, sym, code):
+        self.sym = sym
+        self.code = code
+
+    def text(self):
+        """The program as .ls8 text"""
+
+        out = io.StringIO()
+        pass2(out, self.sym, self.code)
+        return out.getvalue()
+
+    def binary(self):
+        """The program as a .ls8b binary image"""
+
+        out = io.BytesIO()
+        write_image(out, self.sym, self.code)
+        return out.getvalue()
+
+    def write(self, outputfile, binary=False):
+        outputfile.write(self.binary() if binary else self.text())
+
+
+def assemble(source):
+    """
+    Assemble LS-8 source code (a string) and return an Image.
+    """
+
+    sym = {}
     code = []
+    pass1(source.splitlines(), sym, code)
+    return Image(sym, code)
+
+
+def _assembler_hash():
+    # changes to this file invalidate everything in the build cache
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def build(inputfile, outputfile, binary=False, cache_dir=CACHE_DIR):
+    """
+    Assemble `inputfile` into `outputfile`, reusing earlier output for
+    the same source from `cache_dir` (None disables the cache). Returns
+    "built", "cached" (assembly skipped) or "unchanged" (output was
+    already up to date).
+    """
+
+    with open(inputfile, "rb") as f:
+        source = f.read()
+
+    key = hashlib.sha256(_assembler_hash() + bytes([binary]) + source)
+    cached = cache_dir and os.path.join(cache_dir, key.hexdigest())
+    status = "built"
+
+    if cached and os.path.exists(cached):
+        with open(cached, "rb") as f:
+            output = f.read()
+        status = "cached"
+    else:
+        image = assemble(source.decode())
+        output = image.binary() if binary else image.text().encode()
+        if cached:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cached + ".tmp", "wb") as f:
+                f.write(output)
+            os.replace(cached + ".tmp", cached)
+
+    if os.path.exists(outputfile):
+        with open(outputfile, "rb") as f:
+            if f.read() == output:
+                return "unchanged"
+
+    with open(outputfile, "wb") as f:
+        f.write(output)
+
+    return status
+
+
+def _build_job(job):
+    started = time.perf_counter()
+    try:
+        status = build(*job)
+    except SystemExit:
+        # pass1 reports the error on stderr and exits
+        status = "failed"
+    return job[0], status, time.perf_counter() - started
+
+
+def build_all(inputfiles, outdir, binary=False, cache_dir=CACHE_DIR,
+              workers=None):
+    """
+    Assemble every file in `inputfiles` into `outdir` in parallel. Returns
+    a list of (inputfile, status, seconds) in input order.
+    """
+
+    ext = ".ls8b" if binary else ".ls8"
+    os.makedirs(outdir, exist_ok=True)
+    jobs = []
+    for inputfile in inputfiles:
+        name = os.path.splitext(os.path.basename(inputfile))[0]
+        jobs.append((inputfile, os.path.join(outdir, name + ext), binary,
+                     cache_dir))
+
+    with Pool(workers) as pool:
+        return pool.map(_build_job, jobs)
+
+
+def main(argv):
+    # Parse command line
+    inputfile, outputfile, binary = parse_commandline(argv)
+
+    # Open files
+    inputfile, outputfile = open_files(inputfile, outputfile, binary)
 
     # Assemble
-    pass1(inputfile, sym, code)
-    pass2(outputfile, sym, code)
+    assemble(inputfile.read()).write(outputfile, binary)
 
     return 0
 
@@ -0,0 +1,36 @@
+; cores.ls8
+;
+; Run on several cores at once (python -m ls8 cores): every core adds 50
+; to a shared counter, one locked increment at a time, then prints its
+; core number.
+;
+; Expected output: each core's number; Counter ends up at 50 per core.
+
+    LDI R4,50            ; increments left
+Loop:
+    LDI R1,0xF7          ; lock port
+    LDI R2,0
+Acquire:
+    LD R0,R1             ; test-and-set: 0 means we got the lock
+    CMP R0,R2
+    LDI R3,Acquire
+    JNE R3
+
+    LDI R3,Counter       ; Counter += 1, nobody else can get in between
+    LD R0,R3
+    INC R0
+    ST R3,R0
+    ST R1,R2             ; release the lock
+
+    DEC R4
+    CMP R4,R2
+    LDI R3,Loop
+    JNE R3
+
+    LDI R0,0xF6          ; core number port
+    LD R0,R0
+    PRN R0
+    HLT
+
+Counter:
+    db 0
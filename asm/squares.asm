@@ -0,0 +1,51 @@
+; squares.ls8
+;
+; Adds up (n AND 7) squared for n = 200 down to 1, squaring by repeated
+; addition in a subroutine that only works on registers and the stack,
+; so `python -m ls8 run --memoize` can skip all but 8 of its 200 calls.
+;
+; Expected output: 172 (3500 mod 256)
+
+    LDI R3,0             ; running total
+    LDI R4,200           ; n
+Loop:
+    LDI R0,7
+    AND R0,R4            ; R0 = n AND 7
+    LDI R1,Square
+    CALL R1
+    ADD R3,R0
+    DEC R4
+    LDI R1,0
+    CMP R4,R1
+    LDI R1,Loop
+    JNE R1
+    PRN R3
+    HLT
+
+; Square: R0 = R0 * R0, by adding R0 to itself R0 times. Leaves R1-R4
+; as they were.
+Square:
+    PUSH R1
+    PUSH R2
+    PUSH R3
+    PUSH R4
+    LDI R1,0             ; product
+    LDI R2,0
+    ADD R2,R0            ; additions left
+    LDI R3,0
+SquareLoop:
+    LDI R4,SquareDone
+    CMP R2,R3
+    JEQ R4
+    ADD R1,R0
+    DEC R2
+    LDI R4,SquareLoop
+    JMP R4
+SquareDone:
+    LDI R0,0
+    ADD R0,R1
+    POP R4
+    POP R3
+    POP R2
+    POP R1
+    RET
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+# LS-8 benchmark suite
+#
+# Runs the example programs and a few generated long-running loops
+# headlessly and reports instructions per second for every engine, plus
+# program load time and assembly time. Results are written as JSON and
+# compared against a stored baseline; any metric that is worse than the
+# baseline by more than the tolerance fails the run.
+#
+# Usage: python benchmarks/bench.py [--trials N] [--output FILE]
+#                                   [--baseline FILE] [--save-baseline]
+
+import gc
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "asm"))
+
+from ls8 import CPU, read_program  # noqa: E402
+from asm import assemble  # noqa: E402
+
+PROGRAMS = os.path.join(ROOT, "ls8", "programs")
+SOURCES = os.path.join(ROOT, "asm")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+
+ENGINES = ["interpreter", "jit"]
+
+# Example programs from ls8/programs (and asm/, where there's a source)
+EXAMPLES = ["mult", "printstr", "stack", "call", "nestedcall", "sctest"]
+
+# Timer period for every run: fixed, so runs are reproducible
+TIMER_CYCLES = 1000
+
+# Each trial repeats a workload until it has run for at least this long
+MIN_TRIAL_SECONDS = 0.25
+
+# Instructions per second are only compared against the baseline for
+# workloads that run at least this many cycles. Below that, a run is
+# mostly execute()'s fixed setup cost, and its ips says more about that
+# (and about timer noise) than about the engine; it's still reported.
+MIN_GATED_CYCLES = 1000
+
+# Generated workloads: name -> assembler source
+LOOP = """
+    LDI R2,0
+    LDI R0,{outer}
+Outer:
+    LDI R1,{inner}
+    LDI R3,Inner
+Inner:
+    DEC R1
+    CMP R1,R2
+    JNE R3
+    DEC R0
+    CMP R0,R2
+    LDI R3,Outer
+    JNE R3
+    HLT
+"""
+
+CALLS = """
+    LDI R2,0
+    LDI R0,{count}
+    LDI R3,Sub
+    LDI R4,Loop
+Loop:
+    PUSH R0
+    CALL R3
+    POP R0
+    DEC R0
+    CMP R0,R2
+    JNE R4
+    HLT
+Sub:
+    LDI R1,0xE0
+    ST R1,R0
+    LD R5,R1
+    ADD R5,R0
+    RET
+"""
+
+PRINT = """
+    LDI R2,0
+    LDI R0,{count}
+    LDI R3,Loop
+Loop:
+    PRN R0
+    DEC R0
+    CMP R0,R2
+    JNE R3
+    HLT
+"""
+
+GENERATED = {
+    "loop": LOOP.format(outer=200, inner=250),
+    "calls": CALLS.format(count=250),
+    "print": PRINT.format(count=250),
+}
+
+
+def measure(run, trials, warmup):
+    """
+    Time `run()` over `trials` trials after `warmup` untimed calls. Each
+    trial calls it as often as it takes to fill MIN_TRIAL_SECONDS. `run`
+    returns the number of instructions it executed, or None. Returns the
+    seconds per call and instructions per second of the fastest trial:
+    noise (other processes, the garbage collector, frequency scaling)
+    only ever makes a trial slower, so the best one is the most
+    repeatable, the way timeit reports it.
+    """
+
+    for _ in range(warmup):
+        run()
+
+    # calibrate the number of calls per trial
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            run()
+        if time.perf_counter() - started >= MIN_TRIAL_SECONDS / 4:
+            break
+        calls *= 2
+    calls *= 4
+
+    best = None
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(trials):
+            instructions = 0
+            started = time.perf_counter()
+            for _ in range(calls):
+                instructions += run() or 0
+            elapsed = time.perf_counter() - started
+            if best is None or elapsed < best[0]:
+                best = (elapsed, instructions)
+    finally:
+        if enabled:
+            gc.enable()
+    elapsed, instructions = best
+    return elapsed / calls, instructions / elapsed
+
+
+def bench_program(name, program, path, source, trials, warmup):
+    result = {"ips": {}}
+
+    for engine in ENGINES:
+        cpu = CPU(engine=engine, timer_cycles=TIMER_CYCLES)
+
+        def run():
+            return cpu.execute(program).cycles
+
+        result["cycles"] = run()
+        _, result["ips"][engine] = measure(run, trials, warmup)
+
+    cpu = CPU(timer_cycles=TIMER_CYCLES)
+    result["load_s"], _ = measure(lambda: cpu.load(path), trials, warmup)
+
+    if source is not None:
+        def assemble_source():
+            assemble(source)
+
+        result["asm_s"], _ = measure(assemble_source, trials, warmup)
+
+        image = os.path.join(tempfile.gettempdir(), f"bench-{name}.ls8b")
+        with open(image, "wb") as f:
+            f.write(assemble(source).binary())
+        result["load_binary_s"], _ = measure(lambda: cpu.load(image),
+                                             trials, warmup)
+        os.remove(image)
+
+    return result
+
+
+def run_suite(trials, warmup, only=None):
+    results = {}
+
+    for name in EXAMPLES:
+        if only and name not in only:
+            continue
+        path = os.path.join(PROGRAMS, f"{name}.ls8")
+        source = None
+        asm_path = os.path.join(SOURCES, f"{name}.asm")
+        if os.path.exists(asm_path):
+            with open(asm_path) as f:
+                source = f.read()
+        results[name] = bench_program(name, read_program(path), path,
+                                      source, trials, warmup)
+        report(name, results[name])
+
+    for name, source in GENERATED.items():
+        if only and name not in only:
+            continue
+        image = assemble(source)
+        path = os.path.join(tempfile.gettempdir(), f"bench-{name}.ls8")
+        with open(path, "w") as f:
+            f.write(image.text())
+        results[name] = bench_program(name, read_program(path), path,
+                                      source, trials, warmup)
+        os.remove(path)
+        report(name, results[name])
+
+    return results
+
+
+def report(name, result):
+    ips = "  ".join(f"{engine} {rate:>12,.0f} ips"
+                    for engine, rate in result["ips"].items())
+    line = f"{name:<12} {result['cycles']:>8} cycles  {ips}"
+    line += f"  load {result['load_s'] * 1e6:8.1f} us"
+    if "asm_s" in result:
+        line += f"  asm {result['asm_s'] * 1e6:8.1f} us"
+    print(line)
+
+
+def compare(results, baseline, tolerance):
+    """
+    List every metric that is more than `tolerance` (a fraction) worse
+    than in `baseline`: lower instructions per second or longer times.
+    A workload that now takes a different number of cycles is listed too.
+    Instructions per second aren't compared for workloads shorter than
+    MIN_GATED_CYCLES.
+    """
+
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result["cycles"] != old["cycles"]:
+            regressions.append(f"{name}: ran {result['cycles']} cycles, "
+                               f"baseline {old['cycles']}")
+        gated = result["cycles"] >= MIN_GATED_CYCLES
+        rates = result["ips"] if gated else {}
+        for engine, rate in rates.items():
+            before = old["ips"].get(engine)
+            if before and rate < before * (1 - tolerance):
+                regressions.append(f"{name} {engine}: {rate:,.0f} ips, "
+                                   f"baseline {before:,.0f} ips")
+        for metric in ("load_s", "asm_s", "load_binary_s"):
+            before = old.get(metric)
+            if before and metric in result \
+                    and result[metric] > before * (1 + tolerance):
+                regressions.append(f"{name} {metric}: "
+                                   f"{result[metric] * 1e6:.1f} us, "
+                                   f"baseline {before * 1e6:.1f} us")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LS-8 benchmark suite")
+    parser.add_argument("--trials", type=int, default=9,
+                        help="timed trials per measurement (default: 9)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="untimed runs before timing (default: 1)")
+    parser.add_argument("--only", nargs="*", default=None,
+                        help="only run these workloads")
+    parser.add_argument("--output", default=None,
+                        help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before a metric counts as "
+                             "a regression (default: 0.25)")
+    args = parser.parse_args()
+
+    results = run_suite(args.trials, args.warmup, args.only)
+    document = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "trials": args.trials,
+        "results": results,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline",
+              file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
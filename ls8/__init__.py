@@ -0,0 +1,2 @@
+from .ls8 import (CPU, ExecutionResult, OPCODES, read_program,
+                  EXIT_HALT, EXIT_MAX_CYCLES, EXIT_FAULT, EXIT_TIMEOUT)
@@ -0,0 +1,450 @@
+import sys
+import argparse
+
+from .ls8 import CPU
+from .batch import load_manifest, run_batch
+from .profiler import Profiler
+from .trace import Tracer
+from .analyze import analyze as analyze_image
+from .mmu import MMU
+from .debugger import debug as debug_program
+from .clock import Clock
+from .memo import Memoizer
+from .multicore import run_cores, DEFAULT_MAX_CYCLES
+from . import fuzz as fuzzing
+from .checkpoint import checkpoint_every, DEFAULT_CHECKPOINT_CYCLES
+
+
+# Fuzzing time when neither --executions nor --seconds is given
+DEFAULT_FUZZ_SECONDS = 10
+
+
+def open_input(path):
+    # --input is streamed from the file or pipe, not read in up front
+    if path == "-":
+        return sys.stdin.buffer
+    if path is not None:
+        return open(path, "rb")
+    return None
+
+
+def close_input(stdin):
+    if stdin is not None and stdin is not sys.stdin.buffer:
+        stdin.close()
+
+
+def run(args):
+    cpu = CPU(engine=args.engine, timer_cycles=args.timer_cycles)
+    cpu.scheduler.detect_idle = not args.no_idle
+    clock = None
+    if args.mhz is not None or args.timing:
+        clock = Clock(cpu, hz=args.mhz * 1e6 if args.mhz else None).attach()
+    memo = None
+    if args.memoize:
+        memo = Memoizer(cpu).attach()
+    mmu = None
+    if args.banks is not None or args.bank_file is not None:
+        mmu = MMU(cpu, banks=args.banks or 16, path=args.bank_file)
+    stdin = open_input(args.input)
+    try:
+        if args.resume is not None:
+            cpu.load_checkpoint(args.resume)
+        else:
+            cpu.load(args.program)
+        if args.checkpoint is not None:
+            checkpoint_every(cpu, args.checkpoint, args.checkpoint_cycles)
+        result = cpu.execute(None, max_cycles=args.max_cycles,
+                             stdin=stdin, stdout=sys.stdout,
+                             flush=args.flush, stop_at_eof=args.stop_at_eof)
+        if args.checkpoint is not None:
+            # where the run stopped, to pick up from with resume
+            cpu.save_checkpoint(args.checkpoint)
+    finally:
+        if mmu is not None:
+            mmu.close()
+        close_input(stdin)
+
+    if args.stats:
+        print(f"halt: {result.halt_reason}, cycles: {result.cycles}",
+              file=sys.stderr)
+    if clock is not None:
+        sys.stderr.write(clock.report())
+    if memo is not None and args.stats:
+        sys.stderr.write(memo.report())
+    return result.status
+
+
+def profile(args):
+    cpu = CPU(timer_cycles=args.timer_cycles)
+    profiler = Profiler(cpu).attach()
+    stdin = open_input(args.input)
+    try:
+        result = cpu.execute(args.program, max_cycles=args.max_cycles,
+                             stdin=stdin, stdout=sys.stdout)
+    finally:
+        close_input(stdin)
+    sys.stdout.flush()
+
+    if args.report == "-":
+        sys.stderr.write(profiler.report(args.top))
+    else:
+        with open(args.report, "w") as f:
+            f.write(profiler.report(args.top))
+    if args.collapsed is not None:
+        with open(args.collapsed, "w") as f:
+            f.write(profiler.collapsed())
+    return result.status
+
+
+def trace(args):
+    cpu = CPU(timer_cycles=args.timer_cycles)
+    tracer = Tracer(cpu, capacity=args.capacity).attach()
+    stdin = open_input(args.input)
+    try:
+        result = cpu.execute(args.program, max_cycles=args.max_cycles,
+                             stdin=stdin, stdout=sys.stdout)
+    finally:
+        close_input(stdin)
+
+    if args.save is not None:
+        tracer.save(args.save)
+    if args.last:
+        sys.stderr.write(tracer.format(args.last))
+    return result.status
+
+
+def replay(args):
+    tracer = Tracer.load(args.trace)
+    cpu = CPU()
+    check = None
+    if args.verify:
+        check = Tracer(cpu, capacity=tracer.capacity).attach()
+    tracer.replay(cpu)
+
+    if check is not None and (check.ring != tracer.ring
+                              or check.count != tracer.count):
+        print("replay diverged from the recorded trace", file=sys.stderr)
+        return 1
+    return 0
+
+
+def analyze(args):
+    cpu = CPU()
+    cpu.verify = False
+    cpu.load(args.program)
+    analysis = analyze_image(cpu.ram, cpu.program_size, cpu.PC, cpu.symbols)
+
+    if args.disassemble:
+        sys.stdout.write(analysis.disassemble())
+    if args.cfg is not None:
+        with open(args.cfg, "w") as f:
+            f.write(analysis.dot())
+    sys.stderr.write(analysis.report())
+    return 0 if analysis.safe else 1
+
+
+def debug(args):
+    cpu = CPU(timer_cycles=args.timer_cycles)
+    stdin = open_input(args.input)
+    try:
+        debugger = debug_program(cpu, args.program, stdin=stdin)
+    finally:
+        close_input(stdin)
+    return 0 if debugger.reason in (None, "halt") else 1
+
+
+def cores(args):
+    results, ram, elapsed = run_cores(
+        args.program, args.cores, max_cycles=args.max_cycles,
+        engine=args.engine, timer_cycles=args.timer_cycles)
+
+    for result in results:
+        sys.stdout.write(result.output)
+    sys.stdout.flush()
+
+    if args.stats:
+        for core, result in enumerate(results):
+            print(f"core {core}: halt: {result.halt_reason}, "
+                  f"cycles: {result.cycles}", file=sys.stderr)
+        cycles = sum(result.cycles for result in results)
+        print(f"{cycles} instructions on {args.cores} cores in "
+              f"{elapsed:.3f} s = {cycles / elapsed:,.0f} per second",
+              file=sys.stderr)
+    return max(result.status for result in results)
+
+
+def fuzz(args):
+    fuzzer = fuzzing.Fuzzer(args.program, max_cycles=args.max_cycles,
+                            max_input=args.max_input,
+                            timer_cycles=args.timer_cycles, seed=args.seed)
+    for path in args.input:
+        with open(path, "rb") as f:
+            fuzzer.add_seed(f.read())
+    seconds = args.seconds
+    if seconds is None and args.executions is None:
+        seconds = DEFAULT_FUZZ_SECONDS
+    faults = fuzzer.fuzz(executions=args.executions, seconds=seconds)
+
+    sys.stderr.write(fuzzer.report())
+    if args.save is not None:
+        fuzzer.save(args.save)
+    return 1 if faults else 0
+
+
+def batch(args):
+    jobs = load_manifest(args.manifest)
+    for job in jobs:
+        if args.max_cycles is not None:
+            job.setdefault("max_cycles", args.max_cycles)
+        if args.timeout is not None:
+            job.setdefault("timeout", args.timeout)
+        if args.timer_cycles is not None:
+            job.setdefault("timer_cycles", args.timer_cycles)
+        job.setdefault("engine", args.engine)
+
+    if args.output == "-":
+        failures = run_batch(jobs, args.workers, sys.stdout, args.ordered)
+    else:
+        with open(args.output, "w") as out:
+            failures = run_batch(jobs, args.workers, out, args.ordered)
+
+    if args.stats:
+        print(f"jobs: {len(jobs)}, failed: {failures}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ls8", description="Headless LS-8 runner")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a program to completion")
+    run_parser.add_argument("program", help="path to a .ls8 program")
+    run_parser.add_argument("--max-cycles", type=int, default=None,
+                            help="stop after this many instructions")
+    run_parser.add_argument("--input", default=None,
+                            help="file fed to the program as keypresses "
+                                 "('-' for stdin)")
+    run_parser.add_argument("--stop-at-eof", action="store_true",
+                            help="end the run once all of --input has been "
+                                 "handled")
+    run_parser.add_argument("--engine", choices=["interpreter", "jit"],
+                            default="interpreter",
+                            help="execution engine (default: interpreter)")
+    run_parser.add_argument("--timer-cycles", type=int, default=None,
+                            help="fire the timer interrupt every N cycles "
+                                 "instead of once per second")
+    run_parser.add_argument("--flush", choices=["newline", "size", "halt"],
+                            default=None,
+                            help="when program output is written out "
+                                 "(default: newline on a terminal, "
+                                 "size otherwise)")
+    run_parser.add_argument("--mhz", type=float, default=None,
+                            help="throttle to this emulated clock rate "
+                                 "using the per-opcode cycle costs; the "
+                                 "timer then ticks once per emulated second")
+    run_parser.add_argument("--timing", action="store_true",
+                            help="count clock cycles without throttling and "
+                                 "report the emulated clock rate reached")
+    run_parser.add_argument("--banks", type=int, default=None,
+                            help="switch on bank-switched memory with N "
+                                 "256-byte banks (default: 16 with "
+                                 "--bank-file, or as many as the program "
+                                 "uses)")
+    run_parser.add_argument("--bank-file", default=None,
+                            help="keep banks 1 and up in this file (mapped "
+                                 "into memory, kept between runs)")
+    run_parser.add_argument("--memoize", action="store_true",
+                            help="skip repeated calls of pure subroutines "
+                                 "(interpreter loop only; not with --mhz "
+                                 "or --timing)")
+    run_parser.add_argument("--no-idle", action="store_true",
+                            help="keep executing idle spin loops instead of "
+                                 "skipping or sleeping through them")
+    run_parser.add_argument("--checkpoint", default=None,
+                            help="save the machine to this file every "
+                                 "--checkpoint-cycles cycles and when the "
+                                 "run stops")
+    run_parser.add_argument("--checkpoint-cycles", type=int,
+                            default=DEFAULT_CHECKPOINT_CYCLES,
+                            help="cycles between checkpoints (default: "
+                                 f"{DEFAULT_CHECKPOINT_CYCLES})")
+    run_parser.add_argument("--stats", action="store_true",
+                            help="print halt reason and cycle count to stderr")
+    run_parser.set_defaults(func=run, resume=None)
+
+    resume_parser = commands.add_parser(
+        "resume", help="carry on with a run from its checkpoint")
+    resume_parser.add_argument("resume", metavar="checkpoint",
+                               help="checkpoint file from 'run --checkpoint'")
+    resume_parser.add_argument("--max-cycles", type=int, default=None,
+                               help="stop once the run (counted from its "
+                                    "start, not the checkpoint) reaches "
+                                    "this many instructions")
+    resume_parser.add_argument("--input", default=None,
+                               help="rest of the input, fed to the program "
+                                    "as keypresses ('-' for stdin)")
+    resume_parser.add_argument("--stop-at-eof", action="store_true")
+    resume_parser.add_argument("--engine", choices=["interpreter", "jit"],
+                               default="interpreter")
+    resume_parser.add_argument("--flush", choices=["newline", "size", "halt"],
+                               default=None)
+    resume_parser.add_argument("--memoize", action="store_true")
+    resume_parser.add_argument("--no-idle", action="store_true")
+    resume_parser.add_argument("--checkpoint", default=None,
+                               help="keep saving checkpoints to this file "
+                                    "(usually the one resumed from)")
+    resume_parser.add_argument("--checkpoint-cycles", type=int,
+                               default=DEFAULT_CHECKPOINT_CYCLES)
+    resume_parser.add_argument("--stats", action="store_true")
+    # the timer and any banks come from the checkpoint
+    resume_parser.set_defaults(func=run, program=None, timer_cycles=None,
+                               mhz=None, timing=False, banks=None,
+                               bank_file=None)
+
+    profile_parser = commands.add_parser(
+        "profile", help="run a program and report where its cycles go")
+    profile_parser.add_argument("program", help="path to a .ls8 program")
+    profile_parser.add_argument("--max-cycles", type=int, default=None)
+    profile_parser.add_argument("--input", default=None,
+                                help="file fed to the program as keypresses "
+                                     "('-' for stdin)")
+    profile_parser.add_argument("--timer-cycles", type=int, default=None)
+    profile_parser.add_argument("--top", type=int, default=10,
+                                help="number of hot spots to list")
+    profile_parser.add_argument("--report", default="-",
+                                help="text report file (default: stderr)")
+    profile_parser.add_argument("--collapsed", default=None,
+                                help="write collapsed stacks for flame graphs")
+    profile_parser.set_defaults(func=profile)
+
+    trace_parser = commands.add_parser(
+        "trace", help="run a program and record an execution trace")
+    trace_parser.add_argument("program", help="path to a .ls8 program")
+    trace_parser.add_argument("--max-cycles", type=int, default=None)
+    trace_parser.add_argument("--input", default=None,
+                              help="file fed to the program as keypresses "
+                                   "('-' for stdin)")
+    trace_parser.add_argument("--timer-cycles", type=int, default=None)
+    trace_parser.add_argument("--capacity", type=int, default=1 << 16,
+                              help="instructions kept in the ring buffer "
+                                   "(a power of two)")
+    trace_parser.add_argument("--save", default=None,
+                              help="write the trace to this file")
+    trace_parser.add_argument("--last", type=int, default=0,
+                              help="print the last N instructions to stderr")
+    trace_parser.set_defaults(func=trace)
+
+    replay_parser = commands.add_parser(
+        "replay", help="replay a saved trace exactly")
+    replay_parser.add_argument("trace", help="trace file from 'trace --save'")
+    replay_parser.add_argument("--verify", action="store_true",
+                               help="check the replay against the recorded "
+                                    "instructions")
+    replay_parser.set_defaults(func=replay)
+
+    debug_parser = commands.add_parser(
+        "debug", help="step through a program with breakpoints and "
+                      "watchpoints")
+    debug_parser.add_argument("program", help="path to a .ls8 program")
+    debug_parser.add_argument("--input", default=None,
+                              help="file fed to the program as keypresses")
+    debug_parser.add_argument("--timer-cycles", type=int, default=None)
+    debug_parser.set_defaults(func=debug)
+
+    analyze_parser = commands.add_parser(
+        "analyze", help="statically check a program for stack overflow and "
+                        "self-modifying code")
+    analyze_parser.add_argument("program", help="path to a .ls8 program")
+    analyze_parser.add_argument("--disassemble", action="store_true",
+                                help="print a disassembly to stdout")
+    analyze_parser.add_argument("--cfg", default=None,
+                                help="write the control-flow graph to this "
+                                     "Graphviz file")
+    analyze_parser.set_defaults(func=analyze)
+
+    cores_parser = commands.add_parser(
+        "cores", help="run a program on several cores sharing one RAM")
+    cores_parser.add_argument("program", help="path to a .ls8 program")
+    cores_parser.add_argument("--cores", type=int, default=2,
+                              help="number of cores, one process each "
+                                   "(default: 2)")
+    cores_parser.add_argument("--max-cycles", type=int,
+                              default=DEFAULT_MAX_CYCLES,
+                              help="stop each core after this many "
+                                   "instructions")
+    cores_parser.add_argument("--timer-cycles", type=int, default=None)
+    cores_parser.add_argument("--engine", choices=["interpreter", "jit"],
+                              default="interpreter")
+    cores_parser.add_argument("--stats", action="store_true",
+                              help="print each core's halt reason and the "
+                                   "aggregate instruction rate to stderr")
+    cores_parser.set_defaults(func=cores)
+
+    fuzz_parser = commands.add_parser(
+        "fuzz", help="look for inputs and registers that make a program "
+                     "fault")
+    fuzz_parser.add_argument("program", help="path to a .ls8 program")
+    fuzz_parser.add_argument("--executions", type=int, default=None,
+                             help="stop after this many runs")
+    fuzz_parser.add_argument("--seconds", type=float, default=None,
+                             help="stop after this long (default: "
+                                  f"{DEFAULT_FUZZ_SECONDS} s unless "
+                                  "--executions is given)")
+    fuzz_parser.add_argument("--max-cycles", type=int,
+                             default=fuzzing.DEFAULT_MAX_CYCLES,
+                             help="instructions per run (default: "
+                                  f"{fuzzing.DEFAULT_MAX_CYCLES})")
+    fuzz_parser.add_argument("--max-input", type=int,
+                             default=fuzzing.DEFAULT_MAX_INPUT,
+                             help="input bytes per run (default: "
+                                  f"{fuzzing.DEFAULT_MAX_INPUT})")
+    fuzz_parser.add_argument("--input", action="append", default=[],
+                             help="seed input file (may be repeated)")
+    fuzz_parser.add_argument("--timer-cycles", type=int, default=None,
+                             help="fire the timer interrupt every N cycles "
+                                  "(default: never)")
+    fuzz_parser.add_argument("--seed", type=int, default=None,
+                             help="random seed, for repeatable runs")
+    fuzz_parser.add_argument("--save", default=None,
+                             help="write each fault's input to this "
+                                  "directory")
+    fuzz_parser.set_defaults(func=fuzz)
+
+    batch_parser = commands.add_parser(
+        "batch", help="run a JSONL manifest of jobs over a process pool")
+    batch_parser.add_argument("manifest", help="path to a .jsonl manifest")
+    batch_parser.add_argument("--workers", type=int, default=None,
+                              help="worker processes (default: CPU count)")
+    batch_parser.add_argument("--output", default="-",
+                              help="JSONL results file (default: stdout)")
+    batch_parser.add_argument("--ordered", action="store_true",
+                              help="emit results in manifest order")
+    batch_parser.add_argument("--max-cycles", type=int, default=None,
+                              help="default cycle budget per job")
+    batch_parser.add_argument("--timeout", type=float, default=None,
+                              help="default wall-clock limit per job")
+    batch_parser.add_argument("--timer-cycles", type=int, default=None,
+                              help="default virtual timer period per job")
+    batch_parser.add_argument("--engine", choices=["interpreter", "jit"],
+                              default="interpreter")
+    batch_parser.add_argument("--stats", action="store_true",
+                              help="print job and failure counts to stderr")
+    batch_parser.set_defaults(func=batch)
+
+    args = parser.parse_args(argv)
+    if args.func is run:
+        # these run the program in their own copy of the interpreter loop
+        loops = [flag for flag, used in (("--mhz", args.mhz is not None),
+                                         ("--timing", args.timing),
+                                         ("--memoize", args.memoize))
+                 if used]
+        if loops and args.engine == "jit":
+            parser.error(f"{loops[0]} can't be used with --engine jit")
+        if args.memoize and len(loops) > 1:
+            parser.error("--memoize can't be used with --mhz or --timing")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import asyncio
+import os
+
+try:
+    from .ls8 import CPU
+    from .scheduler import INF
+except ImportError:
+    from ls8 import CPU
+    from scheduler import INF
+
+
+# Instructions a machine runs before yielding to the event loop
+DEFAULT_SLICE_CYCLES = 10_000
+
+
+class QueueTarget:
+    """Output target that hands every flushed chunk to an asyncio queue"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def write(self, data):
+        self.queue.put_nowait(bytes(data))
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class Machine:
+    """
+    One emulated LS-8 hosted on an asyncio event loop.
+
+    Every machine has its own devices, each fed through an asyncio queue:
+
+    * `keyboard`: key values (ints) to deliver as keypresses
+    * `timer`: timer ticks, put there once per `timer_seconds` by a clock
+      task (unless the timer runs in virtual time, `timer_cycles=K`)
+    * `output`: chunks of PRN/PRA output as bytes, then None at the end
+
+    `run()` executes the CPU in slices of `slice_cycles` instructions and
+    yields to the event loop between slices. Device queues are only read
+    between slices, on the loop's thread, so nothing else ever touches
+    the CPU while it runs and many machines can share one loop without
+    threads. A machine that goes idle in real time waits for its next
+    device event without holding up the loop.
+    """
+
+    def __init__(self, program, engine="interpreter", timer_cycles=None,
+                 timer_seconds=1.0, slice_cycles=DEFAULT_SLICE_CYCLES):
+        self.cpu = CPU(engine=engine, timer_cycles=timer_cycles)
+        self.timer_cycles = timer_cycles
+        self.timer_seconds = timer_seconds
+        self.slice_cycles = slice_cycles
+
+        self.keyboard = asyncio.Queue()
+        self.timer = asyncio.Queue()
+        self.output = asyncio.Queue()
+        self.wakeup = asyncio.Event()  # set whenever a device event arrives
+
+        # the clock task replaces the scheduler's wall-clock timer, and
+        # idle machines come back here to wait rather than sleeping
+        self.cpu.scheduler.timer_seconds = None
+        self.cpu.scheduler.idle_mode = "stop"
+        if isinstance(program, (str, os.PathLike)):
+            self.cpu.load(program)
+        else:
+            self.cpu.load_program(program)
+        self.cpu.output.open(QueueTarget(self.output))
+
+    def press(self, key):
+        self.keyboard.put_nowait(key & 0xFF)
+        self.wakeup.set()
+
+    def send(self, data):
+        # queue every byte of `data` (bytes or str) as a keypress
+        if isinstance(data, str):
+            data = data.encode()
+        for key in data:
+            self.keyboard.put_nowait(key)
+        self.wakeup.set()
+
+    def stop(self):
+        # takes effect at the end of the current slice
+        self.cpu.running = False
+        self.cpu.halt_reason = "stopped"
+        self.wakeup.set()
+
+    async def stream(self):
+        # yields output chunks until the machine stops
+        while True:
+            chunk = await self.output.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def clock(self):
+        while True:
+            await asyncio.sleep(self.timer_seconds)
+            self.timer.put_nowait(None)
+            self.wakeup.set()
+
+    def deliver(self):
+        # move queued device events into the CPU
+        cpu = self.cpu
+        keyboard = self.keyboard
+        while not keyboard.empty():
+            # delivered one at a time by the scheduler's input polling
+            cpu.input_queue.append(keyboard.get_nowait())
+        timer = self.timer
+        if not timer.empty():
+            while not timer.empty():
+                timer.get_nowait()
+            cpu.raise_interrupt(0)
+
+    async def run(self, max_cycles=None, timeout=None):
+        """
+        Run until HLT, a fault, stop(), `max_cycles` instructions or
+        `timeout` seconds. Returns an ExecutionResult without output; the
+        output has been streamed to the `output` queue.
+        """
+
+        cpu = self.cpu
+        loop = asyncio.get_running_loop()
+        deadline = INF if timeout is None else loop.time() + timeout
+        if max_cycles is None:
+            max_cycles = INF
+
+        clock = None
+        if self.timer_cycles is None and self.timer_seconds:
+            clock = asyncio.create_task(self.clock())
+
+        cpu.running = True
+        try:
+            while cpu.running:
+                self.deliver()
+                budget = min(cpu.cycles + self.slice_cycles, max_cycles)
+                self.wakeup.clear()
+                cpu.run_program(budget)
+                if cpu.halt_reason == "idle":
+                    # nothing to do until the next keypress or tick
+                    wait = None
+                    if deadline != INF:
+                        wait = max(deadline - loop.time(), 0)
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                elif (cpu.halt_reason != "max_cycles"
+                        or cpu.cycles >= max_cycles):
+                    break
+                if loop.time() >= deadline:
+                    cpu.halt_reason = "timeout"
+                    break
+                if cpu.halt_reason == "stopped":
+                    break
+                # the slice ran out: let the other machines have a turn
+                cpu.running = True
+                cpu.halt_reason = None
+                await asyncio.sleep(0)
+        finally:
+            if clock is not None:
+                clock.cancel()
+            cpu.running = False
+            self.output.put_nowait(None)
+
+        return cpu.result()
+
+    def attach_keyboard(self):
+        # feed this machine from the real keyboard: pynput calls back on
+        # its own thread, so keys are handed to the loop thread-safely
+        from pynput import keyboard
+
+        loop = asyncio.get_running_loop()
+
+        def on_press(key):
+            if key == keyboard.Key.esc:
+                loop.call_soon_threadsafe(self.stop)
+            elif str(key)[:4] != "Key." and str(key)[0] != "<":
+                loop.call_soon_threadsafe(self.press, ord(str(key)[1]))
+
+        listener = keyboard.Listener(on_press=on_press)
+        listener.start()
+        return listener
+
+
+async def run_machines(machines, max_cycles=None, timeout=None):
+    """Run every machine concurrently and return their results in order"""
+
+    return await asyncio.gather(*(machine.run(max_cycles, timeout)
+                                  for machine in machines))
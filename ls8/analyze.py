@@ -0,0 +1,588 @@
+from collections import namedtuple
+from functools import lru_cache
+
+try:
+    from .ls8 import OPCODES
+except ImportError:
+    from ls8 import OPCODES
+
+
+# opcode byte -> mnemonic
+MNEMONICS = {opcode: name for name, opcode in OPCODES.items()}
+
+# Instruction encoding (`AABCDDDD`): AA is the operand count, B marks ALU
+# instructions, C marks instructions that set the PC themselves
+def operand_count(opcode):
+    return opcode >> 6
+
+
+def is_alu(opcode):
+    return bool(opcode & 0b00100000)
+
+
+def sets_pc(opcode):
+    return bool(opcode & 0b00010000)
+
+
+# Where the stack starts, and the bytes pushed when an interrupt is taken
+# (PC, FL, R0-R6)
+STACK_TOP = 0xF4
+INTERRUPT_FRAME = 9
+
+# Constant folding for the ALU; None means "not known statically"
+ALU = {
+    "ADD": lambda x, y: (x + y) & 0xFF,
+    "SUB": lambda x, y: (x - y) & 0xFF,
+    "MUL": lambda x, y: (x * y) & 0xFF,
+    "DIV": lambda x, y: x // y,
+    "MOD": lambda x, y: x % y,
+    "AND": lambda x, y: x & y,
+    "OR":  lambda x, y: x | y,
+    "XOR": lambda x, y: x ^ y,
+    "SHL": lambda x, y: (x << y) & 0xFF,
+    "SHR": lambda x, y: x >> y,
+}
+
+UNARY = {
+    "INC": lambda x: (x + 1) & 0xFF,
+    "DEC": lambda x: (x - 1) & 0xFF,
+    "NOT": lambda x: x ^ 0xFF,
+}
+
+# Conditional jumps and the FL bits they test
+CONDITIONS = {
+    "JEQ": lambda fl: fl & 0b001,
+    "JNE": lambda fl: not fl & 0b001,
+    "JGT": lambda fl: fl & 0b010,
+    "JLT": lambda fl: fl & 0b100,
+    "JLE": lambda fl: fl & 0b101,
+    "JGE": lambda fl: fl & 0b011,
+}
+
+# How many distinct stack shapes a single address may be reached with
+# before the analysis gives up on it
+MAX_CONTEXTS = 64
+
+
+def decode(image, pc):
+    # (opcode, operand a, operand b) the way the CPU decodes them
+    opcode = image[pc]
+    a = image[(pc + 1) & 0xFF] & 0b111
+    b = image[(pc + 2) & 0xFF]
+    if opcode != OPCODES["LDI"]:
+        b &= 0b111
+    return opcode, a, b
+
+
+def format_instruction(image, pc, symbols=None):
+    # "MNEMONIC operands" for the instruction at `pc`, with LDI immediates
+    # shown as labels where there is one
+    opcode, a, b = decode(image, pc)
+    name = MNEMONICS.get(opcode)
+    if name is None:
+        return f"DB {opcode:#04x}"
+    count = operand_count(opcode)
+    operands = []
+    if count >= 1:
+        operands.append(f"R{a}")
+    if count == 2:
+        if name == "LDI":
+            target = symbols.get(b) if symbols else None
+            operands.append(target if target else f"{b:#04x}")
+        else:
+            operands.append(f"R{b}")
+    return f"{name} {','.join(operands)}".rstrip()
+
+
+def join(x, y):
+    return x if x == y else None
+
+
+class Analysis:
+    """
+    Static analysis of an LS-8 image.
+
+    Runs an abstract interpreter over every path from the entry point
+    (and from interrupt handlers, once the program can enable them),
+    tracking register constants so that the register-indirect jumps and
+    calls the assembler generates can be followed, and a symbolic stack so
+    that CALL/RET pairs and worst-case stack depth are exact.
+
+    `code` holds the address of every reachable instruction, `data` every
+    other byte of the image, `cfg` maps each instruction to its successors
+    and `issues` lists (address, message) for anything that could make
+    the program misbehave. An image with no issues never writes into its
+    own code and never runs its stack into the program: it is `safe`,
+    and the CPU can run it without self-modification checks.
+    """
+
+    def __init__(self, image, size=None, entry=0, symbols=None):
+        self.image = bytes(image).ljust(256, b"\0")
+        self.size = len(image) if size is None else size
+        self.entry = entry
+        self.symbols = symbols or {}
+
+        self.code = set()  # instruction start addresses
+        self.covered = set()  # every byte of a reachable instruction
+        self.cfg = {}
+        self.issues = []
+        self.handlers = {}  # interrupt number -> handler address
+        self.interrupts = False  # IM may be non-zero
+        self.max_depth = 0  # stack bytes used by the main program
+        self.handler_depth = 0  # ... and by the deepest handler
+        self.stores = set()  # addresses ST may write to (None: unknown)
+
+        self.run(entry, [0] * 7 + [None], 0, handler=False)
+        explored = set()
+        while set(self.handlers.values()) - explored:
+            for address in sorted(set(self.handlers.values()) - explored):
+                explored.add(address)
+                self.run(address, [None] * 8, None, handler=True)
+
+        self.data = set(range(self.size)) - self.covered
+        self.check_memory()
+
+    @property
+    def worst_depth(self):
+        # deepest the stack can get, counting one interrupt frame
+        if self.interrupts:
+            return self.max_depth + INTERRUPT_FRAME + self.handler_depth
+        return self.max_depth
+
+    @property
+    def safe(self):
+        return not self.issues
+
+    def issue(self, pc, message):
+        if (pc, message) not in self.issues:
+            self.issues.append((pc, message))
+
+    def run(self, start, regs, fl, handler):
+        # worklist of (pc, registers, FL, stack); the stack is a tuple of
+        # ("ret", address) and ("val", value) entries
+        seen = {}
+        contexts = {}
+        work = [(start, tuple(regs), fl, ())]
+
+        while work:
+            pc, regs, fl, stack = work.pop()
+
+            # one merged state per (address, shape of the stack)
+            shape = tuple(e[1] if e[0] == "ret" else None for e in stack)
+            key = (pc, shape)
+            old = seen.get(key)
+            if old is not None:
+                old_regs, old_fl, old_stack = old
+                regs = tuple(map(join, regs, old_regs))
+                fl = join(fl, old_fl)
+                stack = tuple((kind, join(value, old_value))
+                              for (kind, value), (_, old_value)
+                              in zip(stack, old_stack))
+                if (regs, fl, stack) == old:
+                    continue
+            else:
+                # reaching the same code with more on top of a stack it
+                # was already reached with means a loop that keeps growing
+                # the stack (or recursion, if what grew is return addresses)
+                shapes = contexts.setdefault(pc, [])
+                grown = [shape[len(s):] for s in shapes
+                         if len(s) < len(shape) and shape[:len(s)] == s]
+                if grown:
+                    if any(value is not None for value in grown[0]):
+                        self.issue(pc, "unbounded recursion")
+                    else:
+                        self.issue(pc, "stack grows without bound")
+                    continue
+                if len(shapes) == MAX_CONTEXTS:
+                    self.issue(pc, "too many call paths to analyze")
+                    continue
+                shapes.append(shape)
+            seen[key] = (regs, fl, stack)
+
+            if handler:
+                self.handler_depth = max(self.handler_depth, len(stack))
+            else:
+                self.max_depth = max(self.max_depth, len(stack))
+            if len(stack) > STACK_TOP - self.size:
+                self.issue(pc, "stack overflows into the program")
+                continue
+
+            for successor in self.step(pc, list(regs), fl, stack, handler):
+                work.append(successor)
+
+    def step(self, pc, regs, fl, stack, handler):
+        # abstractly execute the instruction at `pc`; returns successor
+        # states and records the CFG edges
+        if pc >= self.size:
+            self.issue(pc, "execution runs past the end of the image")
+            return []
+
+        opcode, a, b = decode(self.image, pc)
+        name = MNEMONICS.get(opcode)
+        size = operand_count(opcode) + 1
+        if name is None:
+            self.issue(pc, f"invalid opcode {opcode:#010b}")
+            return []
+
+        self.code.add(pc)
+        self.covered.update(range(pc, min(pc + size, 256)))
+        next_pc = (pc + size) & 0xFF
+        targets = []
+        successors = []
+
+        def go(target, regs=regs, fl=fl, stack=stack):
+            if target is None:
+                self.issue(pc, f"{name} to an unknown address")
+                return
+            targets.append(target)
+            successors.append((target, tuple(regs), fl, stack))
+
+        def write(register, value):
+            if register == 7:
+                self.issue(pc, "SP is changed directly")
+            elif register == 5 and value != 0:
+                self.interrupts = True
+            regs[register] = value
+
+        if name == "HLT":
+            pass
+        elif name == "NOP" or name == "INT":
+            go(next_pc)
+        elif name == "LDI":
+            write(a, b)
+            go(next_pc)
+        elif name == "LD":
+            write(a, None)
+            go(next_pc)
+        elif name == "ST":
+            address = regs[a]
+            self.stores.add(address)
+            if address is not None and 0xF8 <= address:
+                # interrupt vector
+                if regs[b] is None:
+                    self.issue(pc, "interrupt vector set to an unknown "
+                                   "address")
+                else:
+                    self.handlers[address - 0xF8] = regs[b]
+            go(next_pc)
+        elif name == "PUSH":
+            go(next_pc, stack=stack + (("val", regs[a]),))
+        elif name == "POP":
+            if not stack:
+                self.issue(pc, "POP from an empty stack")
+                return []
+            write(a, stack[-1][1])
+            go(next_pc, stack=stack[:-1])
+        elif name in ("PRN", "PRA"):
+            go(next_pc)
+        elif name in ALU:
+            x, y = regs[a], regs[b]
+            if name in ("DIV", "MOD") and y == 0:
+                self.issue(pc, "division by zero")
+                return []
+            write(a, ALU[name](x, y)
+                  if x is not None and y is not None else None)
+            go(next_pc)
+        elif name in UNARY:
+            x = regs[a]
+            write(a, UNARY[name](x) if x is not None else None)
+            go(next_pc)
+        elif name == "CMP":
+            x, y = regs[a], regs[b]
+            fl = None
+            if x is not None and y is not None:
+                fl = 0b100 if x < y else 0b010 if x > y else 0b001
+            go(next_pc, fl=fl)
+        elif name == "CALL":
+            go(regs[a], stack=stack + (("ret", next_pc),))
+        elif name == "RET":
+            if not stack:
+                self.issue(pc, "RET with nothing to return to")
+                return []
+            go(stack[-1][1], stack=stack[:-1])
+        elif name == "IRET":
+            if not handler:
+                self.issue(pc, "IRET outside an interrupt handler")
+            elif stack:
+                self.issue(pc, "IRET with values left on the stack")
+        elif name == "JMP":
+            go(regs[a])
+        elif name in CONDITIONS:
+            if fl is None or CONDITIONS[name](fl):
+                go(regs[a])
+            if fl is None or not CONDITIONS[name](fl):
+                go(next_pc)
+
+        self.cfg.setdefault(pc, set()).update(targets)
+        return successors
+
+    def check_memory(self):
+        # the program must not write over its own instructions, with ST
+        # or with the stack
+        for address in self.stores:
+            if address is None:
+                self.issue(None, "ST to an unknown address")
+            elif address in self.covered:
+                self.issue(None, f"self-modifying code: ST to {address:#04x}")
+        bottom = STACK_TOP - self.worst_depth
+        if self.worst_depth and bottom < self.size:
+            self.issue(None, f"stack reaches down to {bottom:#04x}, inside "
+                             "the program")
+        if STACK_TOP in self.covered:
+            self.issue(None, "keypresses are stored inside the program")
+        if self.interrupts and not self.handlers:
+            self.issue(None, "interrupts enabled without a handler")
+
+    def label(self, address):
+        return self.symbols.get(address)
+
+    def disassemble(self):
+        # one line per instruction or data byte, labels on their own line
+        lines = []
+        pc = 0
+        while pc < self.size:
+            label = self.label(pc)
+            if label is not None:
+                lines.append(f"{label}:")
+            if pc in self.code:
+                text = format_instruction(self.image, pc, self.symbols)
+                lines.append(f"    {pc:#04x}  {text}")
+                pc += operand_count(self.image[pc]) + 1
+            else:
+                value = self.image[pc]
+                char = f"  ; {chr(value)!r}" if 32 <= value < 127 else ""
+                lines.append(f"    {pc:#04x}  DB {value:#04x}{char}")
+                pc += 1
+        return "\n".join(lines) + "\n"
+
+    def dot(self):
+        # the control-flow graph in Graphviz format
+        lines = ["digraph cfg {"]
+        for pc in sorted(self.cfg):
+            name = MNEMONICS[self.image[pc]]
+            lines.append(f'    n{pc} [label="{pc:#04x} {name}"];')
+            for target in sorted(self.cfg[pc]):
+                lines.append(f"    n{pc} -> n{target};")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        lines = [f"code: {len(self.covered)} bytes in {len(self.code)} "
+                 f"instructions, data: {len(self.data)} bytes",
+                 f"stack: {self.max_depth} bytes"]
+        if self.interrupts:
+            lines[-1] += (f", {self.worst_depth} with an interrupt "
+                          f"(handlers: {self.handler_depth} bytes)")
+        for pc, message in self.issues:
+            where = f"{pc:#04x}" if pc is not None else "image"
+            lines.append(f"{where}: {message}")
+        lines.append("safe" if self.safe else "not proven safe")
+        return "\n".join(lines) + "\n"
+
+
+def analyze(image, size=None, entry=0, symbols=None):
+    return Analysis(image, size, entry, symbols)
+
+
+@lru_cache(maxsize=256)
+def prove(image, size, entry):
+    # whether `image` (bytes) is safe; cached, since the same programs are
+    # loaded over and over in batch runs and benchmarks
+    return Analysis(image, size, entry).safe
+
+
+# Instructions a pure subroutine may use: no memory access beyond its own
+# stack frame, no I/O and nothing that can stop the CPU
+PURE = set(ALU) | set(UNARY) | set(CONDITIONS) | {
+    "NOP", "LDI", "CMP", "PUSH", "POP", "CALL", "RET", "JMP"}
+
+# Stack slot the subroutine leaves as it was
+OLD = "old"
+
+
+Subroutine = namedtuple("Subroutine", [
+    "frame",      # stack bytes a call uses, counting the return address
+    "inputs",     # registers the result depends on
+    "uses_fl",    # ... and whether it depends on FL
+    "copies",     # (register, input register) for R0-R4 left as a copy
+    "keeps_fl",   # FL comes back unchanged
+    "slots",      # per frame byte below the return address: "value",
+                  # ("copy", input register) or None (left alone)
+])
+
+
+def depends(value):
+    # inputs a symbolic value may depend on
+    if isinstance(value, frozenset):
+        return value
+    if isinstance(value, tuple):
+        return frozenset((value[1],))
+    return frozenset()
+
+
+def merge(x, y):
+    # a value that differs between paths is unknown, but still depends on
+    # whatever either one did
+    return x if x == y else depends(x) | depends(y)
+
+
+def merge_slots(x, y):
+    if len(x) < len(y):
+        x += (OLD,) * (len(y) - len(x))
+    elif len(y) < len(x):
+        y += (OLD,) * (len(x) - len(y))
+    return tuple(map(merge, x, y))
+
+
+@lru_cache(maxsize=1024)
+def pure_subroutine(image, size, target):
+    """
+    Summary of the subroutine at `target` if it is pure, else None.
+
+    A pure subroutine's effect depends only on the registers and FL it is
+    called with, and consists only of new values for R0-R4 and FL and the
+    bytes it leaves in its own stack frame: it doesn't load or store
+    memory, print, halt, write SP, IM or IS, or call anything that isn't
+    pure, its jumps and calls have known targets, and it pops everything
+    it pushes before it returns.
+
+    Values are tracked symbolically: a register holds a constant, an
+    input ("in", register) passed along unchanged, or a frozenset of the
+    inputs it was computed from. So registers that are only saved and
+    restored don't count as inputs, and the summary says which registers
+    (and whether FL) the result really depends on, including through the
+    branches taken, and which outputs are just copies of inputs.
+    """
+
+    used = set()
+    seen = {}
+    contexts = {}
+    depth = 0
+    exit = None
+    # SP moves as soon as the CALL pushes, so it is never passed along
+    # unchanged
+    regs = tuple(("in", r) for r in range(7)) + (frozenset((7,)),)
+    work = [(target, regs, ("in", "FL"), (), ())]
+
+    def compute(function, *values):
+        if all(isinstance(value, int) for value in values):
+            return function(*values)
+        return frozenset().union(*map(depends, values))
+
+    while work:
+        pc, regs, fl, stack, slots = work.pop()
+
+        shape = tuple(e[1] if e[0] == "ret" else None for e in stack)
+        key = (pc, shape)
+        old = seen.get(key)
+        if old is not None:
+            old_regs, old_fl, old_slots = old
+            regs = tuple(map(merge, regs, old_regs))
+            fl = merge(fl, old_fl)
+            slots = merge_slots(slots, old_slots)
+            if (regs, fl, slots) == old:
+                continue
+        else:
+            shapes = contexts.setdefault(pc, [])
+            if len(shapes) == MAX_CONTEXTS or any(
+                    len(s) < len(shape) and shape[:len(s)] == s
+                    for s in shapes):
+                # recursion, a stack that keeps growing, or too hard
+                return None
+            shapes.append(shape)
+        seen[key] = (regs, fl, slots)
+        depth = max(depth, len(stack))
+
+        if pc >= size:
+            return None
+        opcode, a, b = decode(image, pc)
+        name = MNEMONICS.get(opcode)
+        if name not in PURE:
+            return None
+        if (name in ALU or name in UNARY or name in ("LDI", "POP")) \
+                and a >= 5:
+            # SP, IM and IS are off limits
+            return None
+        regs = list(regs)
+        next_pc = (pc + operand_count(opcode) + 1) & 0xFF
+        # slot 1 is the byte just below the return address
+        top = len(stack) + 1
+        padded = slots + (OLD,) * (top + 1 - len(slots))
+
+        if name == "LDI":
+            regs[a] = b
+        elif name in ALU:
+            if name in ("DIV", "MOD") and not (isinstance(regs[b], int)
+                                               and regs[b]):
+                # may divide by zero and halt
+                return None
+            regs[a] = compute(ALU[name], regs[a], regs[b])
+        elif name in UNARY:
+            regs[a] = compute(UNARY[name], regs[a])
+        elif name == "CMP":
+            fl = compute(lambda x, y: 0b100 if x < y else
+                         0b010 if x > y else 0b001, regs[a], regs[b])
+        elif name == "PUSH":
+            slots = padded[:top] + (regs[a],) + padded[top + 1:]
+            stack += (("val", None),)
+        elif name == "POP":
+            if not stack or stack[-1][0] != "val":
+                return None
+            regs[a] = slots[len(stack)]
+            stack = stack[:-1]
+        elif name == "RET":
+            if not stack:
+                # back to the caller
+                state = (tuple(regs[:5]), fl, slots)
+                exit = state if exit is None else (
+                    tuple(map(merge, exit[0], state[0])),
+                    merge(exit[1], fl), merge_slots(exit[2], slots))
+                continue
+            if stack[-1][0] != "ret":
+                return None
+            work.append((stack[-1][1], tuple(regs), fl, stack[:-1], slots))
+            continue
+
+        if name in ("JMP", "CALL") or name in CONDITIONS:
+            address = regs[a]
+            if not isinstance(address, int):
+                return None
+            taken = True
+            if name in CONDITIONS:
+                if isinstance(fl, int):
+                    taken = bool(CONDITIONS[name](fl))
+                else:
+                    # which way it goes depends on these
+                    used.update(depends(fl))
+                    taken = None
+            if name == "CALL":
+                work.append((address, tuple(regs), fl,
+                             stack + (("ret", next_pc),),
+                             padded[:top] + (next_pc,) + padded[top + 1:]))
+                continue
+            if taken is not False:
+                work.append((address, tuple(regs), fl, stack, slots))
+            if taken:
+                continue
+
+        work.append((next_pc, tuple(regs), fl, stack, slots))
+
+    if exit is None:
+        # never returns
+        return None
+    exit_regs, exit_fl, exit_slots = exit
+    frame = depth + 1
+    exit_slots = (exit_slots + (OLD,) * frame)[1:frame]
+    for value in exit_regs + exit_slots + (exit_fl,):
+        if isinstance(value, frozenset):
+            used.update(value)
+    return Subroutine(
+        frame=frame,
+        inputs=tuple(sorted(r for r in used if r != "FL")),
+        uses_fl="FL" in used,
+        copies=tuple((r, value[1]) for r, value in enumerate(exit_regs)
+                     if isinstance(value, tuple)),
+        keeps_fl=exit_fl == ("in", "FL"),
+        slots=tuple(("copy", value[1]) if isinstance(value, tuple)
+                    else None if value == OLD else "value"
+                    for value in exit_slots))
@@ -0,0 +1,140 @@
+import sys
+import os
+import json
+import time
+from multiprocessing import Pool
+
+try:
+    from .ls8 import CPU, read_program
+except ImportError:
+    from ls8 import CPU, read_program
+
+
+# Defaults for manifest entries that don't set their own limits
+DEFAULT_MAX_CYCLES = 1_000_000
+DEFAULT_TIMEOUT = 10.0
+
+# Per-worker caches: CPUs by (engine, timer_cycles), programs by path
+_cpus = {}
+_programs = {}
+
+
+def load_manifest(path):
+    """
+    Read a JSONL manifest. Each line is one job:
+
+        {"id": "mult-1", "program": "programs/mult.ls8", "input": "abc",
+         "max_cycles": 10000, "timeout": 2.0, "timer_cycles": 1000,
+         "engine": "jit"}
+
+    "input_file" streams a file to the program instead of "input", and
+    "stop_at_eof": true ends the job once all of it has been handled.
+    Only "program" is required. Relative program and input_file paths are
+    resolved against the manifest's directory.
+    """
+
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path) as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+            job = json.loads(line)
+            job.setdefault("id", line_num)
+            for key in ("program", "input_file"):
+                if key in job:
+                    job[key] = os.path.join(base, job[key])
+            jobs.append(job)
+    return jobs
+
+
+def run_job(job):
+    """Run one manifest job in this process and return its result record"""
+
+    started = time.perf_counter()
+    record = {"id": None, "program": None}
+
+    try:
+        # a bad job is reported in its own record, never raised
+        record["id"] = job.get("id")
+        program = record["program"] = job.get("program")
+        if program is None:
+            raise ValueError("job has no 'program'")
+
+        key = (job.get("engine", "interpreter"), job.get("timer_cycles"))
+        cpu = _cpus.get(key)
+        if cpu is None:
+            cpu = _cpus[key] = CPU(engine=key[0], timer_cycles=key[1])
+
+        if cpu.mmu is not None:
+            # a bank-switched program ran on this CPU before
+            cpu.mmu.detach()
+
+        if program.endswith(".ls8b"):
+            # binary images load straight into RAM
+            cpu.load(program)
+        else:
+            # cache parsed text, bank sections included
+            if program not in _programs:
+                banks = []
+                _programs[program] = (read_program(program, banks=banks),
+                                      banks)
+            code, banks = _programs[program]
+            cpu.load_program(code)
+            cpu.load_banks(banks)
+
+        stdin = job.get("input")
+        if "input_file" in job:
+            # streamed to the program, not read in up front
+            stdin = open(job["input_file"], "rb")
+
+        try:
+            result = cpu.execute(None,
+                                 max_cycles=job.get("max_cycles",
+                                                    DEFAULT_MAX_CYCLES),
+                                 stdin=stdin,
+                                 timeout=job.get("timeout", DEFAULT_TIMEOUT),
+                                 stop_at_eof=job.get("stop_at_eof", False))
+        finally:
+            if "input_file" in job:
+                stdin.close()
+    except Exception as e:
+        record.update(status=None, halt_reason="error", error=str(e))
+    else:
+        record.update(status=result.status,
+                      halt_reason=result.halt_reason,
+                      cycles=result.cycles,
+                      output=result.output,
+                      registers=result.registers,
+                      pc=result.pc,
+                      fl=result.fl)
+
+    record["elapsed"] = time.perf_counter() - started
+    return record
+
+
+def run_batch(jobs, workers=None, out=sys.stdout, ordered=False,
+              chunksize=None):
+    """
+    Fan `jobs` out over a pool of `workers` processes and stream one JSON
+    result line per job to `out` as soon as it finishes. Returns the
+    number of jobs that did not halt normally.
+
+    Jobs are handed out `chunksize` at a time; by default about four
+    chunks per worker, so a small manifest still keeps every worker busy.
+    """
+
+    jobs = list(jobs)
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // ((workers or os.cpu_count()) * 4))
+
+    failures = 0
+    with Pool(workers) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for record in imap(run_job, jobs, chunksize):
+            if record["status"] != 0:
+                failures += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    return failures
@@ -0,0 +1,109 @@
+# Address space layout: 64 pages of 4 bytes, so that the spec's memory
+# map falls on page boundaries (0xF4-0xF7 I/O registers, 0xF8-0xFF the
+# interrupt vector table)
+PAGE_BITS = 2
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_COUNT = 256 >> PAGE_BITS
+
+# I/O registers
+KEY_REGISTER = 0xF4
+IO_PAGE = KEY_REGISTER >> PAGE_BITS
+
+
+class Device:
+    """
+    Memory-mapped device: gets every read and write to the pages it is
+    mapped at. The default behaves like plain RAM.
+    """
+
+    def __init__(self, cpu):
+        self.ram = cpu.ram
+
+    def read(self, address):
+        return self.ram[address]
+
+    def write(self, address, value):
+        self.ram[address] = value
+
+    def sync(self):
+        # called after restore(): pick up any device state kept in RAM
+        pass
+
+    def reset(self):
+        self.sync()
+
+
+class IOPorts(Device):
+    """
+    The I/O page (0xF4-0xF7). Each port can get its own read and write
+    handlers with attach(); ports without one are plain bytes of RAM, like
+    the key register at 0xF4, which just holds the last key pressed.
+    """
+
+    def __init__(self, cpu):
+        super().__init__(cpu)
+        self.readers = {}
+        self.writers = {}
+
+    def attach(self, address, read=None, write=None):
+        # read() returns the port's value, write(value) handles a store
+        if read is not None:
+            self.readers[address] = read
+        if write is not None:
+            self.writers[address] = write
+
+    def read(self, address):
+        reader = self.readers.get(address)
+        if reader is None:
+            return self.ram[address]
+        return reader()
+
+    def write(self, address, value):
+        writer = self.writers.get(address)
+        if writer is None:
+            self.ram[address] = value
+        else:
+            writer(value)
+
+
+class MemoryBus:
+    """
+    Page table for the 256-byte address space.
+
+    Every page is either plain RAM (None) or mapped to a Device. The
+    table is also kept expanded to one entry per address in `devices`,
+    which the CPU indexes on every LD, ST, PUSH, POP, CALL and RET: plain
+    RAM costs that one list lookup and is then read or written directly,
+    and only addresses in mapped pages call into a device.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.pages = [None] * PAGE_COUNT
+        self.devices = [None] * 256
+        self.io = IOPorts(cpu)
+        self.map(IO_PAGE, self.io)
+
+    def map(self, page, device, count=1):
+        # map `count` pages starting at `page` to `device` (None unmaps)
+        for page in range(page, page + count):
+            self.pages[page] = device
+            start = page << PAGE_BITS
+            self.devices[start:start + PAGE_SIZE] = [device] * PAGE_SIZE
+        # every mapped device, once
+        self.mapped = list({id(d): d for d in self.pages
+                            if d is not None}.values())
+
+    def unmap(self, page, count=1):
+        self.map(page, None, count)
+
+    def device(self, address):
+        return self.pages[address >> PAGE_BITS]
+
+    def sync(self):
+        for device in self.mapped:
+            device.sync()
+
+    def reset(self):
+        for device in self.mapped:
+            device.reset()
@@ -0,0 +1,137 @@
+import os
+import mmap
+import time
+import struct
+
+try:
+    from .ls8 import STATE_SIZE
+    from .mmu import MMU, BANK_SIZE
+    from .scheduler import INF
+except ImportError:
+    from ls8 import STATE_SIZE
+    from mmu import MMU, BANK_SIZE
+    from scheduler import INF
+
+
+# Checkpoint file layout (little-endian):
+#   header: magic, version, program size, timer period in cycles (0 for
+#           the wall clock), cycle count, output bytes written, and the
+#           number of events, queued input bytes and MMU banks (0 for no
+#           MMU)
+#   the CPU state buffer: RAM, registers, PC, FL and the interrupt latch
+#   events: (kind, key value, cycle, interval) each
+#   queued input bytes
+#   banks 1 and up, BANK_SIZE bytes each
+CHECKPOINT_MAGIC = b"LS8C"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct("<4sBHIQQHIH")
+EVENT = struct.Struct("<BBQI")
+
+DEFAULT_CHECKPOINT_CYCLES = 1_000_000
+
+
+def save_checkpoint(cpu, path):
+    """
+    Write the machine to `path`: RAM, registers, PC, FL, IS/IM and the
+    interrupt latch, the cycle count, pending timer, polling and injected
+    key events, queued input and the contents of every MMU bank. Buffered
+    output is written out first, so output up to the checkpoint is never
+    lost or repeated on resume. The file is written next to `path` and
+    renamed over it, so `path` always holds a complete checkpoint.
+
+    Events a run scheduled for itself (a timeout, periodic checkpoints)
+    aren't saved, and neither is streamed input: resume with the rest of
+    the stream.
+    """
+
+    cpu.output.flush()
+    scheduler = cpu.scheduler
+    events = scheduler.pending_events()
+    queued = bytes(cpu.input_queue)
+    mmu = cpu.mmu
+    header = CHECKPOINT_HEADER.pack(
+        CHECKPOINT_MAGIC, CHECKPOINT_VERSION, cpu.program_size,
+        scheduler.timer_cycles or 0, cpu.cycles, cpu.output.written,
+        len(events), len(queued), mmu.banks if mmu is not None else 0)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.write(cpu.state)
+        for kind, when, interval, value in events:
+            f.write(EVENT.pack(kind, value, when, interval))
+        f.write(queued)
+        if mmu is not None:
+            f.write(mmu.backing)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(cpu, path):
+    """
+    Put the machine back the way save_checkpoint() left it, ready for
+    run_program() (or execute(None)) to carry on. The file is mapped into
+    memory and everything is copied straight out of the mapping. A
+    program that was saved with an MMU gets one with the same number of
+    banks if `cpu` doesn't have one yet.
+    """
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < CHECKPOINT_HEADER.size + STATE_SIZE:
+            raise ValueError("Truncated checkpoint")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            (magic, version, program_size, timer_cycles, cycles, written,
+             event_count, queued, banks) = CHECKPOINT_HEADER.unpack_from(data)
+            if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version {version}")
+            offset = CHECKPOINT_HEADER.size + STATE_SIZE
+            end = (offset + event_count * EVENT.size + queued
+                   + max(banks - 1, 0) * BANK_SIZE)
+            if size < end:
+                raise ValueError("Truncated checkpoint")
+            if banks and cpu.mmu is not None and cpu.mmu.banks != banks:
+                raise ValueError(f"Checkpoint has {banks} banks, the MMU "
+                                 f"has {cpu.mmu.banks}")
+
+            cpu.reset()
+            if banks and cpu.mmu is None:
+                MMU(cpu, banks=banks)
+            with memoryview(data) as view:
+                cpu.state[:] = view[CHECKPOINT_HEADER.size:offset]
+                events = []
+                for _ in range(event_count):
+                    kind, value, when, interval = EVENT.unpack_from(data,
+                                                                    offset)
+                    events.append((kind, when, interval, value))
+                    offset += EVENT.size
+                cpu.input_queue.extend(view[offset:offset + queued])
+                offset += queued
+                if banks:
+                    cpu.mmu.backing[:] = view[offset:end]
+
+    cpu.program_size = program_size
+    cpu.cycles = cycles
+    cpu.output.written = written
+    cpu.bus.sync()
+
+    # the timer runs the way it did when the checkpoint was taken
+    scheduler = cpu.scheduler
+    scheduler.clear()
+    scheduler.timer_cycles = timer_cycles or None
+    if scheduler.realtime:
+        scheduler.next_tick = (time.monotonic() + scheduler.timer_seconds
+                               if scheduler.timer_seconds is not None
+                               else INF)
+    scheduler.add_events(events)
+
+
+def checkpoint_every(cpu, path, cycles=DEFAULT_CHECKPOINT_CYCLES):
+    """
+    Save a checkpoint to `path` every `cycles` cycles of the run; call
+    after loading the program (or a checkpoint) and before running it.
+    """
+
+    cpu.scheduler.every(cycles, lambda when: save_checkpoint(cpu, path),
+                        passive=True)
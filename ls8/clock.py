@@ -0,0 +1,166 @@
+import time
+
+try:
+    from .ls8 import OPCODES
+    from .scheduler import INF
+except ImportError:
+    from ls8 import OPCODES
+    from scheduler import INF
+
+
+# Clock cycles per instruction. The spec doesn't give timings, so this is
+# a simple model: one cycle per instruction byte fetched, one per memory
+# access, and extra for the slow ALU operations.
+CYCLES = {
+    "NOP": 1, "HLT": 1,
+    "LDI": 3, "LD": 4, "ST": 4,
+    "PUSH": 3, "POP": 3, "PRN": 3, "PRA": 3,
+    "ADD": 3, "SUB": 3, "AND": 3, "OR": 3, "XOR": 3, "SHL": 3, "SHR": 3,
+    "CMP": 3, "MUL": 5, "DIV": 10, "MOD": 10,
+    "INC": 2, "DEC": 2, "NOT": 2,
+    "JMP": 2, "JEQ": 2, "JNE": 2, "JGT": 2, "JLT": 2, "JLE": 2, "JGE": 2,
+    "CALL": 4, "RET": 2, "INT": 2, "IRET": 10,
+}
+
+# Taking an interrupt: 9 pushes and the vector fetch
+INTERRUPT_CYCLES = 10
+
+# Cost by opcode byte; invalid opcodes stop the CPU, so they cost 1
+COSTS = [1] * 256
+for name, cycles in CYCLES.items():
+    COSTS[OPCODES[name]] = cycles
+
+# Throttled runs sleep once per this many clock cycles...
+DEFAULT_BATCH = 10_000
+# ...and stop trying to catch up once they fall this far behind
+MAX_LAG = 0.1
+
+
+class Clock:
+    """
+    Clock-cycle timing model and throttle.
+
+    Runs the program in its own copy of the interpreter loop that adds up
+    clock cycles from the COSTS table. With a target rate `hz`, the loop
+    sleeps once every `batch` clock cycles until the wall clock catches up
+    with the emulated one. Every sleep aims at the time the emulated
+    clock should have reached since the run started, so oversleeping in
+    one batch is made up in the next rather than adding up; if the host
+    can't keep up (or the run was paused) for more than MAX_LAG seconds,
+    the schedule restarts from now instead of racing to catch up.
+
+    A throttled run also takes the timer interrupt from the emulated
+    clock, once every `hz` cycles, so it ticks at a fixed point in the
+    program's progress. With `hz=None` nothing is throttled and the run
+    just reports the emulated clock rate it reached.
+    """
+
+    def __init__(self, cpu, hz=None, batch=DEFAULT_BATCH):
+        self.cpu = cpu
+        self.hz = hz
+        self.batch = batch
+        self.clock = 0  # emulated clock cycles
+        self.instructions = 0
+        self.elapsed = 0.0
+        self.slept = 0.0
+        self.lagging = 0  # times the schedule was restarted
+        self.timer = False  # the timer runs off the emulated clock
+
+    def attach(self):
+        cpu = self.cpu
+        cpu.loop = self.run
+        if self.hz is not None and cpu.scheduler.realtime:
+            # the emulated clock drives the timer instead
+            cpu.scheduler.timer_seconds = None
+            cpu.scheduler.next_tick = INF
+            self.timer = True
+        return self
+
+    @property
+    def mhz(self):
+        # effective emulated clock rate
+        return self.clock / self.elapsed / 1e6 if self.elapsed else 0.0
+
+    def run(self, max_cycles=None):
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+        IS = cpu.IS
+        IM = cpu.IM
+        decoded = cpu.decoded
+        decode = cpu.decode
+        scheduler = cpu.scheduler
+        costs = COSTS
+        pc = cpu.PC
+        cycles = cpu.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        hz = self.hz
+        clock = self.clock
+        started = time.perf_counter()
+        start_cycles = cycles
+        # wall-clock time the emulated clock was at `base`
+        base = clock
+        base_time = started
+        tick = clock + hz if self.timer else INF
+        sync = min(clock + self.batch, tick) if hz else INF
+
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if not cpu.running:
+                    break
+
+            if clock >= sync:
+                if clock >= tick:
+                    cpu.raise_interrupt(0)
+                    tick += hz
+                ahead = base_time + (clock - base) / hz - time.perf_counter()
+                if ahead > 0:
+                    time.sleep(ahead)
+                    self.slept += ahead
+                elif ahead < -MAX_LAG:
+                    base = clock
+                    base_time = time.perf_counter()
+                    self.lagging += 1
+                sync = min(clock + self.batch, tick)
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                servicing = cpu.servicing_interrupt
+                cpu.check_interrupt_status()
+                if cpu.servicing_interrupt and not servicing:
+                    clock += INTERRUPT_CYCLES
+                pc = cpu.PC
+
+            clock += costs[ram[pc]]
+            entry = decoded[pc] or decode(pc)
+            pc = entry[0](entry[1], entry[2], pc)
+            cycles += 1
+
+        self.clock = clock
+        self.instructions += cycles - start_cycles
+        self.elapsed += time.perf_counter() - started
+        cpu.PC = pc
+        cpu.cycles = cycles
+        if cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
+
+    def report(self):
+        line = (f"clock: {self.clock} cycles, {self.instructions} "
+                f"instructions in {self.elapsed:.3f} s = {self.mhz:.3f} MHz")
+        if self.hz:
+            line += (f" (target {self.hz / 1e6:g} MHz, slept "
+                     f"{self.slept:.3f} s")
+            if self.lagging:
+                line += f", fell behind {self.lagging} times"
+            line += ")"
+        return line + "\n"
@@ -0,0 +1,398 @@
+import cmd
+import sys
+
+try:
+    from .ls8 import OPCODES
+    from .scheduler import INF
+    from .analyze import format_instruction, operand_count
+    from .stream import StreamInput
+except ImportError:
+    from ls8 import OPCODES
+    from scheduler import INF
+    from analyze import format_instruction, operand_count
+    from stream import StreamInput
+
+
+CALL = OPCODES["CALL"]
+
+
+class Debugger:
+    """
+    Breakpoints, watchpoints and stepping.
+
+    Like the profiler, the debugger runs the program in its own
+    instrumented copy of the interpreter loop, which checks breakpoints
+    before and watchpoints after every instruction. The normal run loop
+    has no idea it exists, so nothing is slower when it isn't attached.
+
+    Locations are addresses (`12`, `0x0c`), labels from the program's
+    symbol table (`PRINTSTR`) or, for watchpoints, registers (`R3`). A
+    watchpoint stops the program right after an instruction that changes
+    the watched byte.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.breakpoints = set()
+        self.watches = {}  # (kind, index) -> last value seen
+        self.reason = None  # why the last run() stopped
+        self.changed = []  # (location, old, new) for a watchpoint stop
+
+        # stop conditions for step() and next()
+        self.limit = INF
+        self.return_to = None  # (pc, sp) that step-over runs until
+
+    def attach(self):
+        self.cpu.loop = self.run
+        return self
+
+    # Locations
+    def address(self, where):
+        # address for a label or a number
+        labels = {name.upper(): address
+                  for address, name in self.cpu.symbols.items()}
+        address = labels.get(where.upper())
+        if address is None:
+            try:
+                address = int(where, 0)
+            except ValueError:
+                raise ValueError(f"Unknown address or label: {where}")
+        if not 0 <= address <= 0xFF:
+            raise ValueError(f"Address out of range: {where}")
+        return address
+
+    def location(self, where):
+        # ("reg", n) or ("ram", address)
+        if len(where) == 2 and where[0] in "Rr" and where[1] in "01234567":
+            return ("reg", int(where[1]))
+        return ("ram", self.address(where))
+
+    def value(self, location):
+        kind, index = location
+        return self.cpu.reg[index] if kind == "reg" else self.cpu.ram[index]
+
+    def symbolize(self, address):
+        name = self.cpu.symbols.get(address)
+        return f"{address:#04x} <{name}>" if name else f"{address:#04x}"
+
+    # Breakpoints and watchpoints
+    def add_breakpoint(self, where):
+        address = self.address(where)
+        self.breakpoints.add(address)
+        return address
+
+    def remove_breakpoint(self, where):
+        address = self.address(where)
+        self.breakpoints.discard(address)
+        return address
+
+    def add_watch(self, where):
+        location = self.location(where)
+        self.watches[location] = self.value(location)
+        return location
+
+    def remove_watch(self, where):
+        location = self.location(where)
+        self.watches.pop(location, None)
+        return location
+
+    # Execution
+    def resume(self, limit=INF, return_to=None, max_cycles=None):
+        # run until a breakpoint, watchpoint, the step limit or the end
+        cpu = self.cpu
+        self.limit = limit
+        self.return_to = return_to
+        self.reason = None
+        if not cpu.running:
+            self.reason = cpu.halt_reason
+            return self.reason
+        cpu.run_program(max_cycles)
+        if not cpu.running:
+            self.reason = cpu.halt_reason
+        return self.reason
+
+    def step(self, count=1):
+        return self.resume(limit=self.cpu.cycles + count)
+
+    def next(self):
+        # step, but run a CALL through to its return
+        cpu = self.cpu
+        pc = cpu.PC
+        if cpu.ram[pc] != CALL:
+            return self.step()
+        return self.resume(return_to=((pc + 2) & 0xFF, cpu.reg[7]))
+
+    def cont(self, max_cycles=None):
+        return self.resume(max_cycles=max_cycles)
+
+    def run(self, max_cycles=None):
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+        IS = cpu.IS
+        IM = cpu.IM
+        decoded = cpu.decoded
+        decode = cpu.decode
+        scheduler = cpu.scheduler
+        breakpoints = self.breakpoints
+        watches = self.watches
+        limit = self.limit
+        return_pc, return_sp = self.return_to or (None, None)
+        pc = cpu.PC
+        cycles = cpu.cycles
+        resumed = cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        # values the watchpoints were last seen with
+        for location in watches:
+            watches[location] = self.value(location)
+
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if not cpu.running:
+                    break
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                cpu.check_interrupt_status()
+                pc = cpu.PC
+
+            # stop before the next instruction, but never before the one
+            # the run resumed at
+            if cycles != resumed:
+                if pc in breakpoints:
+                    self.reason = "breakpoint"
+                    break
+                if cycles >= limit or (pc == return_pc
+                                       and reg[7] >= return_sp):
+                    self.reason = "step"
+                    break
+
+            entry = decoded[pc] or decode(pc)
+            pc = entry[0](entry[1], entry[2], pc)
+            cycles += 1
+
+            if watches:
+                changed = []
+                for location, old in watches.items():
+                    kind, index = location
+                    new = reg[index] if kind == "reg" else ram[index]
+                    if new != old:
+                        changed.append((location, old, new))
+                if changed:
+                    for location, old, new in changed:
+                        watches[location] = new
+                    self.changed = changed
+                    self.reason = "watchpoint"
+                    break
+
+        cpu.PC = pc
+        cpu.cycles = cycles
+        if not cpu.running and cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
+
+    # State
+    def where(self):
+        pc = self.cpu.PC
+        text = format_instruction(self.cpu.ram, pc, self.cpu.symbols)
+        return f"{self.symbolize(pc)}: {text}"
+
+    def dump(self):
+        cpu = self.cpu
+        reg = cpu.reg
+        lines = [f"PC={cpu.PC:#04x} FL={cpu.FL:03b} IM={reg[cpu.IM]:08b} "
+                 f"IS={reg[cpu.IS]:08b} SP={reg[cpu.SP]:#04x} "
+                 f"cycles={cpu.cycles}"
+                 + (" (in interrupt)" if cpu.servicing_interrupt else "")]
+        lines.append("  ".join(f"R{i}={reg[i]:3} ({reg[i]:#04x})"
+                               for i in range(4)))
+        lines.append("  ".join(f"R{i}={reg[i]:3} ({reg[i]:#04x})"
+                               for i in range(4, 8)))
+        if reg[cpu.SP] < 0xF4:
+            stack = " ".join(f"{cpu.ram[address]:02x}"
+                             for address in range(reg[cpu.SP], 0xF4))
+            lines.append(f"stack: {stack}")
+        return "\n".join(lines) + "\n"
+
+    def memory(self, address, count=16):
+        # hex dump, 16 bytes per line
+        ram = self.cpu.ram
+        lines = []
+        for start in range(address, min(address + count, 256), 16):
+            end = min(start + 16, address + count, 256)
+            values = bytes(ram[start:end])
+            text = "".join(chr(v) if 32 <= v < 127 else "." for v in values)
+            lines.append(f"{start:#04x}: {values.hex(' '):<47}  {text}")
+        return "\n".join(lines) + "\n"
+
+    def disassemble(self, address, count=8):
+        ram = self.cpu.ram
+        symbols = self.cpu.symbols
+        lines = []
+        for _ in range(count):
+            if address in symbols:
+                lines.append(f"{symbols[address]}:")
+            marker = "=>" if address == self.cpu.PC else "  "
+            text = format_instruction(ram, address, symbols)
+            lines.append(f"{marker} {address:#04x}  {text}")
+            address += operand_count(ram[address]) + 1
+            if address > 0xFF:
+                break
+        return "\n".join(lines) + "\n"
+
+
+class DebugShell(cmd.Cmd):
+    """Command-line front end for the Debugger"""
+
+    intro = "LS-8 debugger. Type help or ? to list commands."
+    prompt = "(ls8) "
+
+    def __init__(self, debugger, stdout=None):
+        super().__init__(stdout=stdout)
+        self.debugger = debugger
+        self.cpu = debugger.cpu
+
+    def emptyline(self):
+        # an empty line doesn't repeat the last command
+        pass
+
+    def onecmd(self, line):
+        try:
+            return super().onecmd(line)
+        except ValueError as e:
+            self.stdout.write(f"{e}\n")
+
+    def report(self, reason):
+        self.cpu.output.flush()
+        if reason == "watchpoint":
+            for (kind, index), old, new in self.debugger.changed:
+                name = (f"R{index}" if kind == "reg"
+                        else self.debugger.symbolize(index))
+                self.stdout.write(f"watchpoint: {name} {old} -> {new}\n")
+        elif reason == "breakpoint":
+            self.stdout.write("breakpoint\n")
+        elif reason is not None and reason != "step":
+            self.stdout.write(f"program stopped: {reason} after "
+                              f"{self.cpu.cycles} cycles\n")
+            return
+        self.stdout.write(f"{self.debugger.where()}\n")
+
+    def do_break(self, arg):
+        """break [address|label]: set a breakpoint, or list them"""
+        if arg:
+            address = self.debugger.add_breakpoint(arg)
+            self.stdout.write(
+                f"breakpoint at {self.debugger.symbolize(address)}\n")
+            return
+        for address in sorted(self.debugger.breakpoints):
+            self.stdout.write(f"{self.debugger.symbolize(address)}\n")
+
+    def do_delete(self, arg):
+        """delete address|label: remove a breakpoint"""
+        self.debugger.remove_breakpoint(arg)
+
+    def do_watch(self, arg):
+        """watch address|label|Rn: stop when a RAM byte or register
+        changes; without an argument, list the watchpoints"""
+        if arg:
+            self.debugger.add_watch(arg)
+            return
+        for kind, index in self.debugger.watches:
+            self.stdout.write(f"R{index}\n" if kind == "reg"
+                              else f"{self.debugger.symbolize(index)}\n")
+
+    def do_unwatch(self, arg):
+        """unwatch address|label|Rn: remove a watchpoint"""
+        self.debugger.remove_watch(arg)
+
+    def do_step(self, arg):
+        """step [n]: execute one (or n) instructions"""
+        self.report(self.debugger.step(int(arg, 0) if arg else 1))
+
+    def do_next(self, arg):
+        """next: like step, but run a CALL through to its return"""
+        self.report(self.debugger.next())
+
+    def do_continue(self, arg):
+        """continue: run until a breakpoint, a watchpoint or the end"""
+        self.report(self.debugger.cont())
+
+    def do_regs(self, arg):
+        """regs: show PC, flags, registers and the stack"""
+        self.stdout.write(self.debugger.dump())
+
+    def do_x(self, arg):
+        """x address|label [count]: hex dump of RAM"""
+        args = arg.split()
+        if not args:
+            raise ValueError("x needs an address")
+        count = int(args[1], 0) if len(args) > 1 else 16
+        self.stdout.write(
+            self.debugger.memory(self.debugger.address(args[0]), count))
+
+    def do_list(self, arg):
+        """list [address|label] [count]: disassemble, from the PC by
+        default"""
+        args = arg.split()
+        address = self.debugger.address(args[0]) if args else self.cpu.PC
+        count = int(args[1], 0) if len(args) > 1 else 8
+        self.stdout.write(self.debugger.disassemble(address, count))
+
+    def do_quit(self, arg):
+        """quit: leave the debugger"""
+        self.cpu.running = False
+        return True
+
+    def do_EOF(self, arg):
+        self.stdout.write("\n")
+        return self.do_quit(arg)
+
+    # short forms
+    do_b = do_break
+    do_d = do_delete
+    do_w = do_watch
+    do_s = do_step
+    do_n = do_next
+    do_c = do_continue
+    do_r = do_regs
+    do_l = do_list
+    do_q = do_quit
+
+
+def debug(cpu, program, stdin=None, stdout=None):
+    """
+    Load `program` and debug it interactively; program output goes to
+    `stdout` (default: sys.stdout). `stdin` bytes are queued as
+    keypresses, a binary file is streamed to the program the way
+    execute() does it.
+    """
+
+    debugger = Debugger(cpu).attach()
+    cpu.load(program)
+    stream = None
+    if isinstance(stdin, (bytes, bytearray)):
+        cpu.input_queue.extend(stdin)
+    elif stdin is not None:
+        stream = StreamInput(cpu, stdin)
+    cpu.output.open(stdout or sys.stdout)
+    cpu.running = True
+
+    shell = DebugShell(debugger)
+    shell.intro = f"{DebugShell.intro}\n{debugger.where()}"
+    if stream is not None:
+        stream.attach()
+    try:
+        shell.cmdloop()
+    finally:
+        if stream is not None:
+            stream.detach()
+    return debugger
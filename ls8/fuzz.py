@@ -0,0 +1,375 @@
+import os
+import time
+import random
+from collections import namedtuple
+
+try:
+    from .ls8 import CPU, OPCODES, IRQ_OFFSET, RAM_SIZE
+    from .output import Capture
+    from .scheduler import INF
+    from .stream import EOF_INTERRUPT, KEY_PENDING
+except ImportError:
+    from ls8 import CPU, OPCODES, IRQ_OFFSET, RAM_SIZE
+    from output import Capture
+    from scheduler import INF
+    from stream import EOF_INTERRUPT, KEY_PENDING
+
+
+IRET = OPCODES["IRET"]
+
+# Instructions per execution, and input bytes per test case, at most
+DEFAULT_MAX_CYCLES = 2_000
+DEFAULT_MAX_INPUT = 64
+
+# Registers a test case sets before the run: R0-R4, IM and IS (not SP)
+CASE_REGISTERS = 7
+
+# Byte values that tend to hit boundaries: 0, 1, signed limits, all ones,
+# the I/O page and the interrupt vectors
+INTERESTING = (0, 1, 2, 0x0F, 0x10, 0x7F, 0x80, 0xF4, 0xF8, 0xFE, 0xFF)
+
+# Halt reasons that mean the program did something wrong
+FAULTS = ("invalid_opcode", "division_by_zero", "stack_overflow",
+          "stack_underflow")
+
+Case = namedtuple("Case", ["registers", "data"])
+Fault = namedtuple("Fault", ["kind", "pc", "case", "count"])
+
+
+class Fuzzer:
+    """
+    Coverage-guided fuzzing of an LS-8 program.
+
+    The program is loaded once and the machine state right after loading
+    is kept; every execution copies it back over the CPU's state buffer
+    in place, so nothing is parsed or allocated again between runs. A
+    test case (Case) is the values of R0-R4, IM and IS at the entry point
+    and input bytes, which are delivered through the keyboard's contract
+    like StreamInput does: the first straight away and each of the others
+    as the handler of the last one IRETs. Once the input has been handled
+    interrupt 2 is raised and, with `stop_at_eof`, the run ends (unless
+    there was no input, for programs that don't read any).
+
+    Executions run in their own copy of the interpreter loop, which marks
+    every edge (the PC of an instruction and of the one after it) in a
+    64 KiB bitmap indexed by prev_pc << 8 | pc, and ends the run as soon
+    as the stack pointer leaves the stack: below the end of the program
+    ("stack_overflow") or above where it started ("stack_underflow").
+    Invalid opcodes and division by zero stop the CPU as usual. Registers
+    are bytes in the state buffer, so a value that doesn't fit in 8 bits
+    can't be stored; an instruction that tries fails the run with an
+    "error: ..." halt reason. Every run stops after `max_cycles`
+    instructions.
+
+    fuzz() mutates cases from the corpus, keeps the ones that reach new
+    edges and records the first case for each (halt reason, PC) fault.
+    Programs run with checked RAM writes even if they were proven safe:
+    the proof assumes the registers a program is loaded with, which the
+    fuzzer changes.
+    """
+
+    def __init__(self, program, max_cycles=DEFAULT_MAX_CYCLES,
+                 max_input=DEFAULT_MAX_INPUT, timer_cycles=None, seed=None,
+                 stop_at_eof=True):
+        self.max_cycles = max_cycles
+        self.max_input = max_input
+        self.timer_cycles = timer_cycles
+        self.stop_at_eof = stop_at_eof
+        self.random = random.Random(seed)
+
+        cpu = self.cpu = CPU()
+        cpu.verify = False
+        if isinstance(program, (str, os.PathLike)):
+            cpu.load(program)
+        else:
+            cpu.load_program(program)
+        # runs are deterministic: the timer fires every timer_cycles
+        # instructions, or not at all
+        cpu.scheduler.detect_idle = False
+        cpu.scheduler.timer_seconds = None
+        self.target = cpu.output.open(Capture())
+
+        self.base = cpu.snapshot()
+        self.banks = bytes(cpu.mmu.backing) if cpu.mmu is not None else None
+        self.ram = self.base[:RAM_SIZE]
+        self.decoded = cpu.decoded
+        # RAM as it is and as it was loaded, 8 bytes at a time, to find
+        # what a run changed without copying anything
+        self.words = cpu.ram.cast("Q")
+        self.base_words = memoryview(self.ram).cast("Q")
+
+        # stack pointers that end a run: below the program or above the
+        # initial stack pointer
+        floor = cpu.program_size
+        top = cpu.reg[cpu.SP]
+        self.bad_sp = bytes(0 if floor <= sp <= top else 1
+                            for sp in range(256))
+        self.floor = floor
+
+        self.bitmap = bytearray(1 << 16)
+        self.edges = 0  # edges covered so far
+        self.corpus = [Case(bytes(cpu.reg[:CASE_REGISTERS]), b"")]
+        self.faults = {}  # (kind, pc) -> Fault
+        self.executions = 0
+        self.elapsed = 0.0
+
+        # the current run's input
+        self.data = b""
+        self.offset = 0
+        self.eof = False
+
+    # Execution
+    def reset(self, case):
+        # back to the state right after loading, with `case` applied
+        cpu = self.cpu
+        state = cpu.state
+        ram = cpu.ram
+        base = self.ram
+        if ram != base:
+            # the last run wrote to memory: anything decoded from an
+            # address it changed no longer matches what's restored, and
+            # that includes code it wrote and then ran above the program
+            for word, (old, new) in enumerate(zip(self.base_words,
+                                                  self.words)):
+                if old != new:
+                    for address in range(word * 8, word * 8 + 8):
+                        if ram[address] != base[address]:
+                            cpu.invalidate(address)
+        state[:] = self.base
+        if self.banks is not None:
+            cpu.mmu.backing[:] = self.banks
+            cpu.bus.sync()
+        cpu.reg[:CASE_REGISTERS] = case.registers
+        cpu.cycles = 0
+        cpu.halt_reason = None
+        cpu.running = True
+        cpu.output.buffer.clear()
+        self.target.data.clear()
+
+        scheduler = cpu.scheduler
+        scheduler.clear()
+        if self.timer_cycles:
+            scheduler.every(self.timer_cycles, scheduler.timer_tick)
+
+        self.data = case.data
+        self.offset = 0
+        self.eof = False
+        self.deliver()
+
+    def deliver(self):
+        # next input byte, once the last one has been handled
+        cpu = self.cpu
+        if self.eof or cpu.reg[cpu.IS] & KEY_PENDING \
+                or cpu.state[IRQ_OFFSET]:
+            return
+        if self.offset == len(self.data):
+            self.eof = True
+            cpu.raise_interrupt(EOF_INTERRUPT)
+            if self.stop_at_eof and self.data:
+                cpu.running = False
+                cpu.halt_reason = "eof"
+            return
+        cpu.key_pressed(self.data[self.offset])
+        self.offset += 1
+
+    def execute(self, case):
+        """
+        Run `case` from the loaded state; returns (halt reason, PC it
+        stopped at, number of edges it covered for the first time).
+        """
+
+        self.reset(case)
+        cpu = self.cpu
+        edges = self.edges
+        try:
+            self.run(self.max_cycles)
+        except Exception as e:
+            cpu.running = False
+            cpu.halt_reason = f"error: {e}"
+        self.executions += 1
+        return cpu.halt_reason, cpu.PC, self.edges - edges
+
+    def run(self, max_cycles):
+        cpu = self.cpu
+        reg = cpu.reg
+        IS = cpu.IS
+        IM = cpu.IM
+        decoded = self.decoded
+        decode = cpu.decode
+        scheduler = cpu.scheduler
+        iret = cpu.optable[IRET]
+        deliver = self.deliver
+        bitmap = self.bitmap
+        bad_sp = self.bad_sp
+        pc = cpu.PC
+        cycles = cpu.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        new = 0
+        prev = 0  # PC of the last instruction, shifted into the high byte
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if not cpu.running:
+                    break
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                cpu.check_interrupt_status()
+                pc = cpu.PC
+                if bad_sp[reg[7]]:
+                    self.stack_fault(reg[7])
+                    break
+
+            entry = decoded[pc] or decode(pc)
+            edge = prev | pc
+            if not bitmap[edge]:
+                bitmap[edge] = 1
+                new += 1
+            prev = pc << 8
+            pc = entry[0](entry[1], entry[2], pc)
+            cycles += 1
+
+            if bad_sp[reg[7]]:
+                pc = prev >> 8
+                self.stack_fault(reg[7])
+                break
+            if entry[0] is iret:
+                deliver()
+
+        cpu.PC = pc
+        cpu.cycles = cycles
+        self.edges += new
+        if cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
+
+    def stack_fault(self, sp):
+        cpu = self.cpu
+        cpu.running = False
+        cpu.halt_reason = ("stack_overflow" if sp < self.floor
+                           else "stack_underflow")
+
+    # Mutation
+    def mutate(self, case):
+        # a few stacked random changes to the registers and input of a
+        # corpus entry; random() is scaled by hand, randrange() is several
+        # times slower
+        rand = self.random.random
+        byte = self.random.getrandbits
+        interesting = INTERESTING
+        registers = bytearray(case.registers)
+        data = bytearray(case.data)
+        for _ in range(1 << int(rand() * 3)):
+            choice = int(rand() * 8)
+            size = len(data)
+            if choice == 0:
+                registers[int(rand() * CASE_REGISTERS)] = byte(8)
+            elif choice == 1:
+                registers[int(rand() * CASE_REGISTERS)] = \
+                    interesting[int(rand() * len(interesting))]
+            elif choice == 2 or not size:
+                if size < self.max_input:
+                    data.insert(int(rand() * (size + 1)), byte(8))
+            elif choice == 3:
+                data[int(rand() * size)] ^= 1 << byte(3)
+            elif choice == 4:
+                data[int(rand() * size)] = \
+                    interesting[int(rand() * len(interesting))]
+            elif choice == 5:
+                data[int(rand() * size)] = byte(8)
+            elif choice == 6:
+                del data[int(rand() * size)]
+            else:
+                # splice in part of another corpus entry
+                corpus = self.corpus
+                other = corpus[int(rand() * len(corpus))].data
+                if other:
+                    start = int(rand() * len(other))
+                    end = start + 1 + int(rand() * (len(other) - start))
+                    at = int(rand() * (size + 1))
+                    data[at:at] = other[start:end]
+                    del data[self.max_input:]
+        return Case(bytes(registers), bytes(data))
+
+    def add_seed(self, data, registers=None):
+        # start the corpus off with a known input
+        if registers is None:
+            registers = self.corpus[0].registers
+        self.corpus.append(Case(bytes(registers),
+                                bytes(data[:self.max_input])))
+
+    def fuzz(self, executions=None, seconds=None):
+        """
+        Fuzz for `executions` runs and/or `seconds` of wall-clock time
+        (whichever ends first; without either, one run per corpus entry).
+        Returns the faults found so far.
+        """
+
+        if executions is None and seconds is None:
+            executions = len(self.corpus)
+        started = time.perf_counter()
+        deadline = started + seconds if seconds is not None else INF
+        limit = self.executions + executions if executions is not None \
+            else INF
+        corpus = self.corpus
+        faults = self.faults
+        rand = self.random.random
+
+        # every seed runs once as it is
+        pending = list(corpus)
+        while self.executions < limit:
+            if pending:
+                case = pending.pop()
+            else:
+                case = self.mutate(corpus[int(rand() * len(corpus))])
+            reason, pc, new = self.execute(case)
+            if new and case not in corpus:
+                corpus.append(case)
+            if reason in FAULTS or reason.startswith("error"):
+                key = (reason, pc)
+                fault = faults.get(key)
+                faults[key] = Fault(reason, pc, case, 1) if fault is None \
+                    else fault._replace(count=fault.count + 1)
+            # the clock is only read every so often
+            if not self.executions & 0xFF and time.perf_counter() >= deadline:
+                break
+
+        self.elapsed += time.perf_counter() - started
+        return list(faults.values())
+
+    def report(self):
+        rate = self.executions / self.elapsed if self.elapsed else 0.0
+        lines = [f"fuzz: {self.executions} executions in "
+                 f"{self.elapsed:.3f} s = {rate:,.0f} per second, "
+                 f"{self.edges} edges, {len(self.corpus)} in corpus, "
+                 f"{len(self.faults)} faults"]
+        symbols = self.cpu.symbols
+        for fault in sorted(self.faults.values(), key=lambda f: f[:2]):
+            name = symbols.get(fault.pc)
+            where = f"{fault.pc:#04x}" + (f" <{name}>" if name else "")
+            registers = " ".join(f"R{i}={value:#04x}"
+                                 for i, value in enumerate(
+                                     fault.case.registers))
+            lines.append(f"  {fault.kind} at {where} ({fault.count}x): "
+                         f"{registers} input={fault.case.data.hex()}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, directory):
+        # each fault's input as <kind>-<pc>.bin, for run --input
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for fault in self.faults.values():
+            kind = fault.kind.split(":")[0]
+            path = os.path.join(directory, f"{kind}-{fault.pc:02x}.bin")
+            with open(path, "wb") as f:
+                f.write(fault.case.data)
+            paths.append(path)
+        return paths
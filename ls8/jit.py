@@ -0,0 +1,214 @@
+try:
+    from .ls8 import OPCODES, FL_OFFSET
+    from .scheduler import INF
+except ImportError:
+    from ls8 import OPCODES, FL_OFFSET
+    from scheduler import INF
+
+
+# opcode byte -> mnemonic
+MNEMONICS = {opcode: name for name, opcode in OPCODES.items()}
+
+# Longest straight-line run compiled into a single block
+MAX_BLOCK_LENGTH = 64
+
+# Instructions inlined as Python statements (a, b are the operand bytes)
+INLINE = {
+    "NOP":  "pass",
+    "LDI":  "reg[{a}] = {b}",
+    "LD":   "d = reg[{b}]\n"
+            "device = devices[d]\n"
+            "reg[{a}] = ram[d] if device is None else device.read(d)",
+    "ADD":  "reg[{a}] = (reg[{a}] + reg[{b}]) & 0xFF",
+    "SUB":  "reg[{a}] = (reg[{a}] - reg[{b}]) & 0xFF",
+    "MUL":  "reg[{a}] = (reg[{a}] * reg[{b}]) & 0xFF",
+    "INC":  "reg[{a}] = (reg[{a}] + 1) & 0xFF",
+    "DEC":  "reg[{a}] = (reg[{a}] - 1) & 0xFF",
+    "AND":  "reg[{a}] &= reg[{b}]",
+    "OR":   "reg[{a}] |= reg[{b}]",
+    "XOR":  "reg[{a}] ^= reg[{b}]",
+    "NOT":  "reg[{a}] ^= 0b11111111",
+    "SHL":  "reg[{a}] = (reg[{a}] << reg[{b}]) & 0xFF",
+    "SHR":  "reg[{a}] >>= reg[{b}]",
+    "CMP":  "d = reg[{a}] - reg[{b}]\n"
+            "state[FL] = 0b100 if d < 0 else 0b010 if d > 0 else 0b001",
+}
+
+# Conditional jumps and the FL bits they test
+CONDITIONS = {
+    "JEQ": "state[FL] & 0b001",
+    "JNE": "not state[FL] & 0b001",
+    "JGT": "state[FL] & 0b010",
+    "JLT": "state[FL] & 0b100",
+    "JLE": "state[FL] & 0b101",
+    "JGE": "state[FL] & 0b011",
+}
+
+
+class Block:
+    def __init__(self, start, end, length, run, source):
+        self.start = start  # address of the first instruction
+        self.end = end  # address just past the last byte of the block
+        self.length = length  # number of instructions
+        self.run = run  # compiled function returning (next_pc, executed)
+        self.source = source
+
+
+class BlockJIT:
+    """
+    Compiles straight-line LS-8 code into Python functions.
+
+    A basic block runs from its start address up to and including the
+    first instruction that sets the PC (the ones with the `C` bit set:
+    CALL, RET, INT, IRET, JMP and the conditional jumps) or HLT. Compiled
+    blocks are cached by start address and dropped as soon as anything
+    writes into the bytes they were compiled from. Interrupts, input and
+    the timer are only polled between blocks.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.blocks = {}
+        # start addresses of every block that covers a RAM address
+        self.owners = [[] for _ in range(256)]
+
+    def flush(self):
+        self.blocks.clear()
+        for owner in self.owners:
+            owner.clear()
+
+    def invalidate(self, address):
+        owners = self.owners[address]
+        if owners:
+            for start in owners:
+                self.blocks.pop(start, None)
+            owners.clear()
+
+    def compile(self, start):
+        cpu = self.cpu
+        ram = cpu.ram
+        lines = ["def block(cpu=cpu, reg=reg, ram=ram, state=state, FL=FL, "
+                 "blocks=blocks, devices=devices):"]
+        pc = start
+        end = start
+        length = 0
+
+        while True:
+            opcode = ram[pc]
+            name = MNEMONICS.get(opcode)
+            size = (opcode >> 6) + 1
+            if name is None or pc + size > 256:
+                # leave invalid opcodes and wrapping code to the interpreter
+                if length == 0:
+                    return None
+                lines.append(f"    return {pc}, {length}")
+                break
+
+            a, b = cpu.operands(pc)
+            next_pc = (pc + size) & 0xFF
+            end = pc + size
+            length += 1
+            lines.append(f"    # {pc:#04x}: {name}")
+
+            if name in INLINE:
+                for line in INLINE[name].format(a=a, b=b).split("\n"):
+                    lines.append(f"    {line}")
+            elif name == "HLT":
+                lines.append("    cpu.running = False")
+                lines.append(f"    return {pc}, {length}")
+                break
+            elif name == "JMP":
+                lines.append(f"    return reg[{a}], {length}")
+                break
+            elif name in CONDITIONS:
+                lines.append(f"    if {CONDITIONS[name]}:")
+                lines.append(f"        return reg[{a}], {length}")
+                lines.append(f"    return {next_pc}, {length}")
+                break
+            elif opcode & 0b00010000:
+                # CALL, RET, INT and IRET keep their interpreter semantics
+                lines.append(f"    return cpu.{name}({a}, {b}, {pc}), "
+                             f"{length}")
+                break
+            else:
+                # ST, PUSH, POP, PRN, PRA, DIV, MOD: these may halt the CPU
+                # or write into this very block (unless the program has
+                # been proven not to modify itself); a fault leaves the
+                # PC at the faulting instruction, like the interpreter
+                lines.append(f"    pc = cpu.{name}({a}, {b}, {pc})")
+                if cpu.trusted:
+                    lines.append("    if not cpu.running:")
+                else:
+                    lines.append(f"    if not cpu.running or "
+                                 f"{start} not in blocks:")
+                lines.append(f"        return pc, {length}")
+
+            pc = next_pc
+            if length == MAX_BLOCK_LENGTH or pc == 0:
+                lines.append(f"    return {pc}, {length}")
+                break
+
+        source = "\n".join(lines) + "\n"
+        namespace = {"cpu": cpu, "reg": cpu.reg, "ram": ram,
+                     "state": cpu.state, "FL": FL_OFFSET,
+                     "blocks": self.blocks, "devices": cpu.devices}
+        exec(compile(source, f"<ls8 block {start:#04x}>", "exec"), namespace)
+
+        block = Block(start, end, length, namespace["block"], source)
+        for address in range(start, end):
+            self.owners[address].append(start)
+        self.blocks[start] = block
+        return block
+
+    def run(self, max_cycles=None):
+        cpu = self.cpu
+        reg = cpu.reg
+        IS = cpu.IS
+        IM = cpu.IM
+        blocks = self.blocks
+        compile_block = self.compile
+        scheduler = cpu.scheduler
+        pc = cpu.PC
+        cycles = cpu.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if scheduler.idle:
+                    cycles = scheduler.fast_forward(cycles, max_cycles)
+                    stop = min(scheduler.next_cycle, max_cycles)
+                    continue
+                if not cpu.running:
+                    break
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                cpu.check_interrupt_status()
+                pc = cpu.PC
+
+            block = blocks.get(pc) or compile_block(pc)
+            if block is None or cycles + block.length > max_cycles:
+                # single-step through code that can't be compiled and
+                # through the tail of the cycle budget
+                cpu.PC = pc
+                cpu.cycles = cycles
+                cpu.step()
+                pc = cpu.PC
+                cycles = cpu.cycles
+            else:
+                pc, executed = block.run()
+                cycles += executed
+
+        cpu.PC = pc
+        cpu.cycles = cycles
+        if cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
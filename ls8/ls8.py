@@ -1,254 +1,682 @@
 import sys
 import os
-from utils import flush_input, pause
-from pynput import keyboard
-from datetime import datetime
+import re
+import time
+import struct
+from collections import deque, namedtuple
+
+try:
+    from .utils import flush_input, pause
+    from .scheduler import Scheduler, INF
+    from .output import OutputDevice, Capture, NUMBERS, CHARACTERS
+    from .bus import MemoryBus
+except ImportError:
+    from utils import flush_input, pause
+    from scheduler import Scheduler, INF
+    from output import OutputDevice, Capture, NUMBERS, CHARACTERS
+    from bus import MemoryBus
+
+
+# Result of a headless CPU.execute() run
+ExecutionResult = namedtuple(
+    "ExecutionResult",
+    ["status", "halt_reason", "cycles", "output", "registers", "pc", "fl"])
+
+# execute() exit statuses
+EXIT_HALT = 0
+EXIT_MAX_CYCLES = 1
+EXIT_FAULT = 2
+EXIT_TIMEOUT = 3
+
+# Machine state layout: one contiguous bytearray holding RAM, R0-R7,
+# PC, FL and the "servicing interrupt" latch
+RAM_SIZE = 256
+REG_OFFSET = 256
+PC_OFFSET = 264
+FL_OFFSET = 265
+IRQ_OFFSET = 266
+STATE_SIZE = 267
+
+
+# Opcode byte for every instruction in the spec (`AABCDDDD`, see LS8-spec.md)
+OPCODES = {
+    "NOP":  0b00000000,
+    "HLT":  0b00000001,
+    "RET":  0b00010001,
+    "IRET": 0b00010011,
+    "PUSH": 0b01000101,
+    "POP":  0b01000110,
+    "PRN":  0b01000111,
+    "PRA":  0b01001000,
+    "CALL": 0b01010000,
+    "INT":  0b01010010,
+    "JMP":  0b01010100,
+    "JEQ":  0b01010101,
+    "JNE":  0b01010110,
+    "JGT":  0b01010111,
+    "JLT":  0b01011000,
+    "JLE":  0b01011001,
+    "JGE":  0b01011010,
+    "INC":  0b01100101,
+    "DEC":  0b01100110,
+    "NOT":  0b01101001,
+    "LDI":  0b10000010,
+    "LD":   0b10000011,
+    "ST":   0b10000100,
+    "ADD":  0b10100000,
+    "SUB":  0b10100001,
+    "MUL":  0b10100010,
+    "DIV":  0b10100011,
+    "MOD":  0b10100100,
+    "CMP":  0b10100111,
+    "AND":  0b10101000,
+    "OR":   0b10101010,
+    "XOR":  0b10101011,
+    "SHL":  0b10101100,
+    "SHR":  0b10101101,
+}
+
+
+# Binary image (.ls8b) header written by `asm.py --binary`: magic,
+# version, entry point, load address, flags, code length, symbol count.
+# The code bytes follow, then (address, name length, name) symbols.
+IMAGE_MAGIC = b"LS8B"
+IMAGE_VERSION = 1
+IMAGE_HEADER = struct.Struct("<4sBBBBHH")
+
+# Label comments emitted by asm/asm.py, e.g. "# LOOP (address 15):",
+# and the comments that start a bank section, e.g. "# BANK 2 (address 128):"
+LABEL_COMMENT = re.compile(r"#\s*(\w+) \(address (\d+)\):")
+BANK_COMMENT = re.compile(r"#\s*BANK (\d+) \(address (\d+)\):")
+
+# .ls8b flags: the symbol table is followed by a u16 section count and
+# one BANK_SECTION header (bank, address, length) plus data per section
+IMAGE_BANKED = 0b00000001
+BANK_COUNT = struct.Struct("<H")
+BANK_SECTION = struct.Struct("<BBH")
+
+
+def read_program(prog_file, symbols=None, banks=None):
+    # parse a text .ls8 file into its byte values. If a `symbols` dict is
+    # given, it is filled with {address: label} from the label comments.
+    # Bytes in bank sections are appended to the `banks` list as (bank,
+    # address, values); a program with banks can't be read without one.
+    program = []
+    section = program
+    with open(prog_file) as f:
+        for line in f:
+            x = line.split()
+            if len(x) == 0:
+                continue
+            if x[0][0] == "#":
+                m = BANK_COMMENT.match(line.strip())
+                if m is not None:
+                    bank = int(m.group(1))
+                    if bank == 0:
+                        section = program
+                    elif banks is None:
+                        raise ValueError(f"{prog_file} uses memory banks")
+                    else:
+                        section = []
+                        banks.append((bank, int(m.group(2)), section))
+                    continue
+                if symbols is not None:
+                    m = LABEL_COMMENT.match(line.strip())
+                    if m is not None:
+                        symbols[int(m.group(2))] = m.group(1)
+                continue
+            try:
+                section.append(int(x[0], 2))
+            except ValueError:
+                print(f"Invalid value: {x[0]}")
+                break
+    return program
 
 
 class CPU:
-    def __init__(self):
+    def __init__(self, engine="interpreter", timer_cycles=None):
         # reserved register addresses
         self.IM = 5
         self.IS = 6
         self.SP = 7
 
+        # buffered PRN/PRA output device
+        self.output = OutputDevice(sys.stdout)
+
+        # flat dispatch table indexed by the full opcode byte. Every
+        # handler takes (operand_a, operand_b, pc) and returns the next PC.
+        self.optable = [self.invalid_opcode] * 256
+        for name, opcode in OPCODES.items():
+            self.optable[opcode] = getattr(self, name)
+
+        # device event queue; timer_cycles=None keeps the timer on the
+        # wall clock, otherwise it fires every timer_cycles cycles
+        self.scheduler = Scheduler(self, timer_cycles=timer_cycles)
+
+        # alternative run loop (JIT, profiler, ...); None runs the
+        # interpreter loop below
+        self.loop = None
+
+        # optional basic-block compiler ("jit" engine)
+        self.jit = None
+        if engine == "jit":
+            try:
+                from .jit import BlockJIT
+            except ImportError:
+                from jit import BlockJIT
+            self.jit = BlockJIT(self)
+            self.loop = self.jit.run
+        elif engine != "interpreter":
+            raise ValueError(f"Unknown engine: {engine}")
+
+        # statically verify loaded programs and run the ones proven safe
+        # without self-modification checks (see analyze.py). The verifier
+        # is imported once here rather than on every load
+        try:
+            from .analyze import prove
+        except ImportError:
+            from analyze import prove
+        self.prove = prove
+        self.verify = True
+        self.trusted = False
+
         # initialize data containers
+        self.state = bytearray(STATE_SIZE)
+        view = memoryview(self.state)
+        self.ram = view[:RAM_SIZE]
+        self.reg = view[REG_OFFSET:REG_OFFSET + 8]
+
+        # page table: plain RAM, or a memory-mapped device per page
+        self.bus = MemoryBus(self)
+        self.devices = self.bus.devices
+
+        # optional bank-switched memory (see mmu.py)
+        self.mmu = None
         self.reset()
 
         # Outer run loop status that allows input to be read in
         self.cpu_is_active = True
 
-        # alu operation table
-        self.alutable = {
-            0b0000: "ADD",
-            0b0001: "SUB",
-            0b0010: "MUL",
-            0b0011: "DIV",
-            0b0100: "MOD",
-            0b0101: "INC",
-            0b0110: "DEC",
-            0b0111: "CMP",
-            0b1000: "AND",
-            0b1001: "NOT",
-            0b1010: "OR",
-            0b1011: "XOR",
-            0b1100: "SHL",
-            0b1101: "SHR"
-        }
-
-        # jump functions
-        self.jumptable = {
-            0b0000: self.CALL,
-            0b0001: self.RET,
-            0b0010: self.INT,
-            0b0011: self.IRET,
-            0b0100: self.JMP,
-            0b0101: self.JEQ,
-            0b0110: self.JNE,
-            0b0111: self.JGT,
-            0b1000: self.JLT,
-            0b1001: self.JLE,
-            0b1010: self.JGE
-        }
-
-        # non-alu instruction definitions
-        self.branchtable = {
-            0b0001: self.HLT,
-            0b0010: self.LDI,
-            0b0011: self.LD,
-            0b0100: self.ST,
-            0b0101: self.PUSH,
-            0b0110: self.POP,
-            0b0111: self.PRN,
-            0b1000: self.PRA
-        }
-
     def ram_read(self, address):
-        return self.ram[address]
+        device = self.devices[address]
+        if device is None:
+            return self.ram[address]
+        return device.read(address)
 
     def ram_write(self, address, value):
-        self.ram[address] = value
+        # store() and invalidate() in one call; this is on the hot path
+        # of every ST, PUSH and CALL
+        device = self.devices[address]
+        if device is None:
+            self.ram[address] = value
+        else:
+            device.write(address, value)
+        decoded = self.decoded
+        decoded[address] = decoded[address - 1] = decoded[address - 2] = None
+        if self.jit is not None:
+            self.jit.invalidate(address)
+
+    def store(self, address, value):
+        # ram_write() without the self-modification check
+        device = self.devices[address]
+        if device is None:
+            self.ram[address] = value
+        else:
+            device.write(address, value)
+
+    def trust(self):
+        # a program that provably never writes into its own code (with ST,
+        # the stack or a keypress) can't invalidate anything, so its RAM
+        # writes skip the invalidation
+        if not self.prove(bytes(self.ram), self.program_size, self.PC):
+            return False
+        self.ram_write = self.store
+        self.trusted = True
+        return True
+
+    def untrust(self):
+        # back to checked RAM writes. The override is deleted instead of
+        # popped from __dict__: touching __dict__ moves the attributes out
+        # of the inline storage CPython reads them from fastest, and that
+        # slows down every self.x in the run loops. Only a trusted CPU has
+        # the override: most resets find none, and checking the flag is
+        # much cheaper than raising and catching AttributeError
+        if self.trusted:
+            del self.ram_write
+            self.trusted = False
+
+    def invalidate(self, address):
+        # drop every pre-decoded instruction that could have `address` as
+        # its opcode or operand byte (negative indexes wrap around to 255)
+        decoded = self.decoded
+        decoded[address] = decoded[address - 1] = decoded[address - 2] = None
+        if self.jit is not None:
+            self.jit.invalidate(address)
+
+    def invalidate_range(self, start, end):
+        # invalidate() for every address from `start` up to `end`, with
+        # one slice assignment instead of a call per address
+        decoded = self.decoded
+        low = max(start - 2, 0)
+        decoded[low:end] = [None] * (end - low)
+        for address in range(start - 2, 0):
+            decoded[address] = None
+        if self.jit is not None:
+            for address in range(start, end):
+                self.jit.invalidate(address)
+
+    # PC, FL and the interrupt latch live in the state buffer
+    @property
+    def PC(self):
+        return self.state[PC_OFFSET]
+
+    @PC.setter
+    def PC(self, value):
+        self.state[PC_OFFSET] = value
+
+    @property
+    def FL(self):
+        return self.state[FL_OFFSET]
+
+    @FL.setter
+    def FL(self, value):
+        self.state[FL_OFFSET] = value
+
+    @property
+    def servicing_interrupt(self):
+        # interrupts are disabled until IRET
+        return self.state[IRQ_OFFSET] != 0
+
+    @servicing_interrupt.setter
+    def servicing_interrupt(self, value):
+        self.state[IRQ_OFFSET] = 1 if value else 0
+
+    def snapshot(self):
+        # copy of RAM, registers, PC, FL and the interrupt latch
+        return bytes(self.state)
+
+    def restore(self, snapshot):
+        self.state[:] = snapshot
+        self.decoded = [None] * 256
+        if self.jit is not None:
+            self.jit.flush()
+        # the snapshot may hold any program, so it isn't trusted
+        self.untrust()
+        self.bus.sync()
 
     def reset(self):
-        self.ram = [0] * 256  # RAM initialization
-        self.reg = [0] * 8  # Data register initialization
-        self.PC = 0  # Program Counter initialization
+        # RAM, registers, PC and FL are all cleared to 0
+        self.state[:] = bytes(STATE_SIZE)
         self.running = False  # Program run status initialization
-        self.FL = 0b00000000  # Comparison flag initialization
+
+        # Pre-decoded (handler, operand_a, operand_b) per RAM address
+        self.decoded = [None] * 256
+        if self.jit is not None:
+            self.jit.flush()
+
+        # back to checked RAM writes until a program is proven safe
+        self.untrust()
 
         # Interrupt property initializations
-        self.time = None  # init with datetime.now() on run to handle timer interrupt
         self.keyboard_listener = None
 
+        # {address: label} from the loaded program, if it has any
+        self.symbols = {}
+        # bytes of RAM the loaded program occupies
+        self.program_size = 0
+
+        # Headless execution state
+        self.cycles = 0
+        self.halt_reason = None
+        self.input_queue = deque()
+        self.scheduler.reset()
+        self.bus.reset()
+
         # initialize reserved registers
-        self.reg[self.IM] = 0b00000001
-        self.reg[self.IS] = 0b00000000
         self.reg[self.SP] = 0xF4
 
-    def load(self, prog_file):
-        self.reset()
-        program = []
-        with open(prog_file) as f:
-            for line in f:
-                x = line.split()
-                if len(x) == 0 or x[0][0] == "#":
-                    continue
-                try:
-                    program.append(int(x[0], 2))
-                except ValueError:
-                    print(f"Invalid value: {x[0]}")
-                    break
+    def use_ram(self, buffer):
+        # run on RAM kept somewhere else (e.g. shared with other cores):
+        # the first 256 bytes of `buffer` replace this CPU's RAM, while
+        # the registers, PC and FL stay in its own state buffer
+        self.ram = memoryview(buffer)[:RAM_SIZE]
+        self.bus = MemoryBus(self)
+        self.devices = self.bus.devices
+        self.mmu = None
+        self.decoded = [None] * 256
+        if self.jit is not None:
+            self.jit.flush()
+
+    def save_checkpoint(self, path):
+        # the whole machine to a file that load_checkpoint() resumes from
+        # (see checkpoint.py)
+        try:
+            from .checkpoint import save_checkpoint
+        except ImportError:
+            from checkpoint import save_checkpoint
+        save_checkpoint(self, path)
+
+    def load_checkpoint(self, path):
+        try:
+            from .checkpoint import load_checkpoint
+        except ImportError:
+            from checkpoint import load_checkpoint
+        load_checkpoint(self, path)
 
-        address = 0
-        for instruction in program:
-            self.ram[address] = instruction
-            address += 1
-
-    def PUSH(self, reg_index, *args):
-        value = self.reg[reg_index]
-        self.reg[self.SP] -= 1
-        self.ram_write(self.reg[self.SP], value)
-
-    def POP(self, reg_index, *args):
-        value = self.ram_read(self.reg[self.SP])
-        self.reg[self.SP] += 1
-        self.reg[reg_index] = value
-
-    def alu(self, op, reg_a=None, reg_b=None):
-        if op == "ADD":
-            self.reg[reg_a] += self.reg[reg_b]
-        elif op == "SUB":
-            self.reg[reg_a] -= self.reg[reg_b]
-        elif op == "DEC":
-            self.reg[reg_a] -= 1
-        elif op == "INC":
-            self.reg[reg_a] += 1
-        elif op == "MUL":
-            self.reg[reg_a] *= self.reg[reg_b]
-        elif op == "DIV":
-            self.reg[reg_a] /= self.reg[reg_b]
-        elif op == "MOD":
-            self.reg[reg_a] %= self.reg[reg_b]
-        elif op == "AND":
-            self.reg[reg_a] &= self.reg[reg_b]
-        elif op == "OR":
-            self.reg[reg_a] |= self.reg[reg_b]
-        elif op == "NOT":
-            # calculate bitwise not with XOR mask
-            self.reg[reg_a] ^= 0b11111111
-        elif op == "XOR":
-            self.reg[reg_a] ^= self.reg[reg_b]
-        elif op == "SHL":
-            self.reg[reg_a] <<= self.reg[reg_b]
-        elif op == "SHR":
-            self.reg[reg_a] >>= self.reg[reg_b]
-        elif op == "CMP":
-            diff = self.reg[reg_a] - self.reg[reg_b]
-            if diff < 0:
-                self.FL = 0b100
-            elif diff > 0:
-                self.FL = 0b010
-            else:
-                self.FL = 0b001
-        else:
-            raise Exception("Unsupported ALU operation")
+    def load(self, prog_file):
+        with open(prog_file, "rb") as f:
+            if f.read(len(IMAGE_MAGIC)) == IMAGE_MAGIC:
+                f.seek(0)
+                return self.load_image(f)
+
+        symbols = {}
+        banks = []
+        self.load_program(read_program(prog_file, symbols, banks))
+        self.load_banks(banks)
+        self.symbols = symbols
+
+    def load_image(self, f):
+        # read a binary .ls8b image from the open file `f`; the code is
+        # read straight into RAM without any per-byte parsing
+        header = bytearray(IMAGE_HEADER.size)
+        if f.readinto(header) != IMAGE_HEADER.size:
+            raise ValueError("Truncated image header")
+        (magic, version, entry, load_address, flags, length,
+         count) = IMAGE_HEADER.unpack(header)
+        if magic != IMAGE_MAGIC or version != IMAGE_VERSION:
+            raise ValueError(f"Unsupported image version {version}")
+        if load_address + length > RAM_SIZE:
+            raise ValueError("Image does not fit in RAM")
 
-    def HLT(self, *args):
+        self.reset()
+        if f.readinto(self.ram[load_address:load_address + length]) != length:
+            raise ValueError("Truncated image")
+        self.PC = entry
+        self.program_size = load_address + length
+        if self.verify:
+            self.trust()
+
+        table = f.read()
+        offset = 0
+        for _ in range(count):
+            address, size = table[offset], table[offset + 1]
+            name = table[offset + 2:offset + 2 + size].decode("ascii")
+            self.symbols[address] = name
+            offset += 2 + size
+
+        if flags & IMAGE_BANKED:
+            banks = []
+            (sections,) = BANK_COUNT.unpack_from(table, offset)
+            offset += BANK_COUNT.size
+            for _ in range(sections):
+                bank, address, size = BANK_SECTION.unpack_from(table, offset)
+                offset += BANK_SECTION.size
+                banks.append((bank, address, table[offset:offset + size]))
+                offset += size
+            self.load_banks(banks)
+
+    def load_banks(self, banks):
+        # (bank, address, data) sections of a banked program; the MMU is
+        # switched on with as many banks as the program needs if it's off
+        if not banks:
+            return
+        if self.mmu is None:
+            try:
+                from .mmu import MMU
+            except ImportError:
+                from mmu import MMU
+            MMU(self, banks=max(bank for bank, _, _ in banks) + 1)
+        for bank, address, data in banks:
+            self.mmu.load(bank, address, data)
+
+    def load_program(self, program):
+        # program is any sequence of byte values (list, bytes, bytearray)
+        self.reset()
+        program = bytes(program)
+        self.ram[:len(program)] = program
+        self.program_size = len(program)
+        if self.verify:
+            self.trust()
+
+    def decode(self, pc):
+        entry = (self.optable[self.ram[pc]],) + self.operands(pc)
+        self.decoded[pc] = entry
+        return entry
+
+    def operands(self, pc):
+        # register operands only decode their low 3 bits (`00000rrr`);
+        # LDI's second operand is an 8-bit immediate
+        ram = self.ram
+        a = ram[(pc + 1) & 0xFF] & 0b111
+        b = ram[(pc + 2) & 0xFF]
+        if ram[pc] != OPCODES["LDI"]:
+            b &= 0b111
+        return a, b
+
+    def invalid_opcode(self, *args):
         self.running = False
+        self.halt_reason = "invalid_opcode"
+        return args[2]
 
-    def LDI(self, reg_index, value):
-        self.reg[reg_index] = value
-
-    def LD(self, reg_a, reg_b):
-        self.reg[reg_a] = self.ram_read(self.reg[reg_b])
-
-    def ST(self, reg_a, reg_b):
-        self.ram_write(self.reg[reg_a], self.reg[reg_b])
-
-    def PRN(self, reg_index, *args):
-        print(self.reg[reg_index])
-
-    def PRA(self, reg_index, *args):
-        print(chr(self.reg[reg_index]))
+    def NOP(self, a, b, pc):
+        return (pc + 1) & 0xFF
 
-    # Jump Methods
-    def CALL(self, reg_index, *args):
-        next_index = self.PC + 2
-        self.PC = self.reg[reg_index]
-        self.reg[self.SP] -= 1
-        self.ram_write(self.reg[self.SP], next_index)
-
-    def RET(self, *args):
-        self.PC = self.ram_read(self.reg[self.SP])
-        self.reg[self.SP] += 1
-
-    def JMP(self, reg_index, *args):
-        self.PC = self.reg[reg_index]
-
-    def JNE(self, reg_index, *args):
-        test = 0b001
-        if self.FL != test:
-            self.PC = self.reg[reg_index]
+    def HLT(self, a, b, pc):
+        self.running = False
+        return pc
+
+    def LDI(self, a, b, pc):
+        self.reg[a] = b
+        return (pc + 3) & 0xFF
+
+    def LD(self, a, b, pc):
+        reg = self.reg
+        address = reg[b]
+        device = self.devices[address]
+        if device is None:
+            reg[a] = self.ram[address]
         else:
-            self.PC += 2
-
-    def JEQ(self, reg_index, *args):
-        test = 0b001
-        if self.FL & test > 0:
-            self.PC = self.reg[reg_index]
+            reg[a] = device.read(address)
+        return (pc + 3) & 0xFF
+
+    def ST(self, a, b, pc):
+        self.ram_write(self.reg[a], self.reg[b])
+        return (pc + 3) & 0xFF
+
+    def PUSH(self, a, b, pc):
+        reg = self.reg
+        reg[7] = (reg[7] - 1) & 0xFF
+        self.ram_write(reg[7], reg[a])
+        return (pc + 2) & 0xFF
+
+    def POP(self, a, b, pc):
+        reg = self.reg
+        sp = reg[7]
+        device = self.devices[sp]
+        value = self.ram[sp] if device is None else device.read(sp)
+        reg[7] = (sp + 1) & 0xFF
+        reg[a] = value
+        return (pc + 2) & 0xFF
+
+    def PRN(self, a, b, pc):
+        self.output.write(NUMBERS[self.reg[a]])
+        return (pc + 2) & 0xFF
+
+    def PRA(self, a, b, pc):
+        self.output.write(CHARACTERS[self.reg[a]])
+        return (pc + 2) & 0xFF
+
+    # ALU Methods: results wrap around to 8 bits
+    def ADD(self, a, b, pc):
+        reg = self.reg
+        reg[a] = (reg[a] + reg[b]) & 0xFF
+        return (pc + 3) & 0xFF
+
+    def SUB(self, a, b, pc):
+        reg = self.reg
+        reg[a] = (reg[a] - reg[b]) & 0xFF
+        return (pc + 3) & 0xFF
+
+    def MUL(self, a, b, pc):
+        reg = self.reg
+        reg[a] = (reg[a] * reg[b]) & 0xFF
+        return (pc + 3) & 0xFF
+
+    def DIV(self, a, b, pc):
+        reg = self.reg
+        if reg[b] == 0:
+            return self.division_by_zero(pc)
+        reg[a] //= reg[b]
+        return (pc + 3) & 0xFF
+
+    def MOD(self, a, b, pc):
+        reg = self.reg
+        if reg[b] == 0:
+            return self.division_by_zero(pc)
+        reg[a] %= reg[b]
+        return (pc + 3) & 0xFF
+
+    def division_by_zero(self, pc):
+        print("Error: division by zero", file=sys.stderr)
+        self.running = False
+        self.halt_reason = "division_by_zero"
+        return pc
+
+    def INC(self, a, b, pc):
+        reg = self.reg
+        reg[a] = (reg[a] + 1) & 0xFF
+        return (pc + 2) & 0xFF
+
+    def DEC(self, a, b, pc):
+        reg = self.reg
+        reg[a] = (reg[a] - 1) & 0xFF
+        return (pc + 2) & 0xFF
+
+    def CMP(self, a, b, pc):
+        reg = self.reg
+        diff = reg[a] - reg[b]
+        if diff < 0:
+            self.state[FL_OFFSET] = 0b100
+        elif diff > 0:
+            self.state[FL_OFFSET] = 0b010
         else:
-            self.PC += 2
+            self.state[FL_OFFSET] = 0b001
+        return (pc + 3) & 0xFF
 
-    def JGT(self, reg_index, *args):
-        test = 0b010
-        if self.FL & test > 0:
-            self.PC = self.reg[reg_index]
-        else:
-            self.PC += 2
+    def AND(self, a, b, pc):
+        self.reg[a] &= self.reg[b]
+        return (pc + 3) & 0xFF
 
-    def JGE(self, reg_index, *args):
-        test = 0b011
-        if self.FL & test > 0:
-            self.PC = self.reg[reg_index]
-        else:
-            self.PC += 2
+    def NOT(self, a, b, pc):
+        # calculate bitwise not with XOR mask
+        self.reg[a] ^= 0b11111111
+        return (pc + 2) & 0xFF
 
-    def JLT(self, reg_index, *args):
-        test = 0b100
-        if self.FL & test > 0:
-            self.PC = self.reg[reg_index]
-        else:
-            self.PC += 2
+    def OR(self, a, b, pc):
+        self.reg[a] |= self.reg[b]
+        return (pc + 3) & 0xFF
 
-    def JLE(self, reg_index, *args):
-        test = 0b101
-        if self.FL & test > 0:
-            self.PC = self.reg[reg_index]
-        else:
-            self.PC += 2
+    def XOR(self, a, b, pc):
+        self.reg[a] ^= self.reg[b]
+        return (pc + 3) & 0xFF
 
-    def INT(self, reg_index, *args):
-        # For now, I can't use this
-        pass
+    def SHL(self, a, b, pc):
+        reg = self.reg
+        reg[a] = (reg[a] << reg[b]) & 0xFF
+        return (pc + 3) & 0xFF
 
-    def IRET(self, *args):
+    def SHR(self, a, b, pc):
+        self.reg[a] >>= self.reg[b]
+        return (pc + 3) & 0xFF
+
+    # Jump Methods
+    def CALL(self, a, b, pc):
+        reg = self.reg
+        reg[7] = (reg[7] - 1) & 0xFF
+        self.ram_write(reg[7], (pc + 2) & 0xFF)
+        return reg[a]
+
+    def RET(self, a, b, pc):
+        reg = self.reg
+        sp = reg[7]
+        device = self.devices[sp]
+        pc = self.ram[sp] if device is None else device.read(sp)
+        reg[7] = (sp + 1) & 0xFF
+        return pc
+
+    def JMP(self, a, b, pc):
+        return self.reg[a]
+
+    def JEQ(self, a, b, pc):
+        if self.state[FL_OFFSET] & 0b001:
+            return self.reg[a]
+        return (pc + 2) & 0xFF
+
+    def JNE(self, a, b, pc):
+        if self.state[FL_OFFSET] & 0b001:
+            return (pc + 2) & 0xFF
+        return self.reg[a]
+
+    def JGT(self, a, b, pc):
+        if self.state[FL_OFFSET] & 0b010:
+            return self.reg[a]
+        return (pc + 2) & 0xFF
+
+    def JLT(self, a, b, pc):
+        if self.state[FL_OFFSET] & 0b100:
+            return self.reg[a]
+        return (pc + 2) & 0xFF
+
+    def JLE(self, a, b, pc):
+        if self.state[FL_OFFSET] & 0b101:
+            return self.reg[a]
+        return (pc + 2) & 0xFF
+
+    def JGE(self, a, b, pc):
+        if self.state[FL_OFFSET] & 0b011:
+            return self.reg[a]
+        return (pc + 2) & 0xFF
+
+    def INT(self, a, b, pc):
+        # For now, I can't use this
+        return (pc + 2) & 0xFF
+
+    def IRET(self, a, b, pc):
+        reg = self.reg
+        state = self.state
+        sp = reg[7]
+        if sp <= RAM_SIZE - 9 and not any(self.devices[sp:sp + 9]):
+            # the whole frame is plain RAM: pop it in one slice
+            frame = self.ram[sp:sp + 9]
+            reg[:7] = frame[6::-1]
+            state[FL_OFFSET] = frame[7]
+            reg[7] = sp + 9
+            state[IRQ_OFFSET] = 0
+            return frame[8]
+        ram_read = self.ram_read
         # pop registers 6-0 off the stack in that order
-        for i in range(7):
-            self.reg[6 - i] = self.ram_read(self.reg[self.SP])
-            self.reg[self.SP] += 1
-        self.FL = self.ram_read(self.reg[self.SP])
-        self.reg[self.SP] += 1
-        self.PC = self.ram_read(self.reg[self.SP])
-        self.reg[self.SP] += 1
+        for i in range(6, -1, -1):
+            reg[i] = ram_read(reg[7])
+            reg[7] = (reg[7] + 1) & 0xFF
+        state[FL_OFFSET] = ram_read(reg[7])
+        reg[7] = (reg[7] + 1) & 0xFF
+        pc = ram_read(reg[7])
+        reg[7] = (reg[7] + 1) & 0xFF
+        state[IRQ_OFFSET] = 0
+        return pc
 
     # Interrupt methods
-    def timer_interrupt_check(self):
-        x = datetime.now()
-        if (x - self.time).seconds >= 1:
-            self.time = x
-            self.reg[self.IS] |= 0b00000001
+    def raise_interrupt(self, number):
+        self.reg[self.IS] |= 1 << number
+
+    def key_pressed(self, value):
+        self.ram_write(0xF4, value & 255)
+        self.raise_interrupt(1)
 
     def keyboard_listener_start(self):
+        # pynput is only needed for interactive runs
+        from pynput import keyboard
+
         # keypress handler that sets the proper IS bit
         def on_press(key):
             if key == keyboard.Key.esc:
@@ -257,66 +685,190 @@ class CPU:
                 if str(key)[:4] != "Key.":
                     if (str(key)[0] == "<" and str(key)[-1] == ">"):
                         return
-                    self.reg[self.IS] |= 0b00000010
                     x = ord(str(key)[1])
-                    self.ram_write(0xf4, x & 255)
+                    # hand the key over to the run loop's thread
+                    self.scheduler.post(lambda: self.key_pressed(x))
         # keyboard listener start code
         self.keyboard_listener = keyboard.Listener(on_press=on_press)
         self.keyboard_listener.start()
 
     def keyboard_listener_stop(self):
-        self.keyboard_listener.stop()
+        if self.keyboard_listener is not None:
+            self.keyboard_listener.stop()
+
+    def feed_input(self):
+        # deliver the next queued input byte like a keypress, once the
+        # previous one has been handled
+        if self.reg[self.IS] & 0b00000010 or self.servicing_interrupt:
+            return
+        self.key_pressed(self.input_queue.popleft())
 
     # Run function subroutines
     def check_interrupt_status(self):
         # interrupt checking
-        if self.reg[self.IS] != 0:
-            masked_interrupts = self.reg[self.IM] & self.reg[self.IS]
-            cur_bit = 0
-            interrupted = False
-            while cur_bit < 8 and not interrupted:
-                interrupted = ((masked_interrupts >> cur_bit) & 1) == 1
-                if interrupted:
-                    # clear the bit
-                    self.reg[self.IS] ^= 1 << cur_bit
-                    # push PC onto stack
-                    self.reg[self.SP] -= 1
-                    self.ram_write(self.reg[self.SP], self.PC)
-                    # push FL onto stack
-                    self.reg[self.SP] -= 1
-                    self.ram_write(self.reg[self.SP], self.FL)
-                    # push R0-R6 onto stack in that order
-                    for i in range(7):
-                        self.reg[self.SP] -= 1
-                        self.ram_write(self.reg[self.SP], self.reg[i])
-                    self.PC = self.ram_read(0xF8 + cur_bit)
-                cur_bit += 1
-
-    def read_instruction(self, ir):
-        # pull out the relevant data from the IR to be processed
-        instruction_code = ir & 0b1111
-        setsPC = (ir >> 4) & 0b1
-        isALU = (ir >> 5) & 0b1
-        num_args = ir >> 6
-
-        # grab arguments from the next 2 ram registers
-        arg_a = self.ram[self.PC + 1]
-        arg_b = self.ram[self.PC + 2]
-
-        # if it's an alu function, process it through the alu
-        if isALU:
-            self.alu(self.alutable[instruction_code], arg_a, arg_b)
-        # if it's a jump function, process accordingly
-        elif setsPC:
-            self.jumptable[instruction_code](arg_a, arg_b)
+        reg = self.reg
+        state = self.state
+        if reg[self.IS] == 0 or state[IRQ_OFFSET]:
+            return
+        masked_interrupts = reg[self.IM] & reg[self.IS]
+        if not masked_interrupts:
+            return
+        # lowest pending interrupt first
+        cur_bit = (masked_interrupts & -masked_interrupts).bit_length() - 1
+        # clear the bit
+        reg[self.IS] ^= 1 << cur_bit
+        # push PC, FL and then R0-R6 onto the stack in that order
+        sp = reg[self.SP] - 9
+        if sp >= 0 and not any(self.devices[sp:sp + 9]):
+            # the whole frame is plain RAM: push it in one slice
+            ram = self.ram
+            ram[sp:sp + 7] = reg[6::-1]
+            ram[sp + 7] = state[FL_OFFSET]
+            ram[sp + 8] = state[PC_OFFSET]
+            reg[self.SP] = sp
+            if not self.trusted:
+                self.invalidate_range(sp, sp + 9)
         else:
-            # this if handles 0b00000000 non-op codes
-            if instruction_code != 0:
-                self.branchtable[instruction_code](arg_a, arg_b)
+            for value in [self.PC, self.FL] + list(reg[:7]):
+                reg[self.SP] = (reg[self.SP] - 1) & 0xFF
+                self.ram_write(reg[self.SP], value)
+        state[PC_OFFSET] = self.ram_read(0xF8 + cur_bit)
+        state[IRQ_OFFSET] = 1
+
+    def step(self):
+        # execute a single instruction at the PC
+        entry = self.decoded[self.PC] or self.decode(self.PC)
+        self.PC = entry[0](entry[1], entry[2], self.PC)
+        self.cycles += 1
+
+    def run_program(self, max_cycles=None):
+        # fetch/decode/execute until HLT, 'esc' or the cycle budget runs
+        # out, then write out any buffered output
+        try:
+            if self.loop is not None:
+                self.loop(max_cycles)
+            else:
+                self.interpret(max_cycles)
+        finally:
+            self.output.flush()
+
+    def interpret(self, max_cycles=None):
+        reg = self.reg
+        IS = self.IS
+        IM = self.IM
+        decoded = self.decoded
+        decode = self.decode
+        scheduler = self.scheduler
+        pc = self.PC
+        cycles = self.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        while self.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    self.running = False
+                    self.halt_reason = "max_cycles"
+                    break
+                # device events are due
+                self.PC = pc
+                self.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if scheduler.idle:
+                    cycles = scheduler.fast_forward(cycles, max_cycles)
+                    stop = min(scheduler.next_cycle, max_cycles)
+                    continue
+                if not self.running:
+                    break
 
-        # after a non-jump function, increment the pc
-        if not setsPC:
-            self.PC += num_args + 1
+            if reg[IS] & reg[IM]:
+                self.PC = pc
+                self.check_interrupt_status()
+                pc = self.PC
+
+            # fetch the pre-decoded instruction, decoding it on first use
+            entry = decoded[pc] or decode(pc)
+            pc = entry[0](entry[1], entry[2], pc)
+            cycles += 1
+
+        self.PC = pc
+        self.cycles = cycles
+        if self.halt_reason is None:
+            self.halt_reason = "halt"
+
+    def execute(self, image, max_cycles=None, stdin=None, stdout=None,
+                timeout=None, flush=None, stop_at_eof=False):
+        # Non-interactive run: no banner, no prompts and no keyboard
+        # listener. `image` is a path to a .ls8 file or a sequence of
+        # bytes, or None to carry on from the machine as it is (e.g.
+        # after load_checkpoint()). `stdin` (bytes, str or a binary file)
+        # is delivered to the program as keypresses, a file as fast as
+        # the program takes it; `stop_at_eof` ends the run once a file's
+        # input is all handled.
+        # Output is captured and returned unless a `stdout` file is given;
+        # `flush` is its output.FLUSH_* policy. `timeout` is a wall-clock
+        # limit in seconds, checked on the scheduler's poll interval.
+        if isinstance(image, (str, os.PathLike)):
+            self.load(image)
+        elif image is not None:
+            self.load_program(image)
+        self.halt_reason = None
+
+        stream = None
+        if isinstance(stdin, str):
+            stdin = stdin.encode()
+        elif stdin is not None and not isinstance(stdin, (bytes, bytearray)):
+            # files and pipes are streamed in chunks (see stream.py)
+            try:
+                from .stream import StreamInput
+            except ImportError:
+                from stream import StreamInput
+            stream = StreamInput(self, stdin, stop_at_eof=stop_at_eof)
+            stdin = None
+        if stdin:
+            self.input_queue.extend(stdin)
+
+        target = self.output.open(stdout, flush)
+
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+            def check_deadline(when):
+                if time.monotonic() >= deadline:
+                    self.running = False
+                    self.halt_reason = "timeout"
+
+            self.scheduler.every(self.scheduler.poll_cycles, check_deadline,
+                                 passive=True)
+
+        self.running = True
+        try:
+            if stream is not None:
+                stream.attach()
+            self.run_program(max_cycles)
+        finally:
+            if stream is not None:
+                stream.detach()
+            self.output.open(sys.stdout)
+
+        output = target.getvalue() if isinstance(target, Capture) else None
+        return self.result(output)
+
+    def result(self, output=None):
+        # ExecutionResult for the run that just stopped; running out of
+        # input and being stopped from outside (aio.Machine.stop()) end a
+        # run normally
+        if self.halt_reason in ("halt", "eof", "stopped"):
+            status = EXIT_HALT
+        elif self.halt_reason == "max_cycles":
+            status = EXIT_MAX_CYCLES
+        elif self.halt_reason == "timeout":
+            status = EXIT_TIMEOUT
+        else:
+            status = EXIT_FAULT
+        return ExecutionResult(status, self.halt_reason, self.cycles, output,
+                               list(self.reg), self.PC, self.FL)
 
     def print_help(self):
         print("*************************************\n" +
@@ -369,19 +921,11 @@ class CPU:
                     print(f"Couldn't open file {prog_name}.\n")
 
             # Initialize CPU properties for interrupts
-            self.time = datetime.now()
             self.keyboard_listener_start()
 
-            while self.running:
+            if self.running:
                 program_has_run = True
-
-                self.check_interrupt_status()
-                self.timer_interrupt_check()
-
-                # grab the IR
-                ir = self.ram[self.PC]
-                # read each instruction code then go to next loop iteration
-                self.read_instruction(ir)
+                self.run_program()
 
             # prompt user that run is complete
             if program_has_run:
@@ -0,0 +1,192 @@
+from collections import OrderedDict
+
+try:
+    from .ls8 import OPCODES, FL_OFFSET
+    from .scheduler import INF
+    from .analyze import pure_subroutine
+except ImportError:
+    from ls8 import OPCODES, FL_OFFSET
+    from scheduler import INF
+    from analyze import pure_subroutine
+
+
+CALL = OPCODES["CALL"]
+
+# Calls remembered at most
+DEFAULT_CAPACITY = 4096
+
+
+class Memoizer:
+    """
+    Memoization of pure subroutine calls.
+
+    Runs the program in its own copy of the interpreter loop that looks
+    at every CALL. If the subroutine is pure (see analyze.pure_subroutine:
+    its result depends only on the registers and FL it is called with),
+    the call is keyed on its target and the values of the registers (and
+    FL) it actually depends on; registers it only saves and restores
+    don't count. The first call with a key runs normally and its outcome
+    is recorded: R0-R4, FL, the bytes it left in its stack frame and the
+    instructions it took. Later calls with the same key skip the
+    subroutine: the outcome is written back, with saved and copied
+    registers taken from the call at hand, and the cycle count advanced
+    as if it had run. The `capacity` most recently used outcomes are
+    kept.
+
+    A call is only skipped if no device event falls due before it would
+    have returned, and an outcome is only recorded from a run that no
+    event or interrupt interrupted, so timers, input and the cycle budget
+    behave exactly as without memoization. Only programs proven not to
+    modify themselves (CPU.trusted) are memoized.
+    """
+
+    def __init__(self, cpu, capacity=DEFAULT_CAPACITY):
+        self.cpu = cpu
+        self.capacity = capacity
+        self.cache = OrderedDict()  # key -> (R0-R4, FL, frame, cycles)
+        self.subroutines = {}  # target -> Subroutine, None if not pure
+        self.image = None  # the program the above are for
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0  # instructions not executed
+
+    def attach(self):
+        self.cpu.loop = self.run
+        return self
+
+    def check_program(self):
+        # forget everything when a different program has been loaded
+        cpu = self.cpu
+        image = bytes(cpu.ram[:cpu.program_size])
+        if image != self.image:
+            self.image = image
+            self.subroutines.clear()
+            self.cache.clear()
+
+    def subroutine(self, target):
+        if target not in self.subroutines:
+            self.subroutines[target] = pure_subroutine(
+                self.image.ljust(256, b"\0"), self.cpu.program_size, target)
+        return self.subroutines[target]
+
+    @staticmethod
+    def key(target, sub, reg, fl):
+        return (target, bytes([reg[r] for r in sub.inputs]),
+                fl if sub.uses_fl else None)
+
+    @staticmethod
+    def replay(sub, outcome, reg, state, ram, sp):
+        # write a recorded outcome back for a call with stack pointer `sp`
+        registers, fl, stack, _ = outcome
+        inputs = bytes(reg)
+        reg[:5] = registers
+        for r, k in sub.copies:
+            reg[r] = inputs[k]
+        if not sub.keeps_fl:
+            state[FL_OFFSET] = fl
+        for i, slot in enumerate(sub.slots, 1):
+            if slot == "value":
+                ram[sp - 1 - i] = stack[-1 - i]
+            elif slot is not None:
+                ram[sp - 1 - i] = inputs[slot[1]]
+
+    def run(self, max_cycles=None):
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+        state = cpu.state
+        IS = cpu.IS
+        IM = cpu.IM
+        decoded = cpu.decoded
+        decode = cpu.decode
+        devices = cpu.devices
+        scheduler = cpu.scheduler
+        call = cpu.optable[CALL]
+        cache = self.cache
+        capacity = self.capacity
+        pc = cpu.PC
+        cycles = cpu.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        self.check_program()
+        memoize = cpu.trusted
+        # (key, return address, SP, cycles) of the call being recorded
+        recording = None
+
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                # an event may have changed the registers mid-call
+                recording = None
+                if scheduler.idle:
+                    cycles = scheduler.fast_forward(cycles, max_cycles)
+                    stop = min(scheduler.next_cycle, max_cycles)
+                    continue
+                if not cpu.running:
+                    break
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                servicing = cpu.servicing_interrupt
+                cpu.check_interrupt_status()
+                if cpu.servicing_interrupt and not servicing:
+                    recording = None
+                pc = cpu.PC
+
+            entry = decoded[pc] or decode(pc)
+            if entry[0] is call and memoize:
+                target = reg[entry[1]]
+                sub = self.subroutine(target)
+                sp = reg[7]
+                if sub is not None and sub.frame <= sp \
+                        and not any(devices[sp - sub.frame:sp]):
+                    key = self.key(target, sub, reg, state[FL_OFFSET])
+                    outcome = cache.get(key)
+                    if outcome is None:
+                        self.misses += 1
+                        if recording is None:
+                            recording = (key, (pc + 2) & 0xFF, sp, cycles)
+                    elif cycles + outcome[3] <= stop:
+                        count = outcome[3]
+                        self.replay(sub, outcome, reg, state, ram, sp)
+                        ram[sp - 1] = (pc + 2) & 0xFF  # return address
+                        cache.move_to_end(key)
+                        self.hits += 1
+                        self.saved += count
+                        pc = (pc + 2) & 0xFF
+                        cycles += count
+                        continue
+
+            pc = entry[0](entry[1], entry[2], pc)
+            cycles += 1
+
+            if recording is not None and pc == recording[1] \
+                    and reg[7] == recording[2]:
+                # the recorded call has returned
+                key, _, sp, started = recording
+                frame = self.subroutine(key[0]).frame
+                cache[key] = (bytes(reg[:5]), state[FL_OFFSET],
+                              bytes(ram[sp - frame:sp]), cycles - started)
+                if len(cache) > capacity:
+                    cache.popitem(last=False)
+                recording = None
+
+        cpu.PC = pc
+        cpu.cycles = cycles
+        if cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
+
+    def report(self):
+        calls = self.hits + self.misses
+        rate = self.hits / calls * 100 if calls else 0.0
+        return (f"memo: {self.hits} of {calls} pure calls skipped "
+                f"({rate:.1f}%), {self.saved} instructions saved, "
+                f"{len(self.cache)} cached\n")
@@ -0,0 +1,149 @@
+import os
+import mmap
+
+try:
+    from .bus import Device, PAGE_BITS, PAGE_SIZE
+except ImportError:
+    from bus import Device, PAGE_BITS, PAGE_SIZE
+
+
+# I/O port that selects the bank seen through the window
+BANK_SELECT = 0xF5
+
+# Addresses switched between banks: everything between the program area
+# and the I/O page, so code (below) and the I/O page and interrupt vectors
+# (above) stay put. The stack grows down into the window from 0xF4; the
+# part of it in use is never banked (see MMU)
+WINDOW_START = 0x80
+WINDOW_END = 0xF0
+
+BANK_SIZE = 256
+DEFAULT_BANKS = 16
+
+
+class MMU(Device):
+    """
+    Bank-switched memory.
+
+    `banks` banks of 256 bytes share the addresses of the window
+    (WINDOW_START-WINDOW_END by default): reads and writes there go to
+    the bank last written to the BANK_SELECT port (0xF5), at the same
+    address within the bank. Bank 0 is ordinary RAM, so a program that
+    never selects a bank sees no difference. Banks 1 and up live in one
+    bytearray, or in the file at `path` through mmap, so a dataset can be
+    kept on disk between runs. Selecting a bank only swaps the view the
+    window reads through; nothing is copied.
+
+    Instructions are always fetched from bank 0: the window is for data.
+    So is the stack: window addresses at or above the stack pointer are
+    in use by the stack and always go to bank 0, so whatever is pushed
+    before a bank switch is popped back after it.
+    """
+
+    def __init__(self, cpu, banks=DEFAULT_BANKS, path=None,
+                 window=(WINDOW_START, WINDOW_END)):
+        super().__init__(cpu)
+        start, end = window
+        if start % PAGE_SIZE or end % PAGE_SIZE or not 0 <= start < end \
+                or end > BANK_SELECT & ~(PAGE_SIZE - 1):
+            raise ValueError(f"Invalid bank window {start:#04x}-{end:#04x}")
+        if not 1 <= banks <= 256:
+            raise ValueError(f"Invalid number of banks: {banks}")
+
+        self.cpu = cpu
+        self.reg = cpu.reg
+        self.banks = banks
+        self.window = window
+        self.path = path
+
+        size = (banks - 1) * BANK_SIZE
+        self.file = None
+        if path is None:
+            self.backing = bytearray(size)
+        else:
+            # keep whatever the file already holds; grow it if needed
+            self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+            if os.fstat(self.file.fileno()).st_size < size:
+                self.file.truncate(size)
+            self.backing = mmap.mmap(self.file.fileno(), size) if size \
+                else bytearray()
+
+        backing = memoryview(self.backing)
+        self.views = [cpu.ram] + [
+            backing[bank * BANK_SIZE:(bank + 1) * BANK_SIZE]
+            for bank in range(banks - 1)]
+        self.current = cpu.ram
+
+        cpu.mmu = self
+        cpu.bus.map(start >> PAGE_BITS, self, (end - start) >> PAGE_BITS)
+        cpu.bus.io.attach(BANK_SELECT, write=self.select)
+        self.sync()
+
+    @property
+    def bank(self):
+        return self.ram[BANK_SELECT]
+
+    def select(self, bank):
+        # the port keeps the selected bank, so it is part of the machine
+        # state and survives snapshot() and restore()
+        bank %= self.banks
+        self.ram[BANK_SELECT] = bank
+        self.current = self.views[bank]
+
+    def read(self, address):
+        if address >= self.reg[7]:
+            return self.ram[address]
+        return self.current[address]
+
+    def write(self, address, value):
+        if address >= self.reg[7]:
+            self.ram[address] = value
+        else:
+            self.current[address] = value
+
+    def load(self, bank, address, data):
+        # place `data` in `bank` at `address`, whichever bank is selected
+        if not 0 <= bank < self.banks:
+            raise ValueError(f"Bank {bank} out of range (MMU has "
+                             f"{self.banks} banks)")
+        if address + len(data) > BANK_SIZE:
+            raise ValueError(f"Data does not fit in bank {bank}")
+        start, end = self.window
+        if bank and not start <= address <= address + len(data) <= end:
+            # only bank 0 is visible outside the window
+            raise ValueError(f"Bank {bank} data at {address:#04x} is "
+                             f"outside the bank window {start:#04x}-"
+                             f"{end - 1:#04x}")
+        self.views[bank][address:address + len(data)] = bytes(data)
+
+    def sync(self):
+        self.select(self.ram[BANK_SELECT])
+
+    def reset(self):
+        # in-memory banks are cleared along with RAM; a bank file is
+        # left alone, it's the dataset
+        if self.file is None:
+            self.backing[:] = bytes(len(self.backing))
+        self.sync()
+
+    def flush(self):
+        if self.file is not None:
+            self.backing.flush()
+
+    def detach(self):
+        # back to plain RAM: the window and the bank select port are
+        # unmapped and the banks closed
+        cpu = self.cpu
+        start, end = self.window
+        cpu.bus.unmap(start >> PAGE_BITS, (end - start) >> PAGE_BITS)
+        cpu.bus.io.writers.pop(BANK_SELECT, None)
+        cpu.mmu = None
+        self.close()
+
+    def close(self):
+        for view in self.views[1:]:
+            view.release()
+        if self.file is not None:
+            self.backing.close()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,162 @@
+import os
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+
+try:
+    from .ls8 import CPU, RAM_SIZE
+    from .bus import KEY_REGISTER
+except ImportError:
+    from ls8 import CPU, RAM_SIZE
+    from bus import KEY_REGISTER
+
+
+# I/O ports: the reading core's number, and a test-and-set lock
+CORE_ID = 0xF6
+LOCK = 0xF7
+
+# Stack bytes per core; core n's stack starts at 0xF4 - n * STACK_SIZE
+STACK_SIZE = 16
+
+DEFAULT_MAX_CYCLES = 10_000_000
+
+
+class SharedPorts:
+    """
+    The ports that only make sense with more than one core.
+
+    Reading CORE_ID gives the core's number (0 to cores - 1). Reading
+    LOCK is an atomic test-and-set: it returns the lock byte and, if that
+    was 0, sets it to 1 in the same step, under a lock shared by every
+    core, so exactly one of the cores that race for a free lock reads 0
+    and owns it. Writing 0 releases it (a plain store, so only the owner
+    should). A spin lock is then just:
+
+        LDI R1,LOCK
+        Acquire:
+        LD R0,R1
+        CMP R0,R2      ; R2 = 0
+        JNE R3         ; R3 = Acquire
+        ...
+        ST R1,R2       ; release
+    """
+
+    def __init__(self, cpu, core, lock):
+        self.ram = cpu.ram
+        self.core = core
+        self.lock = lock
+        cpu.bus.io.attach(CORE_ID, read=self.core_id, write=self.ignore)
+        cpu.bus.io.attach(LOCK, read=self.test_and_set)
+
+    def core_id(self):
+        return self.core
+
+    def ignore(self, value):
+        pass
+
+    def test_and_set(self):
+        with self.lock:
+            old = self.ram[LOCK]
+            # only a free lock is taken: setting a held one again could
+            # land just after its owner released it and lock everyone out
+            if old == 0:
+                self.ram[LOCK] = 1
+        return old
+
+
+def run_core(shm, core, entry, options, lock, results):
+    # body of one core's process: run on the shared RAM until this core
+    # halts
+    cpu = CPU(engine=options["engine"], timer_cycles=options["timer_cycles"])
+    cpu.use_ram(shm.buf)
+    # the other cores change RAM behind this one's back, so a loop that
+    # looks idle from here may be waiting on them
+    cpu.scheduler.detect_idle = False
+    SharedPorts(cpu, core, lock)
+    cpu.PC = entry
+    cpu.reg[cpu.SP] = KEY_REGISTER - core * options["stack_size"]
+
+    target = cpu.output.open(None)
+    cpu.running = True
+    try:
+        cpu.run_program(options["max_cycles"])
+    except Exception as e:
+        cpu.running = False
+        cpu.halt_reason = f"error: {e}"
+    results.put((core, cpu.result(target.getvalue())))
+
+
+def run_cores(program, cores=2, max_cycles=DEFAULT_MAX_CYCLES,
+              engine="interpreter", timer_cycles=None,
+              stack_size=STACK_SIZE):
+    """
+    Run `cores` LS-8 cores, each in its own process, on one shared RAM.
+
+    `program` is a path to a .ls8 or .ls8b file, or a sequence of bytes;
+    it is loaded once, and every core starts at its entry point with its
+    own registers, PC, flags and stack (STACK_SIZE bytes apart, core 0 at
+    the usual 0xF4). RAM itself is a multiprocessing.shared_memory block,
+    so a store by one core is seen by every other core's next load. Cores
+    tell themselves apart by reading the CORE_ID port and serialize with
+    the LOCK port (see SharedPorts).
+
+    Each core halts on its own. Returns (results, ram, elapsed): an
+    ExecutionResult per core, in core order, with that core's captured
+    output; the shared RAM once every core has stopped; and the wall-clock
+    seconds for the whole run.
+
+    Each core keeps its own decoded-instruction cache, which only sees
+    that core's own stores: code that one core rewrites for another isn't
+    supported, and neither is bank-switched memory.
+    """
+
+    if not 1 <= cores <= KEY_REGISTER // stack_size:
+        raise ValueError(f"Invalid number of cores: {cores}")
+
+    loader = CPU()
+    loader.verify = False
+    if isinstance(program, (str, os.PathLike)):
+        loader.load(program)
+    else:
+        loader.load_program(program)
+    if loader.mmu is not None:
+        raise ValueError("Bank-switched programs can't run on several cores")
+
+    options = {"engine": engine, "timer_cycles": timer_cycles,
+               "max_cycles": max_cycles, "stack_size": stack_size}
+    shm = shared_memory.SharedMemory(create=True, size=RAM_SIZE)
+    try:
+        shm.buf[:RAM_SIZE] = loader.ram
+        lock = multiprocessing.Lock()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=run_core,
+                args=(shm, core, loader.PC, options, lock, results))
+            for core in range(cores)]
+
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        # drain the queue before joining, so no core blocks on a full pipe
+        finished = {}
+        while len(finished) < cores:
+            try:
+                core, result = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) \
+                        and results.empty():
+                    raise RuntimeError("A core died without a result")
+                continue
+            finished[core] = result
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        ram = bytes(shm.buf[:RAM_SIZE])
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return [finished[core] for core in range(cores)], ram, elapsed
@@ -0,0 +1,127 @@
+import io
+import os
+import sys
+
+
+# Encoded PRN and PRA output for every register value
+NUMBERS = [b"%d\n" % value for value in range(256)]
+CHARACTERS = [bytes((value,)) for value in range(256)]
+
+# When buffered output is written through to the target
+FLUSH_NEWLINE = "newline"  # at the end of every line (and when full)
+FLUSH_SIZE = "size"  # only when the buffer is full
+FLUSH_HALT = "halt"  # only when the program stops (and when full)
+
+DEFAULT_BUFFER_SIZE = 8192
+
+
+class Capture:
+    """In-memory target: keeps everything written to it"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def getvalue(self):
+        # one character per byte, like chr() on the register value
+        return self.data.decode("latin-1")
+
+
+class TextTarget:
+    """Adapts a text stream without a binary buffer (e.g. io.StringIO)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        self.stream.write(data.decode("latin-1"))
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+
+def stdout_target():
+    return sys.stdout.buffer
+
+
+def file_target(path, append=False):
+    return open(path, "ab" if append else "wb")
+
+
+def pipe_target(fd):
+    # e.g. the write end of os.pipe(); OutputDevice flushes it
+    return os.fdopen(fd, "wb")
+
+
+def as_target(stream):
+    # binary streams are written to directly, text streams through their
+    # underlying buffer where they have one
+    if isinstance(stream, io.TextIOBase):
+        buffer = getattr(stream, "buffer", None)
+        if buffer is not None:
+            return buffer
+        return TextTarget(stream)
+    return stream
+
+
+class OutputDevice:
+    """
+    Buffered byte sink behind PRN and PRA.
+
+    Output collects in a bytearray and is written through to `target`
+    according to `policy`: FLUSH_NEWLINE, FLUSH_SIZE or FLUSH_HALT. The
+    buffer is also written out whenever it reaches `buffer_size` and when
+    the CPU stops. The default policy is line-by-line on a terminal and
+    buffer-sized chunks otherwise.
+    """
+
+    def __init__(self, target=None, policy=None, buffer_size=None):
+        self.buffer = bytearray()
+        self.written = 0  # bytes written so far
+        self.buffer_size = buffer_size or DEFAULT_BUFFER_SIZE
+        self.target = None
+        self.open(target, policy)
+
+    def open(self, target, policy=None):
+        # switch to a new target, writing out anything still buffered for
+        # the old one first
+        if self.target is not None:
+            self.flush()
+        self.target = as_target(target) if target is not None else Capture()
+        # text stream whose buffer we write under; flushed first so that
+        # print() output and program output stay in order
+        self.stream = target if self.target is not target else None
+        if policy is None:
+            policy = FLUSH_NEWLINE if self.target.isatty() else FLUSH_SIZE
+        if policy not in (FLUSH_NEWLINE, FLUSH_SIZE, FLUSH_HALT):
+            raise ValueError(f"Unknown flush policy: {policy}")
+        self.policy = policy
+        self.line_buffered = policy == FLUSH_NEWLINE
+        return self.target
+
+    def write(self, data):
+        buffer = self.buffer
+        buffer += data
+        self.written += len(data)
+        if (len(buffer) >= self.buffer_size
+                or self.line_buffered and b"\n" in data):
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            if self.stream is not None:
+                self.stream.flush()
+            self.target.write(self.buffer)
+            self.buffer.clear()
+        self.target.flush()
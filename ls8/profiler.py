@@ -0,0 +1,190 @@
+import time
+from bisect import bisect_right
+from collections import defaultdict
+
+try:
+    from .ls8 import OPCODES
+    from .scheduler import INF
+except ImportError:
+    from ls8 import OPCODES
+    from scheduler import INF
+
+
+# opcode byte -> mnemonic
+MNEMONICS = {opcode: name for name, opcode in OPCODES.items()}
+
+CALL = OPCODES["CALL"]
+RET = OPCODES["RET"]
+IRET = OPCODES["IRET"]
+
+
+class Profiler:
+    """
+    Instrumented copy of the interpreter loop.
+
+    Records retired instructions per opcode, a per-PC execution histogram,
+    call counts and inclusive cycles per CALL target, serviced interrupts
+    and the cycles spent under every call stack (for flame graphs). The
+    normal run loop is untouched, so profiling costs nothing when it is
+    not in use.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.opcodes = [0] * 256
+        self.pcs = [0] * 256
+        self.calls = defaultdict(int)
+        self.inclusive = defaultdict(int)
+        self.stacks = defaultdict(int)
+        self.interrupts = 0
+        self.instructions = 0
+        self.elapsed = 0.0
+        self.index_symbols()
+
+    def attach(self):
+        # route the CPU's run_program() (and so execute()) through here
+        self.cpu.loop = self.run
+        return self
+
+    def index_symbols(self):
+        # the label addresses in order, for symbolize() to bisect; the
+        # program (and its labels) is loaded after the profiler is made,
+        # so run() does this again
+        self.symbols = self.cpu.symbols
+        self.addresses = sorted(self.symbols)
+
+    def symbolize(self, address):
+        # "LABEL+offset" using the nearest label at or below `address`
+        symbols = self.symbols
+        addresses = self.addresses
+        i = bisect_right(addresses, address)
+        if i == 0:
+            return f"{address:#04x}"
+        base = addresses[i - 1]
+        if base == address:
+            return symbols[base]
+        return f"{symbols[base]}+{address - base}"
+
+    def run(self, max_cycles=None):
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+        IS = cpu.IS
+        IM = cpu.IM
+        decoded = cpu.decoded
+        decode = cpu.decode
+        scheduler = cpu.scheduler
+        opcodes = self.opcodes
+        pcs = self.pcs
+        stacks = self.stacks
+        pc = cpu.PC
+        cycles = cpu.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+        self.index_symbols()
+
+        # frames are (name, cycle entered); `key` is the collapsed stack
+        frames = [("main", cycles)]
+        key = "main"
+        started = time.perf_counter()
+        start_cycles = cycles
+
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if not cpu.running:
+                    break
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                servicing = cpu.servicing_interrupt
+                cpu.check_interrupt_status()
+                if cpu.servicing_interrupt and not servicing:
+                    self.interrupts += 1
+                    pc = cpu.PC
+                    frames.append((f"interrupt:{self.symbolize(pc)}", cycles))
+                    key = f"{key};{frames[-1][0]}"
+
+            opcode = ram[pc]
+            opcodes[opcode] += 1
+            pcs[pc] += 1
+            stacks[key] += 1
+
+            entry = decoded[pc] or decode(pc)
+            pc = entry[0](entry[1], entry[2], pc)
+            cycles += 1
+
+            if opcode == CALL and cpu.running:
+                name = self.symbolize(pc)
+                self.calls[name] += 1
+                frames.append((name, cycles))
+                key = f"{key};{name}"
+            elif (opcode == RET or opcode == IRET) and len(frames) > 1:
+                name, entered = frames.pop()
+                if opcode == RET:
+                    self.inclusive[name] += cycles - entered
+                key = key.rsplit(";", 1)[0]
+
+        # calls still open when the program stopped
+        for name, entered in frames[1:]:
+            if not name.startswith("interrupt:"):
+                self.inclusive[name] += cycles - entered
+
+        self.elapsed += time.perf_counter() - started
+        self.instructions += cycles - start_cycles
+        cpu.PC = pc
+        cpu.cycles = cycles
+        if cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
+
+    def report(self, top=10):
+        lines = []
+        ips = self.instructions / self.elapsed if self.elapsed else 0
+        lines.append(f"instructions: {self.instructions}")
+        lines.append(f"elapsed:      {self.elapsed:.6f} s")
+        lines.append(f"speed:        {ips:,.0f} instructions/s")
+        lines.append(f"interrupts:   {self.interrupts}")
+
+        lines.append("")
+        lines.append("opcode        count      %")
+        total = self.instructions or 1
+        ranked = sorted(range(256), key=lambda op: -self.opcodes[op])
+        for op in ranked:
+            count = self.opcodes[op]
+            if count == 0:
+                break
+            name = MNEMONICS.get(op, f"{op:#04x}")
+            lines.append(f"{name:<8} {count:>10} {100 * count / total:6.2f}")
+
+        lines.append("")
+        lines.append(f"hot spots (top {top})")
+        ranked = sorted(range(256), key=lambda pc: -self.pcs[pc])[:top]
+        for pc in ranked:
+            count = self.pcs[pc]
+            if count == 0:
+                break
+            name = MNEMONICS.get(self.cpu.ram[pc], "???")
+            lines.append(f"{pc:#04x} {self.symbolize(pc):<20} {name:<5} "
+                         f"{count:>10} {100 * count / total:6.2f}")
+
+        if self.calls:
+            lines.append("")
+            lines.append("call target             calls  inclusive cycles")
+            for name in sorted(self.calls, key=lambda n: -self.inclusive[n]):
+                lines.append(f"{name:<20} {self.calls[name]:>8} "
+                             f"{self.inclusive[name]:>17}")
+
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        # one "frame;frame;frame count" line per stack, as read by
+        # flamegraph.pl and speedscope
+        return "".join(f"{stack} {count}\n"
+                       for stack, count in sorted(self.stacks.items()))
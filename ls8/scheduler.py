@@ -0,0 +1,258 @@
+import heapq
+import time
+import threading
+from collections import deque
+from functools import partial
+from itertools import count
+
+
+# "never" for cycle deadlines
+INF = float("inf")
+
+# Kinds of event that pending_events() can describe and add_events()
+# re-create; anything else belongs to the run that scheduled it
+EVENT_POLL = 0
+EVENT_TIMER = 1
+EVENT_KEY = 2
+
+# Longest an idle real-time machine sleeps before looking at the wall
+# clock (and any timeout) again
+IDLE_SLEEP = 0.05
+
+
+class Scheduler:
+    """
+    Cycle-driven event queue for the devices around the CPU.
+
+    The run loop only compares its cycle counter against `next_cycle`, and
+    calls `run_due()` once it gets there. Device events (timer ticks,
+    injected keypresses, input polling) are kept in a priority queue keyed
+    by the cycle they are due at.
+
+    In real-time mode (`timer_cycles=None`) the wall clock is consulted
+    once every `poll_cycles` cycles and the timer interrupt fires once per
+    `timer_seconds` (never, if that is None). In virtual-time mode the
+    timer fires every `timer_cycles` cycles, so runs are fast and exactly
+    reproducible.
+
+    Each poll also checks whether the machine is idle: if nothing but
+    polling happened since the last poll and the whole machine state (MMU
+    banks included) and the output are unchanged, the program is stuck in
+    a side-effect-free loop that repeats (every `poll_cycles` cycles, or
+    whatever the run loop's actual distance between polls was) until a
+    device event arrives. The run loop then calls fast_forward(): in
+    virtual time that skips whole loop periods up to the next device
+    event, in real time it sleeps until the next timer tick or posted
+    keypress (or, with `idle_mode="stop"`, stops the run loop with halt
+    reason "idle" so the host can wait instead).
+    """
+
+    def __init__(self, cpu, timer_cycles=None, poll_cycles=1000,
+                 timer_seconds=1.0):
+        self.cpu = cpu
+        self.timer_cycles = timer_cycles
+        self.poll_cycles = poll_cycles
+        self.timer_seconds = timer_seconds
+
+        self.events = []
+        self.sequence = count()  # keeps same-cycle events in FIFO order
+        self.next_cycle = INF
+        self.next_tick = None  # wall-clock time of the next timer tick
+
+        # callbacks handed over from other threads (e.g. the keyboard
+        # listener), run on the next poll; `wake` cuts idle sleeps short
+        self.posted = deque()
+        self.wake = threading.Event()
+
+        # idle detection
+        self.detect_idle = True
+        self.idle_mode = "sleep"
+        self.idle = False
+        self.idle_period = None  # cycles per iteration of the idle loop
+        self.active = False  # a device event fired since the last poll
+        self.last_state = None
+        self.last_written = None
+        self.last_cycles = None
+        self.passive = set()  # polling callbacks that never change state
+
+    @property
+    def realtime(self):
+        return self.timer_cycles is None
+
+    def clear(self):
+        # drop every pending event, including the timer and polling
+        self.events.clear()
+        self.posted.clear()
+        self.passive.clear()
+        self.next_cycle = INF
+        self.idle = False
+        self.last_state = None
+
+    def reset(self):
+        self.clear()
+        self.every(self.poll_cycles, self.poll, passive=True)
+        if self.realtime:
+            self.next_tick = (time.monotonic() + self.timer_seconds
+                              if self.timer_seconds is not None else INF)
+        else:
+            self.every(self.timer_cycles, self.timer_tick)
+
+    def schedule(self, cycle, callback):
+        # callback(cycle) runs before the first instruction at or after
+        # `cycle`
+        heapq.heappush(self.events, (cycle, next(self.sequence), callback))
+        if cycle < self.next_cycle:
+            self.next_cycle = cycle
+
+    def schedule_in(self, delay, callback):
+        self.schedule(self.cpu.cycles + delay, callback)
+
+    def every(self, interval, callback, passive=False, first=None):
+        # `passive` callbacks only look at things (polling, deadlines) and
+        # don't end an idle stretch; the first call is at cycle `first`,
+        # by default `interval` cycles from now
+        def repeat(when):
+            callback(when)
+            self.schedule(when + interval, repeat)
+
+        repeat.callback = callback
+        repeat.interval = interval
+        if passive:
+            self.passive.add(repeat)
+        if first is None:
+            self.schedule_in(interval, repeat)
+        else:
+            self.schedule(first, repeat)
+
+    def run_due(self, cycles):
+        events = self.events
+        passive = self.passive
+        while events and events[0][0] <= cycles:
+            when, _, callback = heapq.heappop(events)
+            if callback not in passive:
+                self.active = True
+            callback(when)
+        self.next_cycle = events[0][0] if events else INF
+        return self.next_cycle
+
+    def post(self, callback):
+        # thread-safe: deque.append is atomic
+        self.posted.append(callback)
+        self.wake.set()
+
+    def fast_forward(self, cycles, max_cycles=INF):
+        """
+        Called by the run loop once the machine is idle. Returns the
+        cycle count to continue from.
+        """
+
+        self.idle = False
+        self.last_state = None
+
+        if self.realtime:
+            if self.idle_mode == "stop":
+                self.cpu.running = False
+                self.cpu.halt_reason = "idle"
+                return cycles
+            self.wake.clear()
+            if not self.posted:
+                timeout = min(self.next_tick - time.monotonic(), IDLE_SLEEP)
+                if timeout > 0:
+                    self.wake.wait(timeout)
+            return cycles
+
+        # skip whole loop periods, stopping short of the next event that
+        # can change the machine state (and of the cycle budget)
+        target = max_cycles
+        for when, _, callback in self.events:
+            if callback not in self.passive and when < target:
+                target = when
+        if target == INF:
+            return cycles
+        period = self.idle_period
+        skip = (target - cycles) // period * period
+        if skip <= 0:
+            return cycles
+
+        # polling keeps its phase relative to the skipped loop
+        self.events = [(when + skip if callback in self.passive else when,
+                        seq, callback)
+                       for when, seq, callback in self.events]
+        heapq.heapify(self.events)
+        self.next_cycle = self.events[0][0] if self.events else INF
+        return cycles + skip
+
+    def inject_key(self, value, cycle=None):
+        if cycle is None:
+            cycle = self.cpu.cycles
+        self.schedule(cycle, partial(self.key_event, value))
+
+    def key_event(self, value, when):
+        self.cpu.key_pressed(value)
+
+    # Saving and restoring
+    def pending_events(self):
+        # (kind, cycle, interval, value) for every pending poll, timer
+        # tick and injected key, in the order they will run
+        events = []
+        for when, _, callback in sorted(self.events, key=lambda e: e[:2]):
+            repeated = getattr(callback, "callback", None)
+            if repeated == self.poll:
+                events.append((EVENT_POLL, when, callback.interval, 0))
+            elif repeated == self.timer_tick:
+                events.append((EVENT_TIMER, when, callback.interval, 0))
+            elif isinstance(callback, partial) \
+                    and callback.func == self.key_event:
+                events.append((EVENT_KEY, when, 0, callback.args[0]))
+        return events
+
+    def add_events(self, events):
+        # schedule events described by pending_events()
+        for kind, when, interval, value in events:
+            if kind == EVENT_POLL:
+                self.every(interval, self.poll, passive=True, first=when)
+            elif kind == EVENT_TIMER:
+                self.every(interval, self.timer_tick, first=when)
+            elif kind == EVENT_KEY:
+                self.inject_key(value, when)
+            else:
+                raise ValueError(f"Unknown event kind: {kind}")
+
+    # Device events
+    def poll(self, when):
+        cpu = self.cpu
+        posted = self.posted
+        if posted or cpu.input_queue:
+            self.active = True
+        while posted:
+            posted.popleft()()
+        if cpu.input_queue:
+            cpu.feed_input()
+        if self.realtime:
+            now = time.monotonic()
+            if now >= self.next_tick:
+                self.next_tick = now + self.timer_seconds
+                self.active = True
+                cpu.raise_interrupt(0)
+        if self.detect_idle:
+            self.check_idle()
+
+    def check_idle(self):
+        cpu = self.cpu
+        state = bytes(cpu.state)
+        if cpu.mmu is not None:
+            # banks 1 and up aren't in the state buffer
+            state += cpu.mmu.backing
+        written = cpu.output.written
+        if (not self.active and state == self.last_state
+                and written == self.last_written
+                and cpu.cycles > self.last_cycles):
+            self.idle = True
+            self.idle_period = cpu.cycles - self.last_cycles
+        self.last_state = state
+        self.last_written = written
+        self.last_cycles = cpu.cycles
+        self.active = False
+
+    def timer_tick(self, when):
+        self.cpu.raise_interrupt(0)
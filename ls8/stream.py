@@ -0,0 +1,137 @@
+import os
+
+try:
+    from .ls8 import OPCODES
+except ImportError:
+    from ls8 import OPCODES
+
+
+IRET = OPCODES["IRET"]
+
+# Bytes read from the source at a time
+CHUNK_SIZE = 64 * 1024
+
+# Interrupt raised once the input is used up (vector 0xFA)
+EOF_INTERRUPT = 2
+
+KEY_INTERRUPT = 1
+KEY_PENDING = 1 << KEY_INTERRUPT
+
+
+class StreamInput:
+    """
+    Input device that feeds a whole file, pipe or buffer to the program.
+
+    Bytes arrive through the keyboard's contract: each one is written to
+    the key register at 0xF4 and raises interrupt 1. The next byte is
+    only delivered once the program has handled the last one, i.e. the
+    keyboard interrupt is no longer pending and the handler has IRET'd,
+    so 0xF4 is never overwritten under a handler that hasn't read it yet.
+    Delivery happens right in the IRET, so a program gets its next byte
+    as fast as it can take it instead of one per input poll.
+
+    `source` is a bytes-like object (used in place), a path, or a binary
+    file (e.g. sys.stdin.buffer); files are read `chunk_size` bytes at a
+    time into one reused buffer, so input of any size streams through.
+    Once the last byte has been handled, interrupt 2 (EOF_INTERRUPT,
+    vector 0xFA) is raised for programs that want to know; with
+    `stop_at_eof` the run then ends, with halt reason "eof".
+
+    attach() the device after the program is loaded: it delivers the
+    first byte straight away.
+    """
+
+    def __init__(self, cpu, source, chunk_size=CHUNK_SIZE,
+                 stop_at_eof=False):
+        self.cpu = cpu
+        self.stop_at_eof = stop_at_eof
+        self.file = None
+        self.owned = False  # the file was opened here
+        self.buffer = None
+        if isinstance(source, (str, os.PathLike)):
+            self.file = open(source, "rb")
+            self.owned = True
+        elif hasattr(source, "read"):
+            # a text stream's bytes, if it has them
+            self.file = getattr(source, "buffer", source)
+        else:
+            # one chunk: the whole buffer
+            self.chunk = memoryview(source).cast("B")
+        if self.file is not None:
+            self.buffer = bytearray(chunk_size)
+            self.chunk = memoryview(self.buffer)[:0]
+            self.readinto = getattr(self.file, "readinto1",
+                                    self.file.readinto)
+
+        self.offset = 0
+        self.delivered = 0  # bytes handed to the program
+        self.eof = False
+
+    def attach(self):
+        # deliver the next byte at the end of every IRET
+        cpu = self.cpu
+        iret = cpu.IRET
+
+        def delivering_iret(a, b, pc):
+            pc = iret(a, b, pc)
+            self.deliver()
+            return pc
+
+        cpu.IRET = delivering_iret
+        cpu.optable[IRET] = delivering_iret
+        self.flush_decoded()
+        self.deliver()
+        return self
+
+    def detach(self):
+        cpu = self.cpu
+        # deleted, not popped from __dict__ (see CPU.untrust())
+        try:
+            del cpu.IRET
+        except AttributeError:
+            pass
+        cpu.optable[IRET] = cpu.IRET
+        self.flush_decoded()
+        self.close()
+
+    def flush_decoded(self):
+        # decoded instructions hold on to the handler they were decoded
+        # with; the run loops keep a reference to the list, so clear it
+        # in place
+        cpu = self.cpu
+        cpu.decoded[:] = [None] * len(cpu.decoded)
+        if cpu.jit is not None:
+            cpu.jit.flush()
+
+    def fill(self):
+        # next chunk from the file; False at the end of the input
+        if self.file is None:
+            return False
+        count = self.readinto(self.buffer)
+        if not count:
+            self.close()
+            return False
+        self.chunk = memoryview(self.buffer)[:count]
+        self.offset = 0
+        return True
+
+    def deliver(self):
+        cpu = self.cpu
+        if self.eof or cpu.reg[cpu.IS] & KEY_PENDING \
+                or cpu.servicing_interrupt:
+            return
+        if self.offset == len(self.chunk) and not self.fill():
+            self.eof = True
+            cpu.raise_interrupt(EOF_INTERRUPT)
+            if self.stop_at_eof:
+                cpu.running = False
+                cpu.halt_reason = "eof"
+            return
+        cpu.key_pressed(self.chunk[self.offset])
+        self.offset += 1
+        self.delivered += 1
+
+    def close(self):
+        if self.owned and self.file is not None:
+            self.file.close()
+        self.file = None
@@ -0,0 +1,290 @@
+import struct
+import time
+from collections import namedtuple
+
+try:
+    from .ls8 import OPCODES, FL_OFFSET, STATE_SIZE
+    from .scheduler import INF
+except ImportError:
+    from ls8 import OPCODES, FL_OFFSET, STATE_SIZE
+    from scheduler import INF
+
+
+# opcode byte -> mnemonic
+MNEMONICS = {opcode: name for name, opcode in OPCODES.items()}
+
+ST = OPCODES["ST"]
+IRET = OPCODES["IRET"]
+
+# Instructions whose effect is a new value in register A, and the ones
+# that store to RAM (at reg[A] for ST, at the new SP for PUSH and CALL)
+REG_WRITES = {OPCODES[name] for name in (
+    "LDI", "LD", "POP", "ADD", "SUB", "MUL", "DIV", "MOD", "INC", "DEC",
+    "AND", "NOT", "OR", "XOR", "SHL", "SHR")}
+RAM_WRITES = {OPCODES[name] for name in ("ST", "PUSH", "CALL")}
+STORES = bytes(opcode in RAM_WRITES for opcode in range(256))
+
+# One record per retired instruction: cycle, PC, opcode, decoded operands,
+# register A after the instruction, RAM address that may have been stored
+# to and the value there (0 for instructions that don't store), FL
+RECORD = struct.Struct("<QBBBBBBBB")
+Record = namedtuple(
+    "Record", ["cycle", "pc", "opcode", "a", "b", "reg", "address", "value",
+               "fl"])
+
+# One record per external event: cycle, kind, value
+EVENT = struct.Struct("<QBB")
+Event = namedtuple("Event", ["cycle", "kind", "value"])
+EVENT_KEY = 0  # keypress stored at 0xF4 (value is the key)
+EVENT_IRQ = 1  # interrupt raised by a device (value is the IS bit)
+
+# Trace file: magic, version, capacity, records written, first cycle,
+# last cycle, event count; then the starting machine state, the events
+# and the ring buffer
+TRACE_MAGIC = b"LS8T"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<4sBIQQQI")
+
+DEFAULT_CAPACITY = 1 << 16
+
+
+class Tracer:
+    """
+    Execution trace recorder.
+
+    The last `capacity` instructions (a power of two) are kept as
+    fixed-size RECORDs in a preallocated ring buffer, so a long run only
+    ever costs that much memory. Keypresses and device interrupts are
+    logged separately and in full: together with the machine state at the
+    start of the run they are all that's needed to replay() the run bit
+    for bit, and the replay goes through the CPU's normal run loop at
+    full speed.
+    """
+
+    def __init__(self, cpu=None, capacity=DEFAULT_CAPACITY):
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError("Trace capacity must be a power of two")
+        self.cpu = cpu
+        self.capacity = capacity
+        self.ring = bytearray(capacity * RECORD.size)
+        self.count = 0  # records written, including overwritten ones
+        self.events = bytearray()
+        self.logged = 0  # bytes of events that belong to the last run
+        self.start_state = None
+        self.start_cycle = 0
+        self.end_cycle = 0
+        self.elapsed = 0.0
+
+    def attach(self):
+        # route run_program() through the recording loop and log the
+        # external events that replay has to reproduce
+        cpu = self.cpu
+        key_pressed = cpu.key_pressed
+        raise_interrupt = cpu.raise_interrupt
+        self.originals = (cpu.loop, key_pressed, raise_interrupt)
+        cpu.loop = self.run
+
+        def logged_key_pressed(value):
+            self.log(EVENT_KEY, value & 255)
+            key_pressed(value)
+
+        def logged_raise_interrupt(number):
+            self.log(EVENT_IRQ, number)
+            raise_interrupt(number)
+
+        cpu.key_pressed = logged_key_pressed
+        cpu.raise_interrupt = logged_raise_interrupt
+        return self
+
+    def detach(self):
+        # back to the run loop and event methods from before attach()
+        cpu = self.cpu
+        loop, key_pressed, raise_interrupt = self.originals
+        cpu.loop = loop
+        for name, original in (("key_pressed", key_pressed),
+                               ("raise_interrupt", raise_interrupt)):
+            if getattr(original, "__self__", None) is cpu:
+                # the CPU's own method: drop the override (deleted, not
+                # popped from __dict__, see CPU.untrust())
+                delattr(cpu, name)
+            else:
+                setattr(cpu, name, original)
+
+    def log(self, kind, value):
+        self.events += EVENT.pack(self.cpu.cycles, kind, value)
+
+    def run(self, max_cycles=None):
+        cpu = self.cpu
+        ram = cpu.ram
+        reg = cpu.reg
+        state = cpu.state
+        IS = cpu.IS
+        IM = cpu.IM
+        decoded = cpu.decoded
+        decode = cpu.decode
+        scheduler = cpu.scheduler
+        pack_into = RECORD.pack_into
+        stores = STORES
+        ring = self.ring
+        size = RECORD.size
+        mask = len(ring) - 1
+        FL = FL_OFFSET
+        pc = cpu.PC
+        cycles = cpu.cycles
+        if max_cycles is None:
+            max_cycles = INF
+        stop = min(scheduler.next_cycle, max_cycles)
+
+        # a trace covers one run; events logged since the last one ended
+        # (e.g. input delivered as the run is set up) are part of it
+        self.count = 0
+        del self.events[:self.logged]
+        self.start_state = cpu.snapshot()
+        self.start_cycle = cycles
+        started = time.perf_counter()
+        offset = 0
+
+        while cpu.running:
+            if cycles >= stop:
+                if cycles >= max_cycles:
+                    cpu.running = False
+                    cpu.halt_reason = "max_cycles"
+                    break
+                cpu.PC = pc
+                cpu.cycles = cycles
+                stop = min(scheduler.run_due(cycles), max_cycles)
+                if not cpu.running:
+                    break
+
+            if reg[IS] & reg[IM]:
+                cpu.PC = pc
+                cpu.check_interrupt_status()
+                pc = cpu.PC
+
+            opcode = ram[pc]
+            handler, a, b = decoded[pc] or decode(pc)
+            if opcode == IRET:
+                # streamed input is delivered by IRET itself, for the
+                # instruction after it
+                cpu.cycles = cycles + 1
+            last = pc
+            pc = handler(a, b, pc)
+
+            address = reg[a] if opcode == ST else reg[7]
+            value = ram[address] if stores[opcode] else 0
+            pack_into(ring, offset, cycles, last, opcode, a, b, reg[a],
+                      address, value, state[FL])
+            offset = (offset + size) & mask
+            cycles += 1
+
+        self.count = cycles - self.start_cycle
+        self.logged = len(self.events)
+        self.end_cycle = cycles
+        self.elapsed += time.perf_counter() - started
+        cpu.PC = pc
+        cpu.cycles = cycles
+        if cpu.halt_reason is None:
+            cpu.halt_reason = "halt"
+
+    def records(self):
+        # the retained instruction records, oldest first
+        count = min(self.count, self.capacity)
+        first = self.count - count
+        for i in range(first, self.count):
+            yield Record._make(RECORD.unpack_from(
+                self.ring, (i % self.capacity) * RECORD.size))
+
+    def event_log(self):
+        return [Event._make(fields)
+                for fields in EVENT.iter_unpack(self.events)]
+
+    def format(self, last=None):
+        # one line per instruction with its visible effect, with events
+        # interleaved where they happened
+        records = list(self.records())
+        if last is not None:
+            records = records[-last:] if last else []
+        first = records[0].cycle if records else self.end_cycle
+        events = [e for e in self.event_log() if e.cycle >= first]
+
+        lines = []
+        for record in records:
+            while events and events[0].cycle <= record.cycle:
+                lines.append(format_event(events.pop(0)))
+            lines.append(format_record(record))
+        lines.extend(format_event(event) for event in events)
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def replay(self, cpu, max_cycles=None):
+        """
+        Re-run the recorded run on `cpu` from its starting state, feeding
+        in the logged events at the cycles they originally happened.
+        """
+
+        cpu.reset()
+        cpu.restore(self.start_state)
+        cpu.cycles = self.start_cycle
+
+        # only logged events reach the CPU: no timer, polling or input
+        scheduler = cpu.scheduler
+        scheduler.clear()
+        for event in self.event_log():
+            if event.kind == EVENT_KEY:
+                scheduler.schedule(event.cycle,
+                                   lambda when, v=event.value:
+                                   cpu.ram_write(0xF4, v))
+            else:
+                scheduler.schedule(event.cycle,
+                                   lambda when, n=event.value:
+                                   cpu.raise_interrupt(n))
+
+        cpu.running = True
+        cpu.run_program(self.end_cycle if max_cycles is None else max_cycles)
+        return cpu
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(TRACE_HEADER.pack(
+                TRACE_MAGIC, TRACE_VERSION, self.capacity, self.count,
+                self.start_cycle, self.end_cycle,
+                len(self.events) // EVENT.size))
+            f.write(self.start_state)
+            f.write(self.events)
+            f.write(self.ring)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            (magic, version, capacity, count, start_cycle, end_cycle,
+             events) = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+            if magic != TRACE_MAGIC or version != TRACE_VERSION:
+                raise ValueError(f"{path} is not a version "
+                                 f"{TRACE_VERSION} LS-8 trace")
+            tracer = cls(capacity=capacity)
+            tracer.count = count
+            tracer.start_cycle = start_cycle
+            tracer.end_cycle = end_cycle
+            tracer.start_state = f.read(STATE_SIZE)
+            tracer.events = bytearray(f.read(events * EVENT.size))
+            tracer.logged = len(tracer.events)
+            f.readinto(tracer.ring)
+        return tracer
+
+
+def format_record(record):
+    name = MNEMONICS.get(record.opcode, f"{record.opcode:#04x}")
+    size = record.opcode >> 6
+    operands = ",".join(str(x) for x in (record.a, record.b)[:size])
+    line = (f"{record.cycle:>10} {record.pc:#04x}  {name:<4} {operands:<8}"
+            f" FL={record.fl:03b}")
+    if record.opcode in REG_WRITES:
+        line += f" R{record.a}={record.reg}"
+    if record.opcode in RAM_WRITES:
+        line += f" [{record.address:#04x}]={record.value}"
+    return line
+
+
+def format_event(event):
+    if event.kind == EVENT_KEY:
+        return f"{event.cycle:>10} key {event.value}"
+    return f"{event.cycle:>10} interrupt {event.value}"
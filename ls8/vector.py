@@ -0,0 +1,283 @@
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("The lockstep engine needs NumPy: pip install numpy")
+
+try:
+    from .ls8 import (OPCODES, ExecutionResult, EXIT_HALT, EXIT_MAX_CYCLES,
+                      EXIT_FAULT)
+except ImportError:
+    from ls8 import (OPCODES, ExecutionResult, EXIT_HALT, EXIT_MAX_CYCLES,
+                     EXIT_FAULT)
+
+
+# Per-lane halt reasons
+RUNNING = 0
+HALTED = 1
+INVALID_OPCODE = 2
+DIVISION_BY_ZERO = 3
+MAX_CYCLES = 4
+
+HALT_REASONS = {
+    RUNNING: None,
+    HALTED: "halt",
+    INVALID_OPCODE: "invalid_opcode",
+    DIVISION_BY_ZERO: "division_by_zero",
+    MAX_CYCLES: "max_cycles",
+}
+
+# Conditional jumps and the FL bits they test
+CONDITIONS = {
+    "JEQ": 0b001,
+    "JGT": 0b010,
+    "JLT": 0b100,
+    "JLE": 0b101,
+    "JGE": 0b011,
+}
+
+
+class VectorCPU:
+    """
+    Runs N copies of one LS-8 image in lockstep as structure-of-arrays.
+
+    `ram` is an (N, 256) uint8 array, `reg` is (N, 8), and `pc`, `fl` and
+    `cycles` are length-N vectors. Seed lanes by writing into `reg` or
+    `ram` after construction. Every step fetches each running lane's
+    opcode, groups the lanes by opcode and applies that instruction to the
+    whole group with masked array operations, so lanes whose PCs diverge
+    are still handled correctly. uint8 arithmetic gives the spec's 8-bit
+    wraparound for free.
+
+    Interrupts are not delivered: there is no timer or keyboard in
+    lockstep mode, although INT and IRET still execute.
+    """
+
+    def __init__(self, n, program):
+        program = np.frombuffer(bytes(program), dtype=np.uint8)
+        self.n = n
+        self.ram = np.zeros((n, 256), dtype=np.uint8)
+        self.ram[:, :len(program)] = program
+        self.reg = np.zeros((n, 8), dtype=np.uint8)
+        self.reg[:, 7] = 0xF4
+        self.pc = np.zeros(n, dtype=np.uint8)
+        self.fl = np.zeros(n, dtype=np.uint8)
+        self.cycles = np.zeros(n, dtype=np.int64)
+        self.status = np.zeros(n, dtype=np.int8)
+        self.output = [[] for _ in range(n)]
+
+        # flat views used for gathers and scatters
+        self.mem = self.ram.reshape(-1)
+        self.regs = self.reg.reshape(-1)
+
+        self.handlers = {}
+        for name, opcode in OPCODES.items():
+            if name in CONDITIONS:
+                self.handlers[opcode] = self.conditional(CONDITIONS[name])
+            else:
+                self.handlers[opcode] = getattr(self, name)
+
+    def step(self):
+        lanes = np.flatnonzero(self.status == RUNNING)
+        if len(lanes) == 0:
+            return 0
+
+        base = lanes << 8
+        pc = self.pc[lanes]
+        ops = self.mem[base + pc]
+        a = (self.mem[base + ((pc + 1) & 0xFF)] & 7).astype(np.intp)
+        b = self.mem[base + ((pc + 2) & 0xFF)]
+
+        # every lane on the same opcode shares one handler call
+        counts = np.bincount(ops, minlength=256)
+        unique_ops = np.flatnonzero(counts)
+        if len(unique_ops) == 1:
+            groups = [(unique_ops[0], slice(None))]
+        else:
+            groups = [(op, ops == op) for op in unique_ops]
+
+        for op, mask in groups:
+            handler = self.handlers.get(int(op), self.invalid_opcode)
+            handler(lanes[mask], a[mask], b[mask], pc[mask])
+
+        self.cycles[lanes] += 1
+        return len(lanes)
+
+    def run(self, max_cycles=None):
+        steps = 0
+        while max_cycles is None or steps < max_cycles:
+            if self.step() == 0:
+                break
+            steps += 1
+        self.status[self.status == RUNNING] = MAX_CYCLES
+
+    def results(self):
+        statuses = {HALTED: EXIT_HALT, MAX_CYCLES: EXIT_MAX_CYCLES}
+        results = []
+        for i in range(self.n):
+            status = int(self.status[i])
+            results.append(ExecutionResult(
+                statuses.get(status, EXIT_FAULT), HALT_REASONS[status],
+                int(self.cycles[i]), "".join(self.output[i]),
+                self.reg[i].tolist(), int(self.pc[i]), int(self.fl[i])))
+        return results
+
+    # Flat-index helpers: lane i's RAM starts at mem[i * 256], its
+    # registers at regs[i * 8]
+    def get(self, lanes, index):
+        return self.regs[(lanes << 3) + index]
+
+    def set(self, lanes, index, values):
+        self.regs[(lanes << 3) + index] = values
+
+    def read(self, lanes, addresses):
+        return self.mem[(lanes << 8) + addresses]
+
+    def write(self, lanes, addresses, values):
+        self.mem[(lanes << 8) + addresses] = values
+
+    def push(self, lanes, values):
+        sp = self.get(lanes, 7) - np.uint8(1)
+        self.set(lanes, 7, sp)
+        self.write(lanes, sp, values)
+
+    def pop(self, lanes):
+        sp = self.get(lanes, 7)
+        self.set(lanes, 7, sp + np.uint8(1))
+        return self.read(lanes, sp)
+
+    def advance(self, lanes, pc, size):
+        self.pc[lanes] = pc + np.uint8(size)
+
+    # Instructions: each gets the lanes running it and their operands
+    def invalid_opcode(self, lanes, a, b, pc):
+        self.status[lanes] = INVALID_OPCODE
+
+    def NOP(self, lanes, a, b, pc):
+        self.advance(lanes, pc, 1)
+
+    def HLT(self, lanes, a, b, pc):
+        self.status[lanes] = HALTED
+
+    def LDI(self, lanes, a, b, pc):
+        self.set(lanes, a, b)
+        self.advance(lanes, pc, 3)
+
+    def LD(self, lanes, a, b, pc):
+        self.set(lanes, a, self.read(lanes, self.get(lanes, b & 7)))
+        self.advance(lanes, pc, 3)
+
+    def ST(self, lanes, a, b, pc):
+        self.write(lanes, self.get(lanes, a), self.get(lanes, b & 7))
+        self.advance(lanes, pc, 3)
+
+    def PUSH(self, lanes, a, b, pc):
+        # SP is decremented before the register is read, like the CPU does
+        sp = self.get(lanes, 7) - np.uint8(1)
+        self.set(lanes, 7, sp)
+        self.write(lanes, sp, self.get(lanes, a))
+        self.advance(lanes, pc, 2)
+
+    def POP(self, lanes, a, b, pc):
+        self.set(lanes, a, self.pop(lanes))
+        self.advance(lanes, pc, 2)
+
+    def PRN(self, lanes, a, b, pc):
+        for lane, value in zip(lanes.tolist(), self.get(lanes, a).tolist()):
+            self.output[lane].append(f"{value}\n")
+        self.advance(lanes, pc, 2)
+
+    def PRA(self, lanes, a, b, pc):
+        for lane, value in zip(lanes.tolist(), self.get(lanes, a).tolist()):
+            self.output[lane].append(chr(value))
+        self.advance(lanes, pc, 2)
+
+    def alu(self, lanes, a, b, pc, operation):
+        ra = self.get(lanes, a).astype(np.int64)
+        rb = self.get(lanes, b & 7).astype(np.int64)
+        self.set(lanes, a, (operation(ra, rb) & 0xFF).astype(np.uint8))
+        self.advance(lanes, pc, 3)
+
+    def ADD(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.add)
+
+    def SUB(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.subtract)
+
+    def MUL(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.multiply)
+
+    def AND(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.bitwise_and)
+
+    def OR(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.bitwise_or)
+
+    def XOR(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.bitwise_xor)
+
+    def SHL(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.left_shift)
+
+    def SHR(self, lanes, a, b, pc):
+        self.alu(lanes, a, b, pc, np.right_shift)
+
+    def divide(self, lanes, a, b, pc, operation):
+        zero = self.get(lanes, b & 7) == 0
+        self.status[lanes[zero]] = DIVISION_BY_ZERO
+        ok = ~zero
+        self.alu(lanes[ok], a[ok], b[ok], pc[ok], operation)
+
+    def DIV(self, lanes, a, b, pc):
+        self.divide(lanes, a, b, pc, np.floor_divide)
+
+    def MOD(self, lanes, a, b, pc):
+        self.divide(lanes, a, b, pc, np.remainder)
+
+    def INC(self, lanes, a, b, pc):
+        self.set(lanes, a, self.get(lanes, a) + np.uint8(1))
+        self.advance(lanes, pc, 2)
+
+    def DEC(self, lanes, a, b, pc):
+        self.set(lanes, a, self.get(lanes, a) - np.uint8(1))
+        self.advance(lanes, pc, 2)
+
+    def NOT(self, lanes, a, b, pc):
+        self.set(lanes, a, ~self.get(lanes, a))
+        self.advance(lanes, pc, 2)
+
+    def CMP(self, lanes, a, b, pc):
+        ra = self.get(lanes, a)
+        rb = self.get(lanes, b & 7)
+        self.fl[lanes] = np.where(ra < rb, 0b100,
+                                  np.where(ra > rb, 0b010, 0b001))
+        self.advance(lanes, pc, 3)
+
+    def CALL(self, lanes, a, b, pc):
+        self.push(lanes, pc + np.uint8(2))
+        self.pc[lanes] = self.get(lanes, a)
+
+    def RET(self, lanes, a, b, pc):
+        self.pc[lanes] = self.pop(lanes)
+
+    def JMP(self, lanes, a, b, pc):
+        self.pc[lanes] = self.get(lanes, a)
+
+    def JNE(self, lanes, a, b, pc):
+        taken = (self.fl[lanes] & 0b001) == 0
+        self.pc[lanes] = np.where(taken, self.get(lanes, a), pc + np.uint8(2))
+
+    def conditional(self, bits):
+        def jump(lanes, a, b, pc):
+            taken = (self.fl[lanes] & bits) != 0
+            self.pc[lanes] = np.where(taken, self.get(lanes, a),
+                                      pc + np.uint8(2))
+        return jump
+
+    def INT(self, lanes, a, b, pc):
+        self.advance(lanes, pc, 2)
+
+    def IRET(self, lanes, a, b, pc):
+        for i in range(6, -1, -1):
+            self.set(lanes, i, self.pop(lanes))
+        self.fl[lanes] = self.pop(lanes)
+        self.pc[lanes] = self.pop(lanes)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "asm"))
+
+from asm import assemble as assemble_source  # noqa: E402
+
+
+@pytest.fixture
+def assemble(tmp_path):
+    """Assemble LS-8 source into a .ls8 file and return its path"""
+
+    def assemble(source, name="program.ls8"):
+        path = tmp_path / name
+        path.write_text(assemble_source(source).text())
+        return str(path)
+
+    return assemble
@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+from ls8.aio import Machine, run_machines
+from ls8.ls8 import CPU, EXIT_HALT
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+
+
+def test_machines_match_execute():
+    path = os.path.join(PROGRAMS, "printstr.ls8")
+
+    async def main():
+        machines = [Machine(path, slice_cycles=7) for _ in range(3)]
+        results = await run_machines(machines)
+        outputs = []
+        for machine in machines:
+            chunks = []
+            async for chunk in machine.stream():
+                chunks.append(chunk)
+            outputs.append(b"".join(chunks).decode())
+        return results, outputs
+
+    results, outputs = asyncio.run(main())
+    expected = CPU().execute(path)
+    assert outputs == [expected.output] * 3
+    assert [result._replace(output=None) for result in results] \
+        == [expected._replace(output=None)] * 3
+
+
+def test_stopped_machine_exits_normally():
+    async def main():
+        machine = Machine(os.path.join(PROGRAMS, "keyboard.ls8"),
+                          timer_cycles=1000, slice_cycles=100)
+        machine.send("hi")
+        run = asyncio.ensure_future(machine.run(max_cycles=10 ** 6))
+        await asyncio.sleep(0.05)
+        machine.stop()
+        return await run
+
+    result = asyncio.run(main())
+    assert result.halt_reason == "stopped"
+    assert result.status == EXIT_HALT
@@ -0,0 +1,58 @@
+import os
+
+from ls8.analyze import analyze
+from ls8.ls8 import CPU
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+
+
+def load(path):
+    cpu = CPU()
+    cpu.load(path)
+    return cpu, analyze(cpu.ram, cpu.program_size, cpu.PC, cpu.symbols)
+
+
+def test_safe_program_is_trusted():
+    cpu, analysis = load(os.path.join(PROGRAMS, "call.ls8"))
+    assert analysis.safe
+    assert analysis.max_depth > 0
+    assert cpu.trusted
+    assert cpu.ram_write == cpu.store
+
+
+def test_self_modifying_program_is_not_trusted(assemble):
+    cpu, analysis = load(assemble("""
+        LDI R0,Patch
+        LDI R1,1
+        ST R0,R1
+        Patch:
+        PRN R1
+        HLT
+    """))
+    assert not analysis.safe
+    assert any("self-modifying" in message
+               for _, message in analysis.issues)
+    assert not cpu.trusted
+    assert "not proven safe" in analysis.report()
+
+
+def test_stack_overflow_is_found():
+    cpu, analysis = load(os.path.join(PROGRAMS, "stackoverflow.ls8"))
+    assert not analysis.safe
+    assert "stack" in analysis.report()
+    assert not cpu.trusted
+
+
+def test_disassembly_has_labels_and_instructions(assemble):
+    _, analysis = load(assemble("""
+        LDI R0,Data
+        LD R1,R0
+        PRN R1
+        HLT
+        Data:
+        DB 0x2A
+    """))
+    text = analysis.disassemble()
+    assert "DATA:" in text
+    assert "LD R1,R0" in text
+    assert "DB 0x2a" in text
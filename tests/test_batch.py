@@ -0,0 +1,34 @@
+import io
+import json
+import os
+
+from ls8.batch import load_manifest, run_batch, run_job
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+
+
+def test_bad_jobs_get_error_records(tmp_path):
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text("\n".join(json.dumps(job) for job in [
+        {"id": "mult", "program": os.path.join(PROGRAMS, "mult.ls8")},
+        {"id": "nothing"},
+        {"id": "missing", "program": "missing.ls8"},
+    ]) + "\n")
+
+    out = io.StringIO()
+    failures = run_batch(load_manifest(manifest), workers=2, out=out,
+                         ordered=True)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert failures == 2
+    assert [record["id"] for record in records] == ["mult", "nothing",
+                                                    "missing"]
+    assert records[0]["status"] == 0 and records[0]["output"] == "72\n"
+    assert records[1]["halt_reason"] == "error"
+    assert "program" in records[1]["error"]
+    assert records[2]["halt_reason"] == "error"
+
+
+def test_job_that_is_not_an_object():
+    record = run_job(["mult.ls8"])
+    assert record["halt_reason"] == "error"
+    assert record["status"] is None
@@ -0,0 +1,55 @@
+import os
+
+from asm import build, build_all
+
+SOURCE = """
+    LDI R0,{value}
+    PRN R0
+    HLT
+"""
+
+
+def write_source(path, value):
+    path.write_text(SOURCE.format(value=value))
+    return str(path)
+
+
+def test_build_cache_hits_and_invalidation(tmp_path):
+    cache = str(tmp_path / "cache")
+    source = write_source(tmp_path / "prog.asm", 1)
+    output = str(tmp_path / "prog.ls8")
+
+    assert build(source, output, cache_dir=cache) == "built"
+    assert build(source, output, cache_dir=cache) == "unchanged"
+    os.remove(output)
+    assert build(source, output, cache_dir=cache) == "cached"
+
+    # a changed source is assembled again, the old output is replaced
+    write_source(tmp_path / "prog.asm", 2)
+    assert build(source, output, cache_dir=cache) == "built"
+    with open(output) as f:
+        assert "00000010" in f.read()
+
+    # text and binary output are cached separately
+    binary = str(tmp_path / "prog.ls8b")
+    assert build(source, binary, binary=True, cache_dir=cache) == "built"
+
+
+def test_build_without_cache(tmp_path):
+    source = write_source(tmp_path / "prog.asm", 1)
+    output = str(tmp_path / "prog.ls8")
+    assert build(source, output, cache_dir=None) == "built"
+    os.remove(output)
+    assert build(source, output, cache_dir=None) == "built"
+    assert not os.path.exists(tmp_path / "cache")
+
+
+def test_build_all_reports_each_file(tmp_path):
+    good = write_source(tmp_path / "good.asm", 3)
+    bad = tmp_path / "bad.asm"
+    bad.write_text("FROB R0\n")
+    results = build_all([good, str(bad)], str(tmp_path / "out"),
+                        cache_dir=None, workers=2)
+    assert [(name, status) for name, status, _ in results] == [
+        (good, "built"), (str(bad), "failed")]
+    assert os.path.exists(tmp_path / "out" / "good.ls8")
@@ -0,0 +1,75 @@
+from ls8.bus import PAGE_BITS, PAGE_SIZE, Device
+from ls8.ls8 import CPU
+
+
+class Counter(Device):
+    """Reads return how many times the address was written"""
+
+    def __init__(self, cpu):
+        super().__init__(cpu)
+        self.writes = {}
+
+    def read(self, address):
+        return self.writes.get(address, 0)
+
+    def write(self, address, value):
+        self.writes[address] = self.writes.get(address, 0) + 1
+
+
+PROGRAM = """
+    LDI R0,0xC1
+    LDI R1,7
+    ST R0,R1
+    ST R0,R1
+    LD R2,R0
+    PRN R2
+    LDI R0,0xB0
+    ST R0,R1
+    LD R2,R0
+    PRN R2
+    HLT
+"""
+
+
+def test_mapped_page_goes_through_its_device(assemble):
+    cpu = CPU()
+    counter = Counter(cpu)
+    cpu.bus.map(0xC0 >> PAGE_BITS, counter)
+    assert cpu.bus.device(0xC0 + PAGE_SIZE - 1) is counter
+    assert cpu.bus.device(0xC0 + PAGE_SIZE) is None
+
+    result = cpu.execute(assemble(PROGRAM))
+    # the device counted both stores, and RAM under it was never touched;
+    # plain RAM at 0xB0 holds the value stored
+    assert result.output == "2\n7\n"
+    assert counter.writes == {0xC1: 2}
+    assert cpu.ram[0xC1] == 0
+    assert cpu.ram[0xB0] == 7
+
+
+def test_unmapped_page_is_plain_ram_again(assemble):
+    cpu = CPU()
+    cpu.bus.map(0xC0 >> PAGE_BITS, Counter(cpu))
+    cpu.bus.unmap(0xC0 >> PAGE_BITS)
+    assert cpu.execute(assemble(PROGRAM)).output == "7\n7\n"
+    assert cpu.bus.mapped == [cpu.bus.io]
+
+
+def test_io_port_handlers(assemble):
+    cpu = CPU()
+    written = []
+    cpu.bus.io.attach(0xF5, read=lambda: 42, write=written.append)
+    result = cpu.execute(assemble("""
+        LDI R0,0xF5
+        LDI R1,9
+        ST R0,R1
+        LD R2,R0
+        PRN R2
+        HLT
+    """))
+    assert result.output == "42\n"
+    assert written == [9]
+    # ports without handlers are plain bytes
+    assert cpu.ram_read(0xF6) == 0
+    cpu.ram_write(0xF6, 3)
+    assert cpu.ram[0xF6] == 3
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from ls8.ls8 import CPU
+from ls8.checkpoint import checkpoint_every
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+SQUARES = os.path.join(PROGRAMS, "squares.ls8")
+
+
+@pytest.mark.parametrize("split", [1, 50, 333, 5000])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, split):
+    path = str(tmp_path / "run.ckpt")
+    full = CPU(timer_cycles=37).execute(SQUARES)
+
+    first = CPU(timer_cycles=37)
+    before = first.execute(SQUARES, max_cycles=split)
+    first.save_checkpoint(path)
+    assert not os.path.exists(path + ".tmp")
+
+    second = CPU()
+    second.load_checkpoint(path)
+    assert second.cycles == split
+    after = second.execute(None)
+    assert before.output + after.output == full.output
+    assert after._replace(output=None) == full._replace(output=None)
+
+
+def test_periodic_checkpoint(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    cpu = CPU(timer_cycles=37)
+    cpu.load(SQUARES)
+    checkpoint_every(cpu, path, 1000)
+    cpu.execute(None, max_cycles=4500)
+
+    resumed = CPU()
+    resumed.load_checkpoint(path)
+    assert resumed.cycles == 4000
+    assert resumed.execute(None).output == "172\n"
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "bad.ckpt"
+    path.write_bytes(b"LS8C\x09" + bytes(400))
+    with pytest.raises(ValueError):
+        CPU().load_checkpoint(str(path))
@@ -0,0 +1,91 @@
+import os
+
+from ls8.ls8 import CPU, EXIT_FAULT, OPCODES, STATE_SIZE
+
+PRINTSTR = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs",
+                        "printstr.ls8")
+
+
+def test_decoded_instruction_is_dropped_when_overwritten(assemble):
+    # the loop runs PRN twice; the ST in between patches the LDI's
+    # immediate, which is already in the decode cache by then
+    program = assemble("""
+        LDI R0,Patch
+        LDI R1,2
+        LDI R2,Loop
+        Loop:
+        Patch:
+        LDI R3,5
+        PRN R3
+        INC R0
+        INC R0
+        ST R0,R1
+        DEC R1
+        LDI R4,0
+        CMP R1,R4
+        JNE R2
+        HLT
+    """)
+    cpu = CPU()
+    assert cpu.execute(program).output == "5\n2\n"
+    assert not cpu.trusted
+
+
+def test_invalid_opcode_faults():
+    cpu = CPU()
+    result = cpu.execute([0b10000010, 0, 1, 0b11111111])
+    assert result.halt_reason == "invalid_opcode"
+    assert result.status == EXIT_FAULT
+    assert result.pc == 3
+
+
+def test_every_opcode_dispatches_to_its_handler():
+    cpu = CPU()
+    for name, opcode in OPCODES.items():
+        assert cpu.optable[opcode].__name__ == name
+    unused = set(range(256)) - set(OPCODES.values())
+    assert all(cpu.optable[opcode] == cpu.invalid_opcode
+               for opcode in unused)
+
+
+def test_arithmetic_wraps_to_8_bits(assemble):
+    program = assemble("""
+        LDI R0,255
+        INC R0
+        PRN R0
+        DEC R0
+        PRN R0
+        LDI R1,200
+        LDI R2,100
+        ADD R1,R2
+        PRN R1
+        LDI R1,16
+        MUL R1,R1
+        PRN R1
+        LDI R1,3
+        LDI R2,5
+        SUB R1,R2
+        PRN R1
+        HLT
+    """)
+    assert CPU().execute(program).output == "0\n255\n44\n0\n254\n"
+
+
+def test_restore_rewinds_a_run():
+    cpu = CPU()
+    cpu.load(PRINTSTR)
+    cpu.output.open(None)
+    cpu.running = True
+    cpu.run_program(20)
+    snapshot = cpu.snapshot()
+    assert len(snapshot) == STATE_SIZE
+
+    outputs = []
+    for _ in range(2):
+        cpu.restore(snapshot)
+        target = cpu.output.open(None)
+        cpu.running = True
+        cpu.halt_reason = None
+        cpu.run_program()
+        outputs.append(target.getvalue())
+    assert outputs[0] == outputs[1] == "llo, world!\n"
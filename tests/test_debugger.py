@@ -0,0 +1,92 @@
+import io
+
+from ls8.debugger import Debugger, DebugShell
+from ls8.ls8 import CPU
+
+SOURCE = """
+    LDI R0,3
+    LDI R1,Count
+    Loop:
+    ST R1,R0
+    DEC R0
+    LDI R2,0
+    CMP R0,R2
+    LDI R2,Loop
+    JNE R2
+    LDI R2,Done
+    Call:
+    CALL R2
+    HLT
+    Done:
+    PRN R0
+    RET
+    Count:
+    DB 0
+"""
+
+
+def start(path):
+    cpu = CPU()
+    debugger = Debugger(cpu).attach()
+    cpu.load(path)
+    output = io.StringIO()
+    cpu.output.open(output)
+    cpu.running = True
+    return cpu, debugger, output
+
+
+def test_breakpoint_and_step(assemble):
+    cpu, debugger, _ = start(assemble(SOURCE))
+    loop = debugger.add_breakpoint("Loop")
+    assert debugger.cont() == "breakpoint"
+    assert cpu.PC == loop and cpu.reg[0] == 3
+    # continuing from a breakpoint runs the loop once round to it again
+    assert debugger.cont() == "breakpoint"
+    assert cpu.reg[0] == 2
+    cycles = cpu.cycles
+    assert debugger.step(2) == "step"
+    assert cpu.cycles == cycles + 2
+    assert debugger.where().endswith("LDI R2,0x00")
+    debugger.remove_breakpoint("Loop")
+    assert debugger.cont() == "halt"
+
+
+def test_watchpoints_stop_after_the_change(assemble):
+    cpu, debugger, _ = start(assemble(SOURCE))
+    debugger.add_watch("Count")
+    assert debugger.cont() == "watchpoint"
+    count = debugger.address("Count")
+    assert debugger.changed == [(("ram", count), 0, 3)]
+    debugger.remove_watch("Count")
+    debugger.add_watch("R0")
+    assert debugger.cont() == "watchpoint"
+    assert debugger.changed == [(("reg", 0), 3, 2)]
+
+
+def test_next_runs_a_call_through(assemble):
+    cpu, debugger, output = start(assemble(SOURCE))
+    debugger.add_breakpoint("Call")
+    debugger.cont()
+    assert "CALL" in debugger.where()
+    assert debugger.next() == "step"
+    assert "HLT" in debugger.where()
+    cpu.output.flush()
+    assert output.getvalue() == "0\n"
+
+
+def test_shell_commands(assemble):
+    cpu, debugger, _ = start(assemble(SOURCE))
+    out = io.StringIO()
+    shell = DebugShell(debugger, stdout=out)
+    shell.onecmd("b Done")
+    shell.onecmd("c")
+    shell.onecmd("r")
+    shell.onecmd("b nowhere")
+    shell.onecmd("c")
+    text = out.getvalue()
+    done = debugger.symbolize(debugger.address("Done"))
+    assert f"breakpoint at {done}" in text
+    assert f"{done}: PRN R0" in text
+    assert "R0=  0" in text
+    assert "Unknown address or label: nowhere" in text
+    assert "program stopped: halt" in text
@@ -0,0 +1,54 @@
+import os
+
+from ls8.fuzz import Case, Fuzzer
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+
+
+def test_finds_stack_overflow():
+    fuzzer = Fuzzer(os.path.join(PROGRAMS, "stackoverflow.ls8"), seed=1)
+    faults = fuzzer.fuzz(executions=20)
+    assert {fault.kind for fault in faults} == {"stack_overflow"}
+
+
+def test_clean_program_has_no_faults():
+    fuzzer = Fuzzer(os.path.join(PROGRAMS, "keyboard.ls8"), seed=1,
+                    max_cycles=500)
+    assert fuzzer.fuzz(executions=300) == []
+    assert fuzzer.edges > 0
+
+
+def test_same_seed_same_session():
+    sessions = []
+    for _ in range(2):
+        fuzzer = Fuzzer(os.path.join(PROGRAMS, "printstr.ls8"), seed=7,
+                        max_cycles=500)
+        fuzzer.fuzz(executions=200)
+        sessions.append((fuzzer.corpus, fuzzer.edges))
+    assert sessions[0] == sessions[1]
+
+
+def test_case_does_not_depend_on_the_last_one(assemble):
+    # with R0 set the program writes a HLT above itself and jumps to it,
+    # without it the jump lands on the NOPs there and loops
+    program = assemble("""
+        LDI R1,0x80
+        LDI R2,0
+        CMP R0,R2
+        LDI R3,Skip
+        JEQ R3
+        LDI R2,1
+        ST R1,R2
+        Skip:
+        JMP R1
+    """)
+    writes = Case(bytes([1, 0, 0, 0, 0, 0, 0]), b"")
+    loops = Case(bytes(7), b"")
+
+    fuzzer = Fuzzer(program, max_cycles=1000)
+    fresh = fuzzer.execute(loops)[:2]
+    assert fresh[0] == "max_cycles"
+
+    fuzzer = Fuzzer(program, max_cycles=1000)
+    assert fuzzer.execute(writes)[:2] == ("halt", 0x80)
+    assert fuzzer.execute(loops)[:2] == fresh
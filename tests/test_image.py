@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from asm import assemble as assemble_source
+from ls8.ls8 import CPU
+
+SOURCES = os.path.join(os.path.dirname(__file__), "..", "asm")
+
+
+def write(path, data):
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(path, mode) as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("name", sorted(
+    name for name in os.listdir(SOURCES)
+    if name.endswith(".asm") and name != "cores.asm"))
+def test_binary_image_runs_like_text(name, tmp_path):
+    with open(os.path.join(SOURCES, name)) as f:
+        image = assemble_source(f.read())
+    text = write(tmp_path / "program.ls8", image.text())
+    binary = write(tmp_path / "program.ls8b", image.binary())
+
+    from_text, from_binary = CPU(timer_cycles=50), CPU(timer_cycles=50)
+    assert from_binary.execute(binary, max_cycles=5000, stdin=b"hi") == \
+        from_text.execute(text, max_cycles=5000, stdin=b"hi")
+    assert from_binary.symbols == from_text.symbols
+    assert from_binary.program_size == from_text.program_size
+
+
+def test_banked_image_round_trip(tmp_path):
+    image = assemble_source("""
+        LDI R0,0xF5
+        LDI R1,2
+        ST R0,R1
+        LDI R0,0x90
+        LD R1,R0
+        PRN R1
+        HLT
+    BANK 2,0x90
+        DB 99
+    """)
+    binary = write(tmp_path / "banked.ls8b", image.binary())
+    assert CPU().execute(binary).output == "99\n"
+
+
+def test_truncated_image(tmp_path):
+    data = assemble_source("LDI R0,1\nHLT").binary()
+    binary = write(tmp_path / "short.ls8b", data[:6])
+    with pytest.raises(ValueError):
+        CPU().load(binary)
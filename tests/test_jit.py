@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from ls8.ls8 import CPU
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+
+
+def run(engine, program, **kwargs):
+    cpu = CPU(engine=engine, timer_cycles=37)
+    return cpu.execute(program, max_cycles=20_000, **kwargs)
+
+
+@pytest.mark.parametrize("name", sorted(
+    name for name in os.listdir(PROGRAMS) if name != "cores.ls8"))
+def test_jit_matches_interpreter(name):
+    path = os.path.join(PROGRAMS, name)
+    assert run("jit", path, stdin=b"hello") == \
+        run("interpreter", path, stdin=b"hello")
+
+
+def test_jit_follows_self_modifying_code(assemble):
+    program = assemble("""
+        LDI R0,Patch
+        LDI R1,7
+        ST R0,R1
+        LDI R2,0
+        Patch:
+        LDI R3,1
+        PRN R3
+        HLT
+    """)
+    assert run("jit", program) == run("interpreter", program)
+
+
+def test_jit_stops_at_the_faulting_instruction(assemble):
+    program = assemble("""
+        LDI R0,10
+        LDI R1,0
+        DIV R0,R1
+        HLT
+    """)
+    jit = run("jit", program)
+    assert jit.halt_reason == "division_by_zero"
+    assert jit.pc == 6
+    assert jit == run("interpreter", program)
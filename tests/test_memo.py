@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from ls8.__main__ import main
+from ls8.ls8 import CPU
+from ls8.memo import Memoizer
+
+SQUARES = os.path.join(os.path.dirname(__file__), "..", "asm", "squares.asm")
+
+
+@pytest.fixture
+def squares(assemble):
+    with open(SQUARES) as f:
+        return assemble(f.read(), "squares.ls8")
+
+
+@pytest.mark.parametrize("timer_cycles", [None, 97])
+def test_memoized_run_matches_plain_run(squares, timer_cycles):
+    plain = CPU(timer_cycles=timer_cycles).execute(squares)
+    cpu = CPU(timer_cycles=timer_cycles)
+    memo = Memoizer(cpu).attach()
+    memoized = cpu.execute(squares)
+    assert memoized == plain
+    assert memo.hits > 0
+    assert memo.saved > 0
+
+
+@pytest.mark.parametrize("flags", [
+    ["--engine", "jit", "--memoize"],
+    ["--engine", "jit", "--timing"],
+    ["--memoize", "--mhz", "1"],
+])
+def test_run_rejects_conflicting_loops(squares, flags, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["run", squares] + flags)
+    assert e.value.code == 2
+    assert "can't be used with" in capsys.readouterr().err
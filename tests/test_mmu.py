@@ -0,0 +1,162 @@
+import pytest
+
+from asm import assemble as assemble_source
+from ls8.ls8 import CPU
+from ls8.batch import run_job
+from ls8.mmu import MMU
+
+
+def test_banked_program_reads_its_bank(assemble):
+    program = assemble("""
+        LDI R4,0xF5
+        LDI R3,2
+        ST R4,R3
+        LDI R0,0x80
+        LD R1,R0
+        PRN R1
+        LDI R3,0
+        ST R4,R3
+        LD R1,R0
+        PRN R1
+        HLT
+    BANK 2
+        DB 10
+    """)
+    cpu = CPU()
+    result = cpu.execute(program)
+    assert result.output == "10\n0\n"
+    assert cpu.mmu.banks == 3
+
+
+def test_bank_select_is_part_of_snapshot():
+    cpu = CPU()
+    mmu = MMU(cpu, banks=4)
+    mmu.load(3, 0x80, b"\x2a")
+    mmu.select(3)
+    snapshot = cpu.snapshot()
+    mmu.select(0)
+    cpu.restore(snapshot)
+    assert cpu.ram_read(0x80) == 0x2a
+
+
+def test_push_survives_a_bank_switch(assemble):
+    # CALL and four pushes take the stack from 0xF4 down to 0xEF, inside
+    # the bank window; the subroutine switches banks before popping
+    program = assemble("""
+        LDI R1,11
+        LDI R2,22
+        LDI R3,33
+        LDI R4,44
+        LDI R0,Sub
+        CALL R0
+        PRN R1
+        PRN R2
+        PRN R3
+        PRN R4
+        HLT
+        Sub:
+        PUSH R1
+        PUSH R2
+        PUSH R3
+        PUSH R4
+        LDI R0,0xF5
+        LDI R1,1
+        ST R0,R1
+        POP R4
+        POP R3
+        POP R2
+        POP R1
+        RET
+    BANK 1
+        DB 7
+    """)
+    assert CPU().execute(program).output == "11\n22\n33\n44\n"
+
+
+def test_bank_writes_are_not_idle(assemble):
+    # the loop only changes a byte in bank 1: idle detection must not
+    # skip it
+    program = assemble("""
+        NOP
+        LDI R0,0xF8
+        LDI R1,Tick
+        ST R0,R1
+        LDI R0,0xF5
+        LDI R1,1
+        ST R0,R1
+        LDI R1,0x80
+        LDI R2,Loop
+        LDI R5,1
+        Loop:
+        LD R0,R1
+        INC R0
+        ST R1,R0
+        LDI R0,0
+        JMP R2
+        Tick:
+        LD R0,R1
+        PRN R0
+        HLT
+    BANK 1
+        DB 0
+    """)
+    outputs = []
+    for detect_idle in (True, False):
+        cpu = CPU(timer_cycles=5000)
+        cpu.scheduler.detect_idle = detect_idle
+        outputs.append(cpu.execute(program).output)
+    assert outputs == ["230\n", "230\n"]
+
+
+def test_batch_jobs_load_banks(assemble):
+    banked = assemble("""
+        LDI R4,0xF5
+        LDI R3,3
+        ST R4,R3
+        LDI R0,0x80
+        LD R1,R0
+        PRN R1
+        HLT
+    BANK 3
+        DB 42
+    """, "banked.ls8")
+    plain = assemble("""
+        LDI R0,0x80
+        LD R1,R0
+        PRN R1
+        HLT
+    """, "plain.ls8")
+    # the same worker CPU runs both, in turn
+    records = [run_job({"id": i, "program": program})
+               for i, program in enumerate([banked, plain, banked])]
+    assert [record["output"] for record in records] == \
+        ["42\n", "0\n", "42\n"]
+
+
+@pytest.mark.parametrize("source", [
+    "HLT\nBANK 1,0x10\nDB 1",
+    "HLT\nBANK 1,0xF0\nDB 1",
+    "HLT\nBANK 1,0xEF\nDB 1\nDB 2",
+])
+def test_bank_sections_outside_the_window_are_rejected(source, capsys):
+    with pytest.raises(SystemExit):
+        assemble_source(source)
+    assert "bank window" in capsys.readouterr().err
+
+
+def test_mmu_load_outside_the_window():
+    cpu = CPU()
+    mmu = MMU(cpu, banks=2)
+    mmu.load(1, 0xEE, b"\x01\x02")
+    with pytest.raises(ValueError, match="bank window"):
+        mmu.load(1, 0x10, b"\x01")
+    with pytest.raises(ValueError, match="bank window"):
+        mmu.load(1, 0xEF, b"\x01\x02")
+    mmu.close()
+
+
+def test_binary_image_symbol_out_of_range(capsys):
+    image = assemble_source('DS ' + "x" * 300 + "\nEnd:\nHLT")
+    with pytest.raises(SystemExit):
+        image.binary()
+    assert "symbol END" in capsys.readouterr().err
@@ -0,0 +1,41 @@
+import os
+import threading
+
+import pytest
+
+from ls8.ls8 import CPU
+from ls8.multicore import CORE_ID, LOCK, SharedPorts, run_cores
+
+CORES = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs",
+                     "cores.ls8")
+
+
+def test_test_and_set_port():
+    cpu = CPU()
+    SharedPorts(cpu, 2, threading.Lock())
+    assert cpu.ram_read(CORE_ID) == 2
+    # the first read takes the free lock, the next ones find it held
+    assert cpu.ram_read(LOCK) == 0
+    assert cpu.ram_read(LOCK) == 1
+    assert cpu.ram[LOCK] == 1
+    cpu.ram_write(LOCK, 0)
+    assert cpu.ram_read(LOCK) == 0
+
+
+def test_cores_share_ram_under_the_lock():
+    cpu = CPU()
+    cpu.load(CORES)
+    counter = {name: address
+               for address, name in cpu.symbols.items()}["COUNTER"]
+
+    results, ram, _ = run_cores(CORES, cores=3, max_cycles=1_000_000)
+    assert [result.halt_reason for result in results] == ["halt"] * 3
+    assert [result.output for result in results] == ["0\n", "1\n", "2\n"]
+    # no increment was lost, and the lock was left free
+    assert ram[counter] == 150
+    assert ram[LOCK] == 0
+
+
+def test_invalid_core_count():
+    with pytest.raises(ValueError, match="Invalid number of cores"):
+        run_cores(CORES, cores=0)
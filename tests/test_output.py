@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+from ls8.ls8 import CPU
+from ls8.output import (OutputDevice, FLUSH_NEWLINE, FLUSH_SIZE,
+                        FLUSH_HALT)
+
+
+class Recorder:
+    """Target that keeps every write separately"""
+
+    def __init__(self, tty=False):
+        self.writes = []
+        self.tty = tty
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+
+def feed(device, *chunks):
+    for chunk in chunks:
+        device.write(chunk)
+    device.flush()
+
+
+@pytest.mark.parametrize("policy, writes", [
+    (FLUSH_NEWLINE, [b"ab\n", b"cd\n", b"e"]),
+    (FLUSH_SIZE, [b"ab\ncd", b"\ne"]),
+    (FLUSH_HALT, [b"ab\ncd", b"\ne"]),
+])
+def test_flush_policies(policy, writes):
+    target = Recorder()
+    device = OutputDevice(target, policy, buffer_size=5)
+    feed(device, b"a", b"b", b"\n", b"c", b"d", b"\n", b"e")
+    assert target.writes == writes
+    assert device.written == 7
+
+
+def test_default_policy_follows_the_terminal():
+    assert OutputDevice(Recorder(tty=True)).policy == FLUSH_NEWLINE
+    assert OutputDevice(Recorder()).policy == FLUSH_SIZE
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        OutputDevice(Recorder(), "sometimes")
+
+
+def test_program_output_to_binary_and_text_files(assemble):
+    program = assemble("""
+        LDI R0,72
+        PRA R0
+        LDI R0,105
+        PRA R0
+        PRN R0
+        HLT
+    """)
+    binary = io.BytesIO()
+    assert CPU().execute(program, stdout=binary).output is None
+    assert binary.getvalue() == b"Hi105\n"
+
+    text = io.StringIO()
+    CPU().execute(program, stdout=text, flush=FLUSH_HALT)
+    assert text.getvalue() == "Hi105\n"
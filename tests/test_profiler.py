@@ -0,0 +1,29 @@
+from ls8.ls8 import CPU
+from ls8.profiler import Profiler
+
+
+def test_calls_are_counted_by_label(assemble):
+    program = assemble("""
+        LDI R1,Sub
+        LDI R2,3
+        LDI R3,0
+        LDI R4,Loop
+        Loop:
+        CALL R1
+        DEC R2
+        CMP R2,R3
+        JNE R4
+        HLT
+        Sub:
+        INC R0
+        RET
+    """)
+    cpu = CPU()
+    profiler = Profiler(cpu).attach()
+    result = cpu.execute(program)
+    assert result.halt_reason == "halt"
+    assert dict(profiler.calls) == {"SUB": 3}
+    assert profiler.inclusive["SUB"] == 6
+    sub = {name: address for address, name in cpu.symbols.items()}["SUB"]
+    assert profiler.symbolize(sub + 1) == "SUB+1"
+    assert profiler.instructions == result.cycles
@@ -0,0 +1,42 @@
+import io
+import os
+
+from ls8.ls8 import CPU
+from ls8.stream import StreamInput
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+KEYBOARD = os.path.join(PROGRAMS, "keyboard.ls8")
+
+
+def test_streamed_input_is_echoed_in_full():
+    data = bytes(range(32, 127)) * 20
+    cpu = CPU()
+    result = cpu.execute(KEYBOARD, stdin=io.BytesIO(data), stop_at_eof=True)
+    assert result.halt_reason == "eof"
+    assert result.output == data.decode("latin-1")
+
+
+def test_input_bigger_than_a_chunk():
+    data = b"0123456789" * 10
+    cpu = CPU()
+    cpu.load(KEYBOARD)
+    stream = StreamInput(cpu, io.BytesIO(data), chunk_size=7,
+                         stop_at_eof=True)
+    target = cpu.output.open(None)
+    cpu.running = True
+    stream.attach()
+    try:
+        cpu.run_program()
+    finally:
+        stream.detach()
+    assert target.getvalue() == data.decode()
+    assert stream.delivered == len(data)
+
+
+def test_input_from_a_file(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"from a file")
+    cpu = CPU()
+    with open(path, "rb") as f:
+        result = cpu.execute(KEYBOARD, stdin=f, stop_at_eof=True)
+    assert result.output == "from a file"
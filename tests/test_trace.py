@@ -0,0 +1,70 @@
+import io
+import os
+
+import pytest
+
+from ls8.ls8 import CPU
+from ls8.trace import Tracer, EVENT_KEY
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+KEYBOARD = os.path.join(PROGRAMS, "keyboard.ls8")
+
+
+def test_streamed_input_replays():
+    cpu = CPU()
+    tracer = Tracer(cpu).attach()
+    result = cpu.execute(KEYBOARD, stdin=io.BytesIO(b"hello"),
+                         stop_at_eof=True)
+    assert result.output == "hello"
+    keys = [event for event in tracer.event_log() if event.kind == EVENT_KEY]
+    assert bytes(event.value for event in keys) == b"hello"
+    # each key after the first is stamped with the cycle it arrived in
+    assert keys[0].cycle == 0
+    assert all(a.cycle < b.cycle for a, b in zip(keys, keys[1:]))
+
+    replay = CPU()
+    check = Tracer(replay).attach()
+    target = replay.output.open(None)
+    tracer.replay(replay)
+    assert target.getvalue() == "hello"
+    assert check.count == tracer.count
+    assert check.ring == tracer.ring
+
+
+def test_trace_command_streams_input(tmp_path, capsys):
+    from ls8.__main__ import main
+
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"hello")
+    saved = str(tmp_path / "run.trace")
+    assert main(["trace", KEYBOARD, "--input", str(path), "--max-cycles",
+                 "2000", "--save", saved]) == 1
+    assert capsys.readouterr().out == "hello"
+    keys = [event for event in Tracer.load(saved).event_log()
+            if event.kind == EVENT_KEY]
+    assert bytes(event.value for event in keys) == b"hello"
+    assert main(["replay", saved, "--verify"]) == 0
+
+
+def test_capacity_must_be_a_positive_power_of_two():
+    for capacity in (0, -4, 3):
+        with pytest.raises(ValueError):
+            Tracer(CPU(), capacity=capacity)
+
+
+def test_detach_stops_logging():
+    cpu = CPU(engine="jit")
+    jit_loop = cpu.loop
+    first = Tracer(cpu).attach()
+    cpu.execute(KEYBOARD, stdin=io.BytesIO(b"ab"), stop_at_eof=True)
+    first.detach()
+    assert cpu.loop is jit_loop
+    logged = bytes(first.events)
+
+    second = Tracer(cpu).attach()
+    cpu.execute(KEYBOARD, stdin=io.BytesIO(b"cd"), stop_at_eof=True)
+    second.detach()
+    assert bytes(first.events) == logged
+    keys = [event.value for event in second.event_log()
+            if event.kind == EVENT_KEY]
+    assert bytes(keys) == b"cd"
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from ls8.ls8 import CPU, read_program
+
+np = pytest.importorskip("numpy")
+from ls8.vector import VectorCPU  # noqa: E402
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), "..", "ls8", "programs")
+
+
+@pytest.mark.parametrize("name", ["mult", "printstr", "stack", "call",
+                                  "sctest"])
+def test_lanes_match_the_interpreter(name):
+    path = os.path.join(PROGRAMS, f"{name}.ls8")
+    expected = CPU().execute(path)
+    vector = VectorCPU(3, read_program(path))
+    vector.run(max_cycles=10_000)
+    assert vector.results() == [expected] * 3
+
+
+def test_lanes_diverge_on_their_own_inputs(assemble):
+    # counts R0 down to 0, printing each value
+    program = assemble("""
+        LDI R1,0
+        LDI R2,Loop
+        Loop:
+        PRN R0
+        DEC R0
+        CMP R0,R1
+        JNE R2
+        HLT
+    """)
+    vector = VectorCPU(3, read_program(program))
+    vector.reg[:, 0] = [1, 3, 2]
+    vector.run()
+    results = vector.results()
+    assert [result.output for result in results] == [
+        "1\n", "3\n2\n1\n", "2\n1\n"]
+    assert [result.cycles for result in results] == [7, 15, 11]
+    assert all(result.halt_reason == "halt" for result in results)